@@ -8,9 +8,17 @@ import numpy as np
 from datetime import datetime, timedelta
 from qqe_trend_strategy import qqe_trend_strategy
 from index_trend_filter import IndexTrendFilter
+from bar_store import BarStore
+from metrics import column, drawdown_stats, equity_metrics, trade_metrics, format_exit_reasons
+from trade_db import record_backtest_results
 import argparse
 import time
 import random
+import copy
+import hashlib
+import json
+import pickle
+import shutil
 
 
 class PortfolioBacktester:
@@ -20,7 +28,8 @@ class PortfolioBacktester:
                  pyramid_enabled=False, strict_mode=True, use_index_filter=False, 
                  index_filter_mode='moderate', index_min_strength=60,
                  use_atr_stop=False, atr_multiplier=2.0,
-                 use_drawdown_exit=False, drawdown_threshold=0.08, min_profit_for_drawdown=0.05):
+                 use_drawdown_exit=False, drawdown_threshold=0.08, min_profit_for_drawdown=0.05,
+                 use_sector_filter=False, sector_min_members=3):
         self.initial_capital = initial_capital
         self.cash = initial_capital
         self.max_stocks = max_stocks
@@ -40,6 +49,10 @@ class PortfolioBacktester:
         self.index_min_strength = index_min_strength
         self.index_filter = IndexTrendFilter() if use_index_filter else None
         
+        # 🆕 行业板块过滤：个股按所属行业的等权合成指数判断趋势（需同时启用指数过滤）
+        self.use_sector_filter = use_sector_filter
+        self.sector_min_members = sector_min_members
+        
         # 🆕 ATR动态止损参数
         self.use_atr_stop = use_atr_stop  # 是否使用ATR止损
         self.atr_multiplier = atr_multiplier  # ATR倍数，默认2倍
@@ -118,58 +131,118 @@ class PortfolioBacktester:
             
         return self.equity_curve, self.trades
 
+    def prepare_sector_filter(self, market_data_cache):
+        """
+        启用行业板块过滤时，用回测股票池的K线一次性构建全部行业合成指数
+        
+        Returns:
+            int: 使用行业指数过滤的股票数量
+        """
+        if self.index_filter is None or not self.use_sector_filter:
+            return 0
+        stock_panel = {code: item['data'] for code, item in market_data_cache.items()}
+        count = self.index_filter.enable_sector_filter(stock_panel, min_members=self.sector_min_members)
+        print(f"行业板块过滤: {count}/{len(stock_panel)} 只股票使用行业合成指数，"
+              f"共 {len(set(self.index_filter.sector_map.values()))} 个行业")
+        return count
+
     def run_with_cache(self, market_data_cache, min_quality=60):
         """
         使用预缓存的数据执行组合回测
         """
+        self.prepare_sector_filter(market_data_cache)
+        
         # 1. 转换数据格式
+        market_data, sorted_dates, total_buy_signals = self.build_market_data(
+            market_data_cache, strict_mode=self.strict_mode
+        )
+        signal_col = 'buy_signal_strict' if self.strict_mode else 'buy_signal'
+        
+        print(f"DEBUG: 数据转换完成，共发现 {total_buy_signals} 个原始买入信号 (严格模式: {self.strict_mode}, 信号列: {signal_col})")
+        
+        if total_buy_signals == 0:
+            print("警告: 没有任何股票产生买入信号，请检查策略逻辑或严格模式设置！")
+        
+        # 2. 按日时间步进
+        return self.run_on_market_data(market_data, sorted_dates, min_quality)
+
+    @staticmethod
+    def build_market_data(market_data_cache, strict_mode=True):
+        """
+        将预缓存的策略结果转换为按日索引的行情字典
+        
+        转换结果只依赖于 strict_mode，不会被回测过程修改，
+        因此可以在多组引擎参数之间共享（参数优化时避免重复转换）。
+        
+        Args:
+            market_data_cache: {code: {'name': str, 'data': DataFrame}}
+            strict_mode: 是否使用严格模式信号列与质量分
+            
+        Returns:
+            tuple: (market_data, sorted_dates, total_buy_signals)
+                market_data: {date_str: {code: {open, high, low, close, buy_signal, ...}}}
+        """
         market_data = {} 
         all_dates = set()
         
-        signal_col = 'buy_signal_strict' if self.strict_mode else 'buy_signal'
+        signal_col = 'buy_signal_strict' if strict_mode else 'buy_signal'
         
         total_buy_signals = 0 # 调试统计
         
         for code, item in market_data_cache.items():
             name = item['name']
             result = item['data']
+            n = len(result)
+            
+            date_strs = result.index.strftime('%Y-%m-%d')
+            opens = result['open'].to_numpy()
+            highs = result['high'].to_numpy()
+            lows = result['low'].to_numpy()
+            closes = result['close'].to_numpy()
+            # 检查是否包含必需列
+            buy_flags = result[signal_col].to_numpy() if signal_col in result.columns else np.zeros(n, dtype=bool)
+            sell_flags = result['sell_signal'].to_numpy() if 'sell_signal' in result.columns else np.zeros(n, dtype=bool)
+            if strict_mode and 'signal_quality' in result.columns:
+                qualities = result['signal_quality'].to_numpy()
+            else:
+                qualities = [0] * n
+            atrs = result['atr'].to_numpy() if 'atr' in result.columns else [0] * n
             
-            for date, row in result.iterrows():
-                d_str = date.strftime('%Y-%m-%d')
+            for i in range(n):
+                d_str = date_strs[i]
                 all_dates.add(d_str)
                 
                 if d_str not in market_data:
                     market_data[d_str] = {}
                 
-                # 检查是否包含必需列
-                has_signal = False
-                if signal_col in row:
-                    has_signal = bool(row[signal_col])
-                
+                has_signal = bool(buy_flags[i])
                 if has_signal:
                     total_buy_signals += 1
                 
                 market_data[d_str][code] = {
                     'name': name,
-                    'open': row['open'],
-                    'high': row['high'],
-                    'low': row['low'],
-                    'close': row['close'],
+                    'open': opens[i],
+                    'high': highs[i],
+                    'low': lows[i],
+                    'close': closes[i],
                     'buy_signal': has_signal,
-                    'sell_signal': bool(row['sell_signal']) if 'sell_signal' in row else False,
-                    'quality': row.get('signal_quality', 0) if self.strict_mode else 0,
-                    'atr': row.get('atr', 0)  # 🆕 添加ATR数据
+                    'sell_signal': bool(sell_flags[i]),
+                    'quality': qualities[i],
+                    'atr': atrs[i]  # 🆕 添加ATR数据
                 }
         
-        print(f"DEBUG: 数据转换完成，共发现 {total_buy_signals} 个原始买入信号 (严格模式: {self.strict_mode}, 信号列: {signal_col})")
-        
-        if total_buy_signals == 0:
-            print("警告: 没有任何股票产生买入信号，请检查策略逻辑或严格模式设置！")
-        
-        # 2. 按日时间步进
-        sorted_dates = sorted(list(all_dates))
+        return market_data, sorted(all_dates), total_buy_signals
+
+    def run_on_market_data(self, market_data, dates, min_quality=60):
+        """
+        在已转换的按日行情上逐日撮合
         
-        for date_str in sorted_dates:
+        Args:
+            market_data: build_market_data 返回的按日行情字典
+            dates: 需要回测的日期列表（升序）
+            min_quality: 最低信号质量
+        """
+        for date_str in dates:
             daily_market = market_data.get(date_str, {})
             self._process_daily_step(date_str, daily_market, min_quality)
             
@@ -493,6 +566,51 @@ class PortfolioBacktester:
             'position_count': len(self.positions)
         })
 
+    def close_all_positions(self, date_str, reason="期末平仓"):
+        """按最后收盘价卖出全部持仓（与其他卖出一样计手续费和滑点），并把当日权益更新为平仓后的现金"""
+        for code in list(self.positions):
+            pos = self.positions[code]
+            if pos['shares'] > 0:
+                self._execute_sell(date_str, code, pos['name'], pos['last_close'], reason=reason)
+            else:
+                del self.positions[code]
+        if self.equity_curve and self.equity_curve[-1]['date'] == date_str:
+            self.equity_curve[-1].update(equity=self.cash, cash=self.cash, market_value=0, position_count=0)
+
+    # 只追加的运行记录（断点中只保存行数，新增的行另存，见 BacktestCheckpoint.append_ledger）
+    LEDGER_FIELDS = ('trades', 'equity_curve', 'daily_logs')
+
+    def get_state(self, ledger=True, index_cache=True):
+        """
+        导出引擎运行状态（现金、持仓、交易记录、权益曲线等），用于断点保存
+        
+        Args:
+            ledger: 是否包含交易记录、权益曲线、日志（随回测长度增长）
+            index_cache: 是否包含指数数据缓存
+        """
+        state = {
+            'cash': self.cash,
+            'positions': copy.deepcopy(self.positions),
+            'index_filter_stats': dict(self.index_filter_stats),
+        }
+        if ledger:
+            for field in self.LEDGER_FIELDS:
+                state[field] = list(getattr(self, field))
+        if index_cache and self.index_filter is not None:
+            state['index_data_cache'] = dict(self.index_filter.index_data_cache)
+        return state
+
+    def set_state(self, state):
+        """恢复 get_state 导出的运行状态"""
+        self.cash = state['cash']
+        self.positions = copy.deepcopy(state['positions'])
+        self.trades = list(state.get('trades', []))
+        self.equity_curve = list(state.get('equity_curve', []))
+        self.daily_logs = list(state.get('daily_logs', []))
+        self.index_filter_stats = dict(state['index_filter_stats'])
+        if self.index_filter is not None and 'index_data_cache' in state:
+            self.index_filter.index_data_cache.update(state['index_data_cache'])
+
     def _execute_buy(self, date, code, name, price, shares, quality, atr=0):
         cost = shares * price
         fee = max(5, cost * self.commission)
@@ -631,199 +749,126 @@ class BacktestEngine:
         try:
             # 运行策略
             result = qqe_trend_strategy(stock_data, strict_mode=strict_mode)
+            return self.backtest_signals(stock_code, stock_name, result, strict_mode, min_quality)
+        except Exception as e:
+            return []
+    
+    def backtest_signals(self, stock_code, stock_name, result, strict_mode=True, min_quality=60):
+        """
+        在已计算好的策略结果上模拟交易（同一时间只持有一个仓位）
+        
+        按买入信号逐笔建仓，每笔交易的离场点在价格数组上向后查找
+        （第一个触及止盈线、止损线或出现卖出信号的K线），不逐日遍历。
+        同一根K线上的判断顺序：止盈(卖出一半，当日不再判断) → 止损 → 卖出信号。
+        
+        Args:
+            result: qqe_trend_strategy 的输出
             
-            # 获取信号
-            signal_column = 'buy_signal_strict' if strict_mode else 'buy_signal'
-            buy_signals = result[result[signal_column] == True]
-            sell_signals = result[result['sell_signal'] == True]
-            
-            # 质量过滤
-            if strict_mode and min_quality > 0:
-                buy_signals = buy_signals[buy_signals['signal_quality'] >= min_quality]
-            
-            # 模拟交易 - 修正后的逻辑：确保同一时间只持有一个仓位
-            stock_trades = []
-            current_position = None  # 记录当前持仓
+        Returns:
+            trades: 交易记录列表
+        """
+        n = len(result)
+        if n == 0:
+            return []
+        
+        dates = result.index
+        opens = result['open'].to_numpy(dtype=float)
+        highs = result['high'].to_numpy(dtype=float)
+        lows = result['low'].to_numpy(dtype=float)
+        closes = result['close'].to_numpy(dtype=float)
+        
+        # 获取信号
+        signal_column = 'buy_signal_strict' if strict_mode else 'buy_signal'
+        buy_mask = result[signal_column].to_numpy() == True
+        sell_mask = result['sell_signal'].to_numpy() == True
+        has_quality = 'signal_quality' in result.columns
+        qualities = result['signal_quality'].to_numpy() if has_quality else np.zeros(n)
+        
+        # 质量过滤
+        if strict_mode and min_quality > 0:
+            buy_mask = buy_mask & (qualities >= min_quality)
+        entries = np.flatnonzero(buy_mask)
+        
+        # 逐笔记录 (建仓下标, 离场下标, 买入成本, 卖出价, 离场原因, 状态)，最后统一生成交易记录
+        records = []
+        
+        def first_hit(start, stop_price, tp_price=None):
+            """从 start 开始第一个触发事件的K线下标，没有则返回 None"""
+            if start >= n:
+                return None
+            hit = (lows[start:] <= stop_price) | sell_mask[start:]
+            if tp_price is not None:
+                hit |= highs[start:] >= tp_price
+            k = int(np.argmax(hit))
+            return start + k if hit[k] else None
+        
+        next_free = 0
+        while True:
+            # 下一个可建仓的买入信号（平仓当日不再买入）
+            k = np.searchsorted(entries, next_free)
+            if k >= len(entries):
+                break
+            entry = int(entries[k])
+            buy_cost = opens[entry] * (1 + self.slippage + self.commission)
             
-            # 合并所有日期，按时间顺序处理
-            for date in result.index:
-                # 获取当前行数据
-                row = result.loc[date]
-                
-                # 如果当前有持仓，检查是否需要平仓
-                if current_position is not None:
-                    buy_date = current_position['buy_date']
-                    buy_cost = current_position['buy_cost']
-                    has_taken_profit = current_position.get('has_taken_profit', False)
-                    
-                    # --- 1. 检查动态止盈 ---
-                    if not has_taken_profit and self.take_profit > 0:
-                        tp_price_threshold = buy_cost * (1 + self.take_profit)
-                        
-                        # 检查最高价是否触及止盈线
-                        if row['high'] >= tp_price_threshold:
-                            # 确定成交价
-                            tp_price = max(row['open'], tp_price_threshold)
-                            
-                            # 生成一笔"卖出50%"的交易记录
-                            sell_net = tp_price * (1 - self.slippage - self.commission)
-                            profit_pct = (sell_net - buy_cost) / buy_cost * 100
-                            holding_days = (date - buy_date).days
-                            
-                            tp_trade = {
-                                'stock_code': stock_code,
-                                'stock_name': stock_name,
-                                'buy_date': buy_date,
-                                'buy_price': current_position['buy_price'],
-                                'buy_cost': buy_cost,
-                                'sell_date': date,
-                                'sell_price': tp_price,
-                                'sell_net': sell_net,
-                                'profit_pct': profit_pct,
-                                'holding_days': holding_days,
-                                'signal_quality': current_position['signal_quality'],
-                                'exit_reason': 'take_profit_50%',
-                                'status': 'closed'
-                            }
-                            stock_trades.append(tp_trade)
-                            
-                            # 更新持仓状态
-                            current_position['has_taken_profit'] = True
-                            current_position['use_breakeven_stop'] = True
-                            
-                            # 继续检查是否触发其他信号（简化处理，这里不再继续）
-                            continue
-                            
-                    # --- 2. 检查止损 ---
-                    if current_position.get('use_breakeven_stop', False):
-                        # 保本止损
-                        stop_price_threshold = buy_cost * (1 + self.commission + self.slippage)
-                    else:
-                        # 普通止损
-                        stop_price_threshold = buy_cost * (1 - self.stop_loss)
-                    
-                    if row['low'] <= stop_price_threshold:
-                        sell_date = date
-                        exit_reason = 'stop_loss'
-                        status = 'closed'
-                        
-                        # 确定止损执行价格
-                        if row['open'] < stop_price_threshold:
-                            sell_price = row['open']
-                        else:
-                            sell_price = stop_price_threshold
-                        
-                        # 平仓
-                        sell_net = sell_price * (1 - self.slippage - self.commission)
-                        profit_pct = (sell_net - buy_cost) / buy_cost * 100
-                        holding_days = (sell_date - buy_date).days
-                        
-                        trade = {
-                            'stock_code': stock_code,
-                            'stock_name': stock_name,
-                            'buy_date': buy_date,
-                            'buy_price': current_position['buy_price'],
-                            'buy_cost': buy_cost,
-                            'sell_date': sell_date,
-                            'sell_price': sell_price,
-                            'sell_net': sell_net,
-                            'profit_pct': profit_pct,
-                            'holding_days': holding_days,
-                            'signal_quality': current_position['signal_quality'],
-                            'exit_reason': exit_reason,
-                            'status': status
-                        }
-                        
-                        stock_trades.append(trade)
-                        current_position = None  # 清空持仓
-                        continue
-                    
-                    # --- 3. 检查卖出信号 ---
-                    if date in sell_signals.index:
-                        sell_date = date
-                        sell_price = row['open']
-                        exit_reason = 'signal'
-                        status = 'closed'
-                        
-                        # 平仓
-                        sell_net = sell_price * (1 - self.slippage - self.commission)
-                        profit_pct = (sell_net - buy_cost) / buy_cost * 100
-                        holding_days = (sell_date - buy_date).days
-                        
-                        trade = {
-                            'stock_code': stock_code,
-                            'stock_name': stock_name,
-                            'buy_date': buy_date,
-                            'buy_price': current_position['buy_price'],
-                            'buy_cost': buy_cost,
-                            'sell_date': sell_date,
-                            'sell_price': sell_price,
-                            'sell_net': sell_net,
-                            'profit_pct': profit_pct,
-                            'holding_days': holding_days,
-                            'signal_quality': current_position['signal_quality'],
-                            'exit_reason': exit_reason,
-                            'status': status
-                        }
-                        
-                        stock_trades.append(trade)
-                        current_position = None  # 清空持仓
-                        continue
-                
-                # 如果当前没有持仓，检查是否有买入信号
-                if current_position is None and date in buy_signals.index:
-                    buy_price = buy_signals.loc[date]['open']
-                    signal_quality = buy_signals.loc[date].get('signal_quality', 0) if strict_mode else 0
-                    buy_cost = buy_price * (1 + self.slippage + self.commission)
-                    
-                    # 建立持仓
-                    current_position = {
-                        'buy_date': date,
-                        'buy_price': buy_price,
-                        'buy_cost': buy_cost,
-                        'signal_quality': signal_quality,
-                        'has_taken_profit': False
-                    }
+            tp_price = buy_cost * (1 + self.take_profit) if self.take_profit > 0 else None
+            stop_price = buy_cost * (1 - self.stop_loss)
+            exit_idx = first_hit(entry + 1, stop_price, tp_price)
             
-            # 如果最后还有持仓，以最后一天的收盘价平仓
-            if current_position is not None:
-                buy_date = current_position['buy_date']
-                buy_cost = current_position['buy_cost']
-                sell_date = result.index[-1]
-                sell_price = result.iloc[-1]['close']
-                exit_reason = 'open'
-                status = 'open'
-                
-                sell_net = sell_price * (1 - self.slippage - self.commission)
-                profit_pct = (sell_net - buy_cost) / buy_cost * 100
-                holding_days = (sell_date - buy_date).days
-                
-                trade = {
-                    'stock_code': stock_code,
-                    'stock_name': stock_name,
-                    'buy_date': buy_date,
-                    'buy_price': current_position['buy_price'],
-                    'buy_cost': buy_cost,
-                    'sell_date': sell_date,
-                    'sell_price': sell_price,
-                    'sell_net': sell_net,
-                    'profit_pct': profit_pct,
-                    'holding_days': holding_days,
-                    'signal_quality': current_position['signal_quality'],
-                    'exit_reason': exit_reason,
-                    'status': status
-                }
-                
-                stock_trades.append(trade)
+            # --- 1. 动态止盈：卖出一半，之后改为保本止损 ---
+            if exit_idx is not None and tp_price is not None and highs[exit_idx] >= tp_price:
+                tp_sell = max(opens[exit_idx], tp_price)
+                records.append((entry, exit_idx, buy_cost, tp_sell, 'take_profit_50%', 'closed'))
+                stop_price = buy_cost * (1 + self.commission + self.slippage)
+                exit_idx = first_hit(exit_idx + 1, stop_price)
             
-            return stock_trades
+            if exit_idx is None:
+                # 最后还有持仓，以最后一天的收盘价平仓
+                records.append((entry, n - 1, buy_cost, closes[-1], 'open', 'open'))
+                break
             
-        except Exception as e:
+            if lows[exit_idx] <= stop_price:
+                # --- 2. 止损 ---
+                sell_price = opens[exit_idx] if opens[exit_idx] < stop_price else stop_price
+                records.append((entry, exit_idx, buy_cost, sell_price, 'stop_loss', 'closed'))
+            else:
+                # --- 3. 卖出信号 ---
+                records.append((entry, exit_idx, buy_cost, opens[exit_idx], 'signal', 'closed'))
+            next_free = exit_idx + 1
+        
+        if not records:
             return []
+        
+        entry_idx = np.array([r[0] for r in records])
+        exit_idx = np.array([r[1] for r in records])
+        buy_dates = dates[entry_idx].tolist()
+        sell_dates = dates[exit_idx].tolist()
+        cost_rate = 1 - self.slippage - self.commission
+        
+        stock_trades = []
+        for j, (entry, _, buy_cost, sell_price, exit_reason, status) in enumerate(records):
+            sell_net = sell_price * cost_rate
+            stock_trades.append({
+                'stock_code': stock_code,
+                'stock_name': stock_name,
+                'buy_date': buy_dates[j],
+                'buy_price': opens[entry],
+                'buy_cost': buy_cost,
+                'sell_date': sell_dates[j],
+                'sell_price': sell_price,
+                'sell_net': sell_net,
+                'profit_pct': (sell_net - buy_cost) / buy_cost * 100,
+                'holding_days': (sell_dates[j] - buy_dates[j]).days,
+                'signal_quality': (qualities[entry] if has_quality else 0) if strict_mode else 0,
+                'exit_reason': exit_reason,
+                'status': status
+            })
+        
+        return stock_trades
     
     def calculate_metrics(self, trades):
         """
-        计算回测指标
+        计算回测指标（见 metrics.py）
         
         Args:
             trades: 交易记录列表
@@ -834,88 +879,52 @@ class BacktestEngine:
         if len(trades) == 0:
             return None
         
-        df = pd.DataFrame(trades)
-        
-        # 基本统计
-        total_trades = len(df)
-        closed_trades = df[df['status'] == 'closed']
+        profits = column(trades, 'profit_pct').astype(float)
+        exit_reason = column(trades, 'exit_reason')
+        stats = trade_metrics(profits, exit_reason)
+        total_trades = stats['total_trades']
         
         # 止损统计
-        if 'exit_reason' in df.columns:
-            stop_loss_trades = df[df['exit_reason'] == 'stop_loss']
-            stop_loss_count = len(stop_loss_trades)
-            stop_loss_rate = stop_loss_count / total_trades * 100 if total_trades > 0 else 0
-            signal_exit_count = len(df[df['exit_reason'] == 'signal'])
-        else:
-            stop_loss_count = 0
-            stop_loss_rate = 0
-            signal_exit_count = 0
-        
-        # 收益统计
-        profits = df['profit_pct'].values
-        avg_profit = np.mean(profits)
-        median_profit = np.median(profits)
-        max_profit = np.max(profits)
-        min_profit = np.min(profits)
-        
-        # 胜率统计
-        win_trades = df[df['profit_pct'] > 0]
-        win_count = len(win_trades)
-        loss_count = total_trades - win_count
-        win_rate = win_count / total_trades * 100 if total_trades > 0 else 0
-        
-        # 盈亏比
-        avg_win = win_trades['profit_pct'].mean() if len(win_trades) > 0 else 0
-        loss_trades = df[df['profit_pct'] <= 0]
-        avg_loss = abs(loss_trades['profit_pct'].mean()) if len(loss_trades) > 0 else 0
-        profit_factor = avg_win / avg_loss if avg_loss != 0 else 0
-        
-        # 持有期统计
-        avg_holding = df['holding_days'].mean()
+        reasons = stats['exit_reasons']
+        stop_loss_count = reasons.get('stop_loss', {}).get('count', 0)
+        stop_loss_rate = stop_loss_count / total_trades * 100 if total_trades > 0 else 0
+        signal_exit_count = reasons.get('signal', {}).get('count', 0)
         
         # 质量统计
-        if 'signal_quality' in df.columns and df['signal_quality'].max() > 0:
-            avg_quality = df['signal_quality'].mean()
-        else:
-            avg_quality = 0
+        qualities = column(trades, 'signal_quality')
+        avg_quality = float(qualities.mean()) if qualities is not None and qualities.max() > 0 else 0
         
         # 累计收益 (改为单利累加，避免夸张的复利误导)
-        # 假设每次使用固定金额交易，不进行复利定投
-        cumulative_return = df['profit_pct'].sum()
+        # 最大回撤：假设初始资金为100，每次盈亏叠加
+        max_drawdown, _ = drawdown_stats(100 + np.cumsum(profits))
         
-        # 最大回撤 (基于资金曲线计算)
-        # 假设初始资金为100，每次盈亏叠加
-        equity = 100 + df['profit_pct'].cumsum()
-        running_max = equity.expanding().max()
-        # 防止分母为0或负数（虽然理论上equity应该>0）
-        # 这里计算的是相对于最高点的回撤百分比
-        drawdown = (equity - running_max) / running_max * 100
-        max_drawdown = drawdown.min()
-        
-        # 夏普比率（简化版，假设无风险利率为0）
-        sharpe_ratio = avg_profit / df['profit_pct'].std() if df['profit_pct'].std() > 0 else 0
+        # 夏普比率（简化版，按单笔收益，假设无风险利率为0）
+        std = profits.std(ddof=1) if total_trades > 1 else 0
+        sharpe_ratio = stats['avg_profit'] / std if std > 0 else 0
         
         metrics = {
             'total_trades': total_trades,
-            'closed_trades': len(closed_trades),
-            'win_count': win_count,
-            'loss_count': loss_count,
-            'win_rate': win_rate,
-            'avg_profit': avg_profit,
-            'median_profit': median_profit,
-            'max_profit': max_profit,
-            'min_profit': min_profit,
-            'avg_win': avg_win,
-            'avg_loss': avg_loss,
-            'profit_factor': profit_factor,
-            'avg_holding': avg_holding,
+            'closed_trades': int(np.sum(column(trades, 'status') == 'closed')),
+            'win_count': stats['win_count'],
+            'loss_count': stats['loss_count'],
+            'win_rate': stats['win_rate'],
+            'avg_profit': stats['avg_profit'],
+            'median_profit': stats['median_profit'],
+            'max_profit': stats['max_profit'],
+            'min_profit': stats['min_profit'],
+            'avg_win': stats['avg_win'],
+            'avg_loss': stats['avg_loss'],
+            'profit_factor': stats['payoff_ratio'],
+            'avg_holding': float(np.mean(column(trades, 'holding_days'))),
             'avg_quality': avg_quality,
-            'cumulative_return': cumulative_return,
+            'cumulative_return': stats['total_profit_pct'],
             'max_drawdown': max_drawdown,
             'sharpe_ratio': sharpe_ratio,
             'stop_loss_count': stop_loss_count,
             'stop_loss_rate': stop_loss_rate,
-            'signal_exit_count': signal_exit_count
+            'signal_exit_count': signal_exit_count,
+            'gross_profit_factor': stats['profit_factor'],
+            'exit_reasons': reasons
         }
         
         return metrics
@@ -926,14 +935,8 @@ import os
 class StockDataLoader:
     """股票数据加载器"""
     CACHE_DIR = "data_cache"
+    store = BarStore(CACHE_DIR)
     
-    @staticmethod
-    def _get_cache_path(code):
-        if not os.path.exists(StockDataLoader.CACHE_DIR):
-            os.makedirs(StockDataLoader.CACHE_DIR)
-        today = datetime.now().strftime("%Y%m%d")
-        return os.path.join(StockDataLoader.CACHE_DIR, f"{code}_{today}.csv")
-
     @staticmethod
     def get_stock_list(board_filter=None, max_stocks=None):
         """获取股票列表"""
@@ -1018,63 +1021,166 @@ class StockDataLoader:
     
     @staticmethod
     def get_stock_data(code, days=250):
-        """获取股票数据 (带缓存)"""
-        cache_path = StockDataLoader._get_cache_path(code)
-        
-        # 1. 尝试从缓存读取
-        if os.path.exists(cache_path):
-            try:
-                df = pd.read_csv(cache_path, index_col='date', parse_dates=['date'])
-                return df
-            except Exception:
-                pass # 读取失败则重新下载
-        
-        # 2. 从服务器下载
-        lg = bs.login()
-        
-        end_date = datetime.now().strftime("%Y-%m-%d")
-        start_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
-        
-        rs = bs.query_history_k_data_plus(
-            code,
-            "date,open,high,low,close,volume",
-            start_date=start_date,
-            end_date=end_date,
-            frequency="d",
-            adjustflag="3"
-        )
-        
-        data_list = []
-        while (rs.error_code == '0') & rs.next():
-            data_list.append(rs.get_row_data())
-        
-        bs.logout()
-        
-        if len(data_list) == 0:
-            return None
+        """获取股票数据 (本地增量存储，只下载缺失的日期)"""
+        return StockDataLoader.store.get_bars(code, days=days)
+
+
+class BacktestCheckpoint:
+    """
+    长时间回测的断点文件
+    
+    保存内容：股票列表、下载进度、已完成阈值的结果、当前阈值的引擎状态（现金、持仓）与日期下标、
+    运行记录的行数、随机数状态。随回测变大的内容都不放在断点文件中，每部分只写一次：
+    - 信号缓存(market_data_cache)：下载阶段按批追加写入 signals 目录
+    - 当前阈值的交易记录、权益曲线、日志：每次保存断点时只把新增的行追加写入 ledger 目录，断点中只记行数
+    - 指数数据缓存：写入 ledger 目录一次（内容变化时才重写）
+    - 已完成阈值的引擎终态：阈值完成时写入 ledger 目录一次
+    文件名由回测配置哈希得到，配置不同的回测互不干扰。
+    """
+    def __init__(self, config, checkpoint_dir="checkpoints"):
+        self.config = config
+        self.checkpoint_dir = checkpoint_dir
+        key = hashlib.sha1(json.dumps(config, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:12]
+        self.path = os.path.join(checkpoint_dir, f"backtest_{key}.pkl")
+        self.signals_dir = os.path.join(checkpoint_dir, f"backtest_{key}.signals")
+        self.ledger_dir = os.path.join(checkpoint_dir, f"backtest_{key}.ledger")
+        self._index_keys = None  # 已保存的指数缓存包含的代码
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    @staticmethod
+    def _dump(obj, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def save_signals(self, entries):
+        """追加一批新计算的信号缓存 {code: {'name', 'data'}}（原子写入一个新的分块文件）"""
+        if not entries:
+            return
+        os.makedirs(self.signals_dir, exist_ok=True)
+        chunk = len([f for f in os.listdir(self.signals_dir) if f.endswith('.pkl')])
+        self._dump(dict(entries), os.path.join(self.signals_dir, f"{chunk:05d}.pkl"))
+
+    def load_signals(self):
+        """合并全部分块的信号缓存"""
+        cache = {}
+        if os.path.exists(self.signals_dir):
+            for name in sorted(f for f in os.listdir(self.signals_dir) if f.endswith('.pkl')):
+                with open(os.path.join(self.signals_dir, name), 'rb') as f:
+                    cache.update(pickle.load(f))
+        return cache
+
+    def _ledger_path(self, name):
+        return os.path.join(self.ledger_dir, name)
+
+    def append_ledger(self, q, engine, ledger=None):
+        """
+        把引擎在上次保存之后新增的交易记录、权益曲线、日志写入一个新的分块文件
         
-        df = pd.DataFrame(data_list, columns=rs.fields)
-        df = df[df['close'] != '']
+        Args:
+            ledger: 上次返回的行数记录（None 表示该阈值还没有保存过）
+            
+        Returns:
+            新的行数记录 {'chunks', 'trades', 'equity_curve', 'daily_logs'}，存入断点
+        """
+        ledger = dict(ledger or {'chunks': 0, **{field: 0 for field in engine.LEDGER_FIELDS}})
+        rows = {field: getattr(engine, field)[ledger[field]:] for field in engine.LEDGER_FIELDS}
+        os.makedirs(self.ledger_dir, exist_ok=True)
+        self._dump(rows, self._ledger_path(f"q{q}_{ledger['chunks']:05d}.pkl"))
+        ledger['chunks'] += 1
+        for field in engine.LEDGER_FIELDS:
+            ledger[field] += len(rows[field])
+        return ledger
+
+    def load_ledger(self, q, ledger):
+        """
+        按断点中的行数读取运行记录（断点之后才写入的分块被忽略）
         
-        if len(df) == 0:
+        Returns:
+            {'trades', 'equity_curve', 'daily_logs'}；ledger 为 None（旧版本断点）时返回空字典
+        """
+        if not ledger:
+            return {}
+        rows = {field: [] for field in ledger if field != 'chunks'}
+        for chunk in range(ledger['chunks']):
+            with open(self._ledger_path(f"q{q}_{chunk:05d}.pkl"), 'rb') as f:
+                for field, values in pickle.load(f).items():
+                    rows[field].extend(values)
+        return {field: values[:ledger[field]] for field, values in rows.items()}
+
+    def save_index_cache(self, index_data_cache):
+        """保存指数数据缓存（包含的指数没有变化时不重写）"""
+        keys = set(index_data_cache)
+        if keys == self._index_keys:
+            return
+        os.makedirs(self.ledger_dir, exist_ok=True)
+        self._dump(dict(index_data_cache), self._ledger_path("index_cache.pkl"))
+        self._index_keys = keys
+
+    def load_index_cache(self):
+        path = self._ledger_path("index_cache.pkl")
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'rb') as f:
+            cache = pickle.load(f)
+        self._index_keys = set(cache)
+        return cache
+
+    def save_final_state(self, q, engine_state):
+        """阈值完成时写入一次引擎终态"""
+        os.makedirs(self.ledger_dir, exist_ok=True)
+        self._dump(engine_state, self._ledger_path(f"final_q{q}.pkl"))
+
+    def clear_ledger(self, q):
+        if os.path.exists(self.ledger_dir):
+            for name in os.listdir(self.ledger_dir):
+                if name.startswith(f"q{q}_"):
+                    os.remove(self._ledger_path(name))
+
+    def save(self, state):
+        """原子写入断点（先写临时文件再替换，避免中断时留下损坏的文件），不包含信号缓存和已完成阈值的终态"""
+        if not os.path.exists(self.checkpoint_dir):
+            os.makedirs(self.checkpoint_dir)
+        state = {k: v for k, v in state.items() if k not in ('market_data_cache', 'final_states')}
+        state['config'] = self.config
+        state['rng_state'] = (random.getstate(), np.random.get_state())
+        state['saved_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self._dump(state, self.path)
+
+    def load(self):
+        """读取断点和信号缓存并恢复随机数状态，文件不存在或损坏时返回 None"""
+        if not self.exists():
             return None
-        
-        df['open'] = df['open'].astype(float)
-        df['high'] = df['high'].astype(float)
-        df['low'] = df['low'].astype(float)
-        df['close'] = df['close'].astype(float)
-        df['volume'] = df['volume'].astype(float)
-        df['date'] = pd.to_datetime(df['date'])
-        df = df.set_index('date')
-        df = df.sort_index()
-        
-        # 3. 写入缓存
         try:
-            df.to_csv(cache_path)
+            with open(self.path, 'rb') as f:
+                state = pickle.load(f)
+            # 旧版本的断点把信号缓存和阈值终态直接存在断点文件中
+            state['market_data_cache'] = {**state.get('market_data_cache', {}), **self.load_signals()}
+            final_states = dict(state.get('final_states', {}))
+            for q in state.get('done_thresholds', []):
+                path = self._ledger_path(f"final_q{q}.pkl")
+                if os.path.exists(path):
+                    with open(path, 'rb') as f:
+                        final_states[q] = pickle.load(f)
+            state['final_states'] = final_states
         except Exception as e:
-            print(f"写入缓存失败: {e}")
-            
-        return df
+            print(f"读取断点失败: {e}，将从头开始。")
+            return None
+        if 'rng_state' in state:
+            random.setstate(state['rng_state'][0])
+            np.random.set_state(state['rng_state'][1])
+        return state
+
+    def clear(self):
+        if self.exists():
+            os.remove(self.path)
+        for directory in (self.signals_dir, self.ledger_dir):
+            if os.path.exists(directory):
+                shutil.rmtree(directory)
+        self._index_keys = None
 
 
 def run_backtest(board='chinext+star', max_stocks=100, max_positions=5, quality_thresholds=None,
@@ -1083,7 +1189,9 @@ def run_backtest(board='chinext+star', max_stocks=100, max_positions=5, quality_
                 delay=0.1, initial_capital=100000, 
                 use_index_filter=False, index_filter_mode='moderate', index_min_strength=60,
                 use_atr_stop=False, atr_multiplier=2.0,
-                use_drawdown_exit=False, drawdown_threshold=0.08, min_profit_for_drawdown=0.05):
+                use_drawdown_exit=False, drawdown_threshold=0.08, min_profit_for_drawdown=0.05,
+                use_sector_filter=False, sector_min_members=3,
+                resume=False, checkpoint_every=20, checkpoint_dir="checkpoints", state_file=None, db_path=None):
     """
     运行回测 (组合模式)
     
@@ -1098,6 +1206,13 @@ def run_backtest(board='chinext+star', max_stocks=100, max_positions=5, quality_
     - use_drawdown_exit: 是否使用回撤止盈
     - drawdown_threshold: 回撤阈值（默认0.08即8%）
     - min_profit_for_drawdown: 启用回撤止盈的最低盈利（默认0.05即5%）
+    - use_sector_filter: 按个股所属行业的等权合成指数过滤（需启用指数过滤）
+    - sector_min_members: 行业成分股少于该数量时仍使用大盘指数
+    - resume: 从上次的断点继续（配置需与上次一致）
+    - checkpoint_every: 每撮合多少个交易日保存一次断点（0=不保存）
+    - checkpoint_dir: 断点文件目录
+    - state_file: 回测结束后保存运行状态的文件，之后可用 extend_backtest 只追加新交易日
+    - db_path: 把各阈值的参数、指标、交易记录和权益曲线写入该 SQLite 数据库（见 trade_db.py）
     """
     print("=" * 100)
     print("QQE趋势策略回测系统 (v2.3 回撤止盈版)")
@@ -1121,7 +1236,8 @@ def run_backtest(board='chinext+star', max_stocks=100, max_positions=5, quality_
     print(f"止损: {stop_loss_str} | 止盈: {take_profit_str}")
     print(f"分层止盈: {'启用' if layered_tp else '禁用'} | 金字塔加仓: {'启用' if pyramid_enabled else '禁用'}")
     print(f"指数过滤: {'启用' if use_index_filter else '禁用'}" + 
-          (f" ({index_filter_mode}模式, 最小强度{index_min_strength})" if use_index_filter else ""))
+          (f" ({index_filter_mode}模式, 最小强度{index_min_strength}"
+           f"{', 行业板块' if use_sector_filter else ''})" if use_index_filter else ""))
     print(f"评测阈值: {quality_thresholds}")
     print("=" * 100)
     
@@ -1129,131 +1245,438 @@ def run_backtest(board='chinext+star', max_stocks=100, max_positions=5, quality_
     if quality_thresholds is None:
         quality_thresholds = [60]
     
-    # 获取股票列表
-    print("\n[1/3] 获取股票列表...")
-    stock_list = StockDataLoader.get_stock_list(board_filter=board, max_stocks=max_stocks)
-    print(f"共获取 {len(stock_list)} 只股票")
+    # 断点：配置相同的回测共用同一个断点文件
+    checkpoint = BacktestCheckpoint({
+        'board': board, 'max_stocks': max_stocks, 'max_positions': max_positions,
+        'quality_thresholds': quality_thresholds, 'strict_mode': strict_mode,
+        'history_days': history_days, 'stop_loss': stop_loss, 'take_profit': take_profit,
+        'trailing_stop': trailing_stop, 'layered_tp': layered_tp, 'pyramid_enabled': pyramid_enabled,
+        'enhanced_entry': enhanced_entry, 'initial_capital': initial_capital,
+        'use_index_filter': use_index_filter, 'index_filter_mode': index_filter_mode,
+        'index_min_strength': index_min_strength, 'use_atr_stop': use_atr_stop,
+        'atr_multiplier': atr_multiplier, 'use_drawdown_exit': use_drawdown_exit,
+        'drawdown_threshold': drawdown_threshold, 'min_profit_for_drawdown': min_profit_for_drawdown,
+        'use_sector_filter': use_sector_filter, 'sector_min_members': sector_min_members,
+    }, checkpoint_dir=checkpoint_dir)
     
-    # 预加载数据 (只需加载一次)
-    print("\n[2/3] 预加载市场数据...")
-    market_data_cache = {}
-    valid_stocks = 0
-    for i, stock in enumerate(stock_list):
-        print(f"\r下载进度: {i+1}/{len(stock_list)}", end='', flush=True)
-        try:
-            df = StockDataLoader.get_stock_data(stock['code'], days=history_days)
-            if df is not None and len(df) >= 60:
-                # 预计算策略
-                result = qqe_trend_strategy(df, strict_mode=strict_mode, enhanced_entry=enhanced_entry)
-                market_data_cache[stock['code']] = {
-                    'name': stock['name'],
-                    'data': result
-                }
-                valid_stocks += 1
-        except Exception:
-            continue
-            
-    print(f"\n有效股票数据: {valid_stocks}只")
+    state = checkpoint.load() if resume else None
+    if state is not None:
+        print(f"\n从断点恢复: {checkpoint.path} (保存于 {state.get('saved_at')})")
+    else:
+        if resume:
+            print("\n未找到可用断点，从头开始。")
+        checkpoint.clear()  # 从头开始时丢弃旧断点，避免混入旧的信号分块
+        state = {
+            'stock_list': None,
+            'market_data_cache': {},
+            'download_index': 0,
+            'results': [],
+            'done_thresholds': [],
+            'current_threshold': None,
+            'engine_state': None,
+            'ledger': None,
+            'date_index': 0,
+        }
+    
+    pending = {}  # 上次保存后新计算的信号缓存
+    try:
+        # 获取股票列表
+        print("\n[1/3] 获取股票列表...")
+        if state['stock_list'] is None:
+            state['stock_list'] = StockDataLoader.get_stock_list(board_filter=board, max_stocks=max_stocks)
+        stock_list = state['stock_list']
+        print(f"共获取 {len(stock_list)} 只股票")
+        
+        # 预加载数据 (只需加载一次)
+        print("\n[2/3] 预加载市场数据...")
+        market_data_cache = state['market_data_cache']
+        StockDataLoader.store.login()  # 批量下载只登录一次
+        for i in range(state['download_index'], len(stock_list)):
+            stock = stock_list[i]
+            print(f"\r下载进度: {i+1}/{len(stock_list)}", end='', flush=True)
+            try:
+                df = StockDataLoader.get_stock_data(stock['code'], days=history_days)
+                if df is not None and len(df) >= 60:
+                    # 预计算策略
+                    result = qqe_trend_strategy(df, strict_mode=strict_mode, enhanced_entry=enhanced_entry)
+                    market_data_cache[stock['code']] = pending[stock['code']] = {
+                        'name': stock['name'],
+                        'data': result
+                    }
+            except Exception:
+                pass
+            state['download_index'] = i + 1
+            if checkpoint_every and (i + 1) % 100 == 0:
+                checkpoint.save_signals(pending)
+                pending = {}
+                checkpoint.save(state)
+        StockDataLoader.store.logout()
+        if checkpoint_every and state['download_index'] > 0:
+            checkpoint.save_signals(pending)
+            pending = {}
+            checkpoint.save(state)
+                
+        print(f"\n有效股票数据: {len(market_data_cache)}只")
+        
+        results = _run_thresholds(
+            state, checkpoint, quality_thresholds, market_data_cache, checkpoint_every,
+            initial_capital=initial_capital, max_positions=max_positions, stop_loss=stop_loss,
+            take_profit=take_profit, trailing_stop=trailing_stop, layered_tp=layered_tp,
+            pyramid_enabled=pyramid_enabled, strict_mode=strict_mode, use_index_filter=use_index_filter,
+            index_filter_mode=index_filter_mode, index_min_strength=index_min_strength,
+            use_atr_stop=use_atr_stop, atr_multiplier=atr_multiplier, use_drawdown_exit=use_drawdown_exit,
+            drawdown_threshold=drawdown_threshold, min_profit_for_drawdown=min_profit_for_drawdown,
+            use_sector_filter=use_sector_filter, sector_min_members=sector_min_members
+        )
+    except KeyboardInterrupt:
+        if checkpoint_every:
+            checkpoint.save_signals(pending)
+            checkpoint.save(state)
+            print(f"\n\n已中断，进度已保存到 {checkpoint.path}")
+            print("使用相同参数加 --resume 可从断点继续。")
+        raise
+    
+    checkpoint.clear()
+    
+    if state_file:
+        save_run_state(state_file, checkpoint.config, state['stock_list'], state['market_data_cache'],
+                       state.get('final_states', {}))
+    
+    if db_path:
+        record_backtest_results(db_path, 'backtest', checkpoint.config, results, state.get('final_states', {}))
+    
+    # 汇总对比
+    print("\n" + "="*72)
+    print("最终回测对比 (资金池模式)")
+    print("="*72)
+    print(f"{'阈值':<10} | {'总收益率':<15} | {'最大回撤':<15} | {'夏普':<8} | {'交易数':<10}")
+    print("-" * 72)
+    for res in results:
+        print(f"{res['threshold']:<10} | {res['return']:<14.2f}% | {res['max_dd']:<14.2f}% | "
+              f"{res.get('sharpe', 0):<8.2f} | {res['trades']:<10}")
+    print("="*72)
+    return results
 
+def _run_thresholds(state, checkpoint, quality_thresholds, market_data_cache, checkpoint_every,
+                    initial_capital, max_positions, strict_mode, use_index_filter, **engine_kwargs):
+    """
+    对每个质量阈值运行组合回测（支持断点续跑）
+    
+    已完成的阈值直接取断点中的结果；进行中的阈值恢复引擎状态后从保存的日期下标继续撮合。
+    """
     # 对每个质量阈值运行组合回测
     print(f"\n[3/3] 开始多组参数回测...")
     
-    results = []
+    market_data, sorted_dates, total_buy_signals = PortfolioBacktester.build_market_data(
+        market_data_cache, strict_mode=strict_mode
+    )
+    signal_col = 'buy_signal_strict' if strict_mode else 'buy_signal'
+    print(f"DEBUG: 数据转换完成，共发现 {total_buy_signals} 个原始买入信号 (严格模式: {strict_mode}, 信号列: {signal_col})")
+    if total_buy_signals == 0:
+        print("警告: 没有任何股票产生买入信号，请检查策略逻辑或严格模式设置！")
+    
+    results = state['results']
     
     for q in quality_thresholds:
+        if q in state['done_thresholds']:
+            print(f"\n>>> 最小质量分 {q} 已在断点中完成，跳过")
+            continue
+        
         print(f"\n>>> 正在回测: 最小质量分 {q} ...")
         
         engine = PortfolioBacktester(
             initial_capital=initial_capital,
             max_stocks=max_positions,
-            stop_loss=stop_loss,
-            take_profit=take_profit,
-            trailing_stop=trailing_stop,
-            layered_tp=layered_tp,
-            pyramid_enabled=pyramid_enabled,
             strict_mode=strict_mode,
             use_index_filter=use_index_filter,
-            index_filter_mode=index_filter_mode,
-            index_min_strength=index_min_strength,
-            use_atr_stop=use_atr_stop,
-            atr_multiplier=atr_multiplier,
-            use_drawdown_exit=use_drawdown_exit,  # 🆕 回撤止盈
-            drawdown_threshold=drawdown_threshold,  # 🆕 回撤阈值
-            min_profit_for_drawdown=min_profit_for_drawdown  # 🆕 最低盈利要求
+            **engine_kwargs
         )
-        
-        equity_curve, trades = engine.run_with_cache(market_data_cache, min_quality=q)
-        
-        # 打印指数过滤统计
-        if use_index_filter:
-            stats = engine.index_filter_stats
-            if stats['total_signals'] > 0:
-                filter_rate = (stats['filtered_by_index'] / stats['total_signals']) * 100
-                print(f"  指数过滤统计: 总信号 {stats['total_signals']}, 被过滤 {stats['filtered_by_index']} ({filter_rate:.1f}%), 通过 {stats['passed_index_filter']}")
-        
-        if not equity_curve:
-            print("  无交易产生。")
-            continue
-            
-        final_equity = equity_curve[-1]['equity']
-        total_return = (final_equity - initial_capital) / initial_capital * 100
-        
-        # 计算最大回撤
-        eq_series = pd.Series([x['equity'] for x in equity_curve])
-        running_max = eq_series.expanding().max()
-        drawdowns = (eq_series - running_max) / running_max * 100
-        max_dd = drawdowns.min()
-        
-        results.append({
-            'threshold': q,
-            'return': total_return,
-            'max_dd': max_dd,
-            'final_equity': final_equity,
-            'trades': len(trades)
-        })
-        
-        print(f"  最终权益: {final_equity:,.0f} (收益率 {total_return:.2f}%)")
-        print(f"  最大回撤: {max_dd:.2f}%")
-        
-        # 保存详情
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        
-        # 保存权益曲线
-        equity_file = f"equity_q{q}_{timestamp}.csv"
-        pd.DataFrame(equity_curve).to_csv(equity_file, index=False)
-        
-        # 保存交易记录
-        if trades:
-            trades_file = f"trades_q{q}_{timestamp}.csv"
-            trades_df = pd.DataFrame(trades)
+        engine.prepare_sector_filter(market_data_cache)
+        
+        start_index = 0
+        if state['current_threshold'] == q and state['engine_state'] is not None:
+            engine_state = dict(state['engine_state'], **checkpoint.load_ledger(q, state.get('ledger')))
+            if engine.index_filter is not None:
+                engine_state.setdefault('index_data_cache', checkpoint.load_index_cache())
+            engine.set_state(engine_state)
+            start_index = state['date_index']
+            print(f"  从第 {start_index}/{len(sorted_dates)} 个交易日继续")
+        else:
+            state['ledger'] = None
+        state['current_threshold'] = q
+        
+        step = checkpoint_every if checkpoint_every else len(sorted_dates)
+        for i in range(start_index, len(sorted_dates), max(step, 1)):
+            engine.run_on_market_data(market_data, sorted_dates[i:i + step], min_quality=q)
+            if checkpoint_every:
+                # 断点只保存现金、持仓和运行记录的行数；新增的记录行、变化的指数缓存另存
+                state['engine_state'] = engine.get_state(ledger=False, index_cache=False)
+                state['ledger'] = checkpoint.append_ledger(q, engine, state['ledger'])
+                if engine.index_filter is not None:
+                    checkpoint.save_index_cache(engine.index_filter.index_data_cache)
+                state['date_index'] = min(i + step, len(sorted_dates))
+                checkpoint.save(state)
+        
+        _report_threshold(engine, q, initial_capital, use_index_filter, results)
+        _finish_threshold(state, checkpoint, q, checkpoint_every, engine)
+    
+    return results
+
+
+def _report_threshold(engine, q, initial_capital, use_index_filter, results, file_prefix=""):
+    """打印单个质量阈值的回测结果，追加到 results 并保存权益曲线和交易记录"""
+    equity_curve, trades = engine.equity_curve, engine.trades
+    # 打印指数过滤统计
+    if use_index_filter:
+        stats = engine.index_filter_stats
+        if stats['total_signals'] > 0:
+            filter_rate = (stats['filtered_by_index'] / stats['total_signals']) * 100
+            print(f"  指数过滤统计: 总信号 {stats['total_signals']}, 被过滤 {stats['filtered_by_index']} ({filter_rate:.1f}%), 通过 {stats['passed_index_filter']}")
+    
+    if not equity_curve:
+        print("  无交易产生。")
+        return
+        
+    traded_amount = float(sum(abs(t.get('amount', 0)) for t in trades))
+    perf = equity_metrics(
+        [x['equity'] for x in equity_curve], initial_capital,
+        position_count=[x['position_count'] for x in equity_curve], traded_amount=traded_amount
+    )
+    final_equity = perf['final_equity']
+    total_return = perf['total_return']
+    max_dd = perf['max_drawdown']
+    
+    results.append({
+        'threshold': q,
+        'return': total_return,
+        'max_dd': max_dd,
+        'final_equity': final_equity,
+        'trades': len(trades),
+        'sharpe': perf['sharpe'],
+        'calmar': perf['calmar'],
+        'metrics': perf
+    })
+    
+    print(f"  最终权益: {final_equity:,.0f} (收益率 {total_return:.2f}%, 年化 {perf['cagr']:.2f}%)")
+    print(f"  最大回撤: {max_dd:.2f}% (持续 {perf['max_drawdown_duration']} 个交易日)")
+    print(f"  波动率: {perf['volatility']:.2f}% | 夏普: {perf['sharpe']:.2f} | 索提诺: {perf['sortino']:.2f} | "
+          f"卡玛: {perf['calmar']:.2f} | 持仓占比: {perf['exposure']:.1f}% | 年化换手: {perf['turnover']:.1f}倍")
+    
+    # 保存详情
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    
+    # 保存权益曲线
+    equity_file = f"{file_prefix}equity_q{q}_{timestamp}.csv"
+    pd.DataFrame(equity_curve).to_csv(equity_file, index=False)
+    
+    # 保存交易记录
+    if trades:
+        trades_file = f"{file_prefix}trades_q{q}_{timestamp}.csv"
+        trades_df = pd.DataFrame(trades)
+        
+        # 添加额外的分析列
+        if 'profit' in trades_df.columns:
+            # 计算累计收益
+            trades_df['cumulative_profit'] = trades_df['profit'].fillna(0).cumsum()
             
-            # 添加额外的分析列
-            if 'profit' in trades_df.columns:
-                # 计算累计收益
-                trades_df['cumulative_profit'] = trades_df['profit'].fillna(0).cumsum()
+            # 计算胜率（仅统计卖出交易）
+            sell_trades = trades_df[trades_df['action'] == 'SELL']
+            if len(sell_trades) > 0:
+                # 退出原因去掉括号中的明细（峰值、回撤幅度等）后分组
+                reasons = sell_trades['reason'].fillna('').astype(str).str.split('(').str[0].to_numpy()
+                stats = trade_metrics(sell_trades['profit_pct'].to_numpy(), exit_reason=reasons,
+                                      profit=sell_trades['profit'].to_numpy())
+                avg_profit = sell_trades['profit'].mean()
                 
-                # 计算胜率（仅统计卖出交易）
-                sell_trades = trades_df[trades_df['action'] == 'SELL'].copy()
-                if len(sell_trades) > 0:
-                    win_trades = len(sell_trades[sell_trades['profit'] > 0])
-                    win_rate = (win_trades / len(sell_trades)) * 100
-                    avg_profit = sell_trades['profit'].mean()
-                    avg_profit_pct = sell_trades['profit_pct'].mean()
-                    
-                    print(f"  交易统计: 胜率 {win_rate:.1f}%, 平均收益 {avg_profit:.2f} ({avg_profit_pct:.2f}%)")
-            
-            trades_df.to_csv(trades_file, index=False, encoding='utf-8-sig')
-            print(f"  已保存: {equity_file}, {trades_file}")
+                print(f"  交易统计: 胜率 {stats['win_rate']:.1f}%, 平均收益 {avg_profit:.2f} ({stats['avg_profit']:.2f}%), "
+                      f"利润因子 {stats['profit_factor']:.2f}")
+                if stats['exit_reasons']:
+                    print(f"  退出原因: {format_exit_reasons(stats['exit_reasons'])}")
         
-    # 汇总对比
-    print("\n" + "="*60)
-    print("最终回测对比 (资金池模式)")
-    print("="*60)
-    print(f"{'阈值':<10} | {'总收益率':<15} | {'最大回撤':<15} | {'交易数':<10}")
-    print("-" * 60)
+        trades_df.to_csv(trades_file, index=False, encoding='utf-8-sig')
+        print(f"  已保存: {equity_file}, {trades_file}")
+
+
+def _finish_threshold(state, checkpoint, q, checkpoint_every, engine):
+    """标记阈值完成并保存断点（引擎终态单独写入一次，不放在断点文件中）"""
+    final_state = engine.get_state()
+    state['done_thresholds'].append(q)
+    state.setdefault('final_states', {})[q] = final_state
+    state['current_threshold'] = None
+    state['engine_state'] = None
+    state['ledger'] = None
+    state['date_index'] = 0
+    if checkpoint_every:
+        checkpoint.save_final_state(q, final_state)
+        checkpoint.save(state)
+        checkpoint.clear_ledger(q)
+
+
+# 追加回测时用于计算新交易日信号的预热K线数量
+WARMUP_BARS = 250
+
+
+def save_run_state(state_file, config, stock_list, market_data_cache, final_states):
+    """
+    保存回测结束时的运行状态，供 extend_backtest 追加新交易日
+    
+    内容：回测配置、股票列表、最后回测日期、各质量阈值的引擎终态（含权益曲线和交易记录），
+    以及每只股票最近 WARMUP_BARS 根原始K线（追加时用作指标预热）。
+    """
+    last_date = None
+    tails = {}
+    for code, item in market_data_cache.items():
+        df = item['data']
+        if len(df) == 0:
+            continue
+        tails[code] = {
+            'name': item['name'],
+            'bars': df[['open', 'high', 'low', 'close', 'volume']].tail(WARMUP_BARS).copy()
+        }
+        code_last = df.index[-1].strftime('%Y-%m-%d')
+        if last_date is None or code_last > last_date:
+            last_date = code_last
+    
+    run_state = {
+        'config': config,
+        'stock_list': stock_list,
+        'last_date': last_date,
+        'tails': tails,
+        'final_states': final_states,
+        'saved_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    state_dir = os.path.dirname(state_file)
+    if state_dir and not os.path.exists(state_dir):
+        os.makedirs(state_dir)
+    tmp_path = state_file + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(run_state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, state_file)
+    print(f"\n运行状态已保存: {state_file} (回测截止 {last_date})")
+    return run_state
+
+
+def _engine_kwargs_from_config(config):
+    """由回测配置还原 PortfolioBacktester 的构造参数"""
+    return {
+        'initial_capital': config['initial_capital'],
+        'max_stocks': config['max_positions'],
+        'stop_loss': config['stop_loss'],
+        'take_profit': config['take_profit'],
+        'trailing_stop': config['trailing_stop'],
+        'layered_tp': config['layered_tp'],
+        'pyramid_enabled': config['pyramid_enabled'],
+        'strict_mode': config['strict_mode'],
+        'use_index_filter': config['use_index_filter'],
+        'index_filter_mode': config['index_filter_mode'],
+        'index_min_strength': config['index_min_strength'],
+        'use_atr_stop': config['use_atr_stop'],
+        'atr_multiplier': config['atr_multiplier'],
+        'use_drawdown_exit': config['use_drawdown_exit'],
+        'drawdown_threshold': config['drawdown_threshold'],
+        'min_profit_for_drawdown': config['min_profit_for_drawdown'],
+        'use_sector_filter': config.get('use_sector_filter', False),
+        'sector_min_members': config.get('sector_min_members', 3),
+    }
+
+
+def extend_backtest(state_file, fetch_days=None, db_path=None):
+    """
+    追加回测：载入 save_run_state 保存的状态，只撮合上次截止日之后的新交易日
+    
+    新交易日的信号在"预热K线 + 新K线"的短窗口上计算，不重算全部历史；
+    引擎从保存的终态（现金、持仓、权益曲线、交易记录）继续，结束后更新状态文件。
+    
+    Args:
+        state_file: 运行状态文件
+        fetch_days: 下载最近多少个自然日的数据（默认按上次截止日自动计算）
+        db_path: 把追加后的结果写入该 SQLite 数据库（见 trade_db.py）
+    """
+    with open(state_file, 'rb') as f:
+        run_state = pickle.load(f)
+    
+    config = run_state['config']
+    last_date = run_state['last_date']
+    strict_mode = config['strict_mode']
+    
+    print("=" * 100)
+    print("QQE趋势策略追加回测")
+    print("=" * 100)
+    print(f"状态文件: {state_file} (保存于 {run_state.get('saved_at')})")
+    print(f"上次截止: {last_date} | 股票数: {len(run_state['tails'])} | 阈值: {sorted(run_state['final_states'])}")
+    print("=" * 100)
+    
+    if fetch_days is None:
+        fetch_days = (datetime.now() - datetime.strptime(last_date, '%Y-%m-%d')).days + 10
+    
+    # 1. 只为新交易日计算信号
+    print("\n[1/2] 下载新K线并计算信号...")
+    market_data_cache = {}
+    tails = run_state['tails']
+    for i, (code, item) in enumerate(tails.items()):
+        print(f"\r下载进度: {i+1}/{len(tails)}", end='', flush=True)
+        try:
+            df = StockDataLoader.get_stock_data(code, days=fetch_days)
+        except Exception:
+            continue
+        if df is None or len(df) == 0:
+            continue
+        new_bars = df[df.index > pd.Timestamp(last_date)][['open', 'high', 'low', 'close', 'volume']]
+        if len(new_bars) == 0:
+            continue
+        window = pd.concat([item['bars'], new_bars])
+        result = qqe_trend_strategy(window, strict_mode=strict_mode, enhanced_entry=config['enhanced_entry'])
+        market_data_cache[code] = {
+            'name': item['name'],
+            'data': result[result.index > pd.Timestamp(last_date)]
+        }
+        item['bars'] = window.tail(WARMUP_BARS)
+    print()
+    
+    market_data, new_dates, total_buy_signals = PortfolioBacktester.build_market_data(
+        market_data_cache, strict_mode=strict_mode
+    )
+    if not new_dates:
+        print(f"没有 {last_date} 之后的新交易日，无需追加。")
+        return []
+    print(f"新交易日: {new_dates[0]} ~ {new_dates[-1]} ({len(new_dates)}天), 新买入信号 {total_buy_signals} 个")
+    
+    # 2. 从保存的引擎终态继续撮合
+    print("\n[2/2] 追加撮合...")
+    results = []
+    engine_kwargs = _engine_kwargs_from_config(config)
+    for q, engine_state in sorted(run_state['final_states'].items()):
+        print(f"\n>>> 最小质量分 {q} ...")
+        engine = PortfolioBacktester(**engine_kwargs)
+        # 指数数据需要重新获取（旧缓存不含新交易日）
+        engine.set_state({k: v for k, v in engine_state.items() if k != 'index_data_cache'})
+        engine.prepare_sector_filter({code: {'data': item['bars']} for code, item in tails.items()})
+        engine.run_on_market_data(market_data, new_dates, min_quality=q)
+        _report_threshold(engine, q, config['initial_capital'], config['use_index_filter'], results)
+        run_state['final_states'][q] = engine.get_state()
+    
+    run_state['last_date'] = new_dates[-1]
+    run_state['saved_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    tmp_path = state_file + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(run_state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, state_file)
+    print(f"\n运行状态已更新: {state_file} (回测截止 {new_dates[-1]})")
+    
+    if db_path:
+        record_backtest_results(db_path, 'backtest_extend', config, results, run_state['final_states'])
+    
+    print("\n" + "="*72)
+    print(f"追加后回测对比 (截止 {new_dates[-1]})")
+    print("="*72)
+    print(f"{'阈值':<10} | {'总收益率':<15} | {'最大回撤':<15} | {'夏普':<8} | {'交易数':<10}")
+    print("-" * 72)
     for res in results:
-        print(f"{res['threshold']:<10} | {res['return']:<14.2f}% | {res['max_dd']:<14.2f}% | {res['trades']:<10}")
-    print("="*60)
+        print(f"{res['threshold']:<10} | {res['return']:<14.2f}% | {res['max_dd']:<14.2f}% | "
+              f"{res.get('sharpe', 0):<8.2f} | {res['trades']:<10}")
+    print("="*72)
+    return results
+
 
 def main():
     parser = argparse.ArgumentParser(description='QQE趋势策略回测系统')
@@ -1274,15 +1697,28 @@ def main():
     parser.add_argument('--index-filter-mode', type=str, default='moderate', choices=['simple', 'moderate', 'strict'], 
                        help='指数过滤模式: simple(简单均线), moderate(多均线), strict(QQE)')
     parser.add_argument('--index-min-strength', type=int, default=60, help='指数最小趋势强度(0-100)')
+    parser.add_argument('--sector-filter', action='store_true', help='按个股所属行业的等权合成指数过滤（需配合 --use-index-filter）')
+    parser.add_argument('--sector-min-members', type=int, default=3, help='行业成分股少于该数量时使用大盘指数')
     parser.add_argument('--use-atr-stop', action='store_true', help='启用ATR动态止损（替代固定止损比例）')
     parser.add_argument('--atr-multiplier', type=float, default=2.0, help='ATR止损倍数（默认2.0，即入场价-2*ATR）')
     parser.add_argument('--use-drawdown-exit', action='store_true', help='启用回撤止盈（基于持仓期最高价）')
     parser.add_argument('--drawdown-threshold', type=float, default=0.08, help='回撤止盈阈值（默认0.08即8%回撤）')
     parser.add_argument('--min-profit-for-drawdown', type=float, default=0.05, help='启用回撤止盈的最低盈利（默认5%）')
     parser.add_argument('--delay', type=float, default=0.1, help='请求间隔')
+    parser.add_argument('--resume', action='store_true', help='从上次中断的断点继续（参数需与上次一致）')
+    parser.add_argument('--checkpoint-every', type=int, default=20, help='每撮合多少个交易日保存一次断点（0=不保存）')
+    parser.add_argument('--checkpoint-dir', type=str, default='checkpoints', help='断点文件目录')
+    parser.add_argument('--save-state', type=str, help='回测结束后保存运行状态到该文件（供 --extend 使用）')
+    parser.add_argument('--extend', type=str, help='载入运行状态文件，只回测上次截止日之后的新交易日')
+    parser.add_argument('--db', type=str, help='把回测结果写入 SQLite 数据库（如 trade_ledger.db，见 trade_db.py）')
     
     args = parser.parse_args()
     
+    # 追加模式：配置全部来自状态文件
+    if args.extend:
+        extend_backtest(args.extend, db_path=args.db)
+        return
+    
     strict_mode = not args.no_strict
     
     # 智能默认：非严格模式下默认阈值为0，严格模式下保持原默认值
@@ -1334,7 +1770,14 @@ def main():
         atr_multiplier=args.atr_multiplier,
         use_drawdown_exit=args.use_drawdown_exit,  # 🆕 回撤止盈
         drawdown_threshold=args.drawdown_threshold,  # 🆕 回撤阈值
-        min_profit_for_drawdown=args.min_profit_for_drawdown  # 🆕 最低盈利
+        min_profit_for_drawdown=args.min_profit_for_drawdown,  # 🆕 最低盈利
+        use_sector_filter=args.sector_filter,
+        sector_min_members=args.sector_min_members,
+        resume=args.resume,
+        checkpoint_every=args.checkpoint_every,
+        checkpoint_dir=args.checkpoint_dir,
+        state_file=args.save_state,
+        db_path=args.db
     )
 
 
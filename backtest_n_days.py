@@ -1,14 +1,16 @@
 """
 N天延迟回测系统
 发现买入信号后，第buy_delay天买入，持有hold_days天后卖出
-支持批量测试不同参数组合的效果
+支持批量测试不同参数组合的效果，以及共用资金账户的组合回测（--portfolio）
 """
 import baostock as bs
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 from qqe_trend_strategy import qqe_trend_strategy
+from metrics import column, drawdown_stats, equity_metrics, trade_metrics, format_exit_reasons
 import argparse
+import heapq
 import json
 from typing import List, Dict, Tuple, Optional
 import time
@@ -22,8 +24,13 @@ class NDayBacktester:
     - 检测到买入信号后，在第buy_delay个交易日买入
     - 买入后持有hold_days个交易日卖出
     - buy_delay和hold_days可分别配置
+    - backtest_stock 逐股独立回测；backtest_portfolio 共用资金账户、限制最大持仓数
     """
     
+    TRADE_COLUMNS = ['stock_code', 'stock_name', 'signal_date', 'buy_date', 'buy_price', 'buy_cost',
+                     'sell_date', 'sell_price', 'sell_net', 'profit_pct', 'hold_days', 'signal_quality',
+                     'buy_delay', 'exit_reason']
+    
     def __init__(self, 
                  buy_delay: int = 3,
                  hold_days: int = 5,
@@ -68,7 +75,8 @@ class NDayBacktester:
             'executed_buys': 0,
             'executed_sells': 0,
             'skipped_no_data': 0,
-            'skipped_insufficient_funds': 0
+            'skipped_insufficient_funds': 0,
+            'skipped_max_positions': 0
         }
     
     def reset(self):
@@ -83,7 +91,8 @@ class NDayBacktester:
             'executed_buys': 0,
             'executed_sells': 0,
             'skipped_no_data': 0,
-            'skipped_insufficient_funds': 0
+            'skipped_insufficient_funds': 0,
+            'skipped_max_positions': 0
         }
     
     def backtest_stock(self, stock_code: str, stock_name: str, stock_data: pd.DataFrame) -> List[Dict]:
@@ -98,215 +107,340 @@ class NDayBacktester:
         Returns:
             交易记录列表
         """
+        return self.backtest_stock_table(stock_code, stock_name, stock_data).to_dict('records')
+    
+    def backtest_stock_table(self, stock_code: str, stock_name: str, stock_data: pd.DataFrame) -> pd.DataFrame:
+        """
+        对单只股票进行回测，交易记录以表格返回（每列一个字段）
+        
+        买卖点由信号下标直接推算，不逐日模拟，见 schedule_trades。
+        """
         if stock_data is None or len(stock_data) < (self.buy_delay + self.hold_days) + 10:
-            return []
+            return pd.DataFrame(columns=self.TRADE_COLUMNS)
+        
+        prepared = self.prepare_stock(stock_code, stock_name, stock_data)
+        if prepared is None:
+            return pd.DataFrame(columns=self.TRADE_COLUMNS)
+        return self.evaluate_prepared(prepared)
+    
+    def prepare_stock(self, stock_code: str, stock_name: str, stock_data: pd.DataFrame) -> Optional[Dict]:
+        """
+        计算一次策略信号，整理成数组，供不同 (buy_delay, hold_days) 组合重复使用
+        
+        Returns:
+            {'code', 'name', 'dates', 'opens', 'closes', 'signal_idx', 'signal_quality'}，
+            数据不足或计算失败返回 None
+        """
+        if stock_data is None or len(stock_data) == 0:
+            return None
         
         try:
-            # 运行策略获取信号
             result = qqe_trend_strategy(stock_data, strict_mode=self.strict_mode)
-            signal_col = 'buy_signal_strict' if self.strict_mode else 'buy_signal'
+        except Exception as e:
+            print(f"回测 {stock_code} 时出错: {e}")
+            return None
+        
+        signal_col = 'buy_signal_strict' if self.strict_mode else 'buy_signal'
+        has_signal = result[signal_col].to_numpy() == True
+        if self.strict_mode:
+            if 'signal_quality' in result.columns:
+                quality = result['signal_quality'].to_numpy(dtype=float)
+            else:
+                quality = np.zeros(len(result))
+        else:
+            quality = np.full(len(result), 100)
+        
+        # 质量过滤
+        signal_idx = np.flatnonzero(has_signal & (quality >= self.min_quality))
+        
+        return {
+            'code': stock_code,
+            'name': stock_name,
+            'dates': result.index,
+            'opens': result['open'].to_numpy(dtype=float),
+            'closes': result['close'].to_numpy(dtype=float),
+            'signal_idx': signal_idx,
+            'signal_quality': quality[signal_idx]
+        }
+    
+    def schedule_trades(self, prepared: Dict, buy_delay: int, hold_days: int) -> Tuple[np.ndarray, ...]:
+        """
+        按信号下标推算每笔交易的买入/卖出K线（单股同一时间只持有一仓）
+        
+        规则与逐日模拟一致：
+        - 信号当日登记买入计划，第 max(buy_delay, 1) 根K线开盘买入；登记期间和持仓期间的新信号忽略
+        - 资金不足一手时放弃本次买入，买入当日的信号可以重新登记
+        - 买入后第 max(hold_days, 1) 根K线开盘卖出（最多到最后一根K线）；卖出当日的信号可以重新登记
+        - 在最后一根K线买入的持仓按收盘价计为未平仓
+        
+        Returns:
+            (信号序号, 买入下标, 卖出下标, 是否未平仓) 四个数组
+        """
+        opens = prepared['opens']
+        n = len(opens)
+        
+        signal_nums, buys, sells, still_open = [], [], [], []
+        if n < (buy_delay + hold_days) + 10:
+            return (np.array(signal_nums, dtype=int), np.array(buys, dtype=int),
+                    np.array(sells, dtype=int), np.array(still_open, dtype=bool))
+        
+        # 每根K线开盘能否买入至少一手
+        buy_cost = opens * (1 + self.slippage + self.commission)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            can_buy = np.floor(self.initial_capital * self.position_size / buy_cost / 100) * 100 >= 100
+        
+        signal_idx = prepared['signal_idx']
+        free = 0  # 从该K线起可以登记新的买入计划
+        k = int(np.searchsorted(signal_idx, free))
+        
+        while k < len(signal_idx):
+            i = int(signal_idx[k])
+            if i + buy_delay >= n:
+                break
+            b = i + max(buy_delay, 1)
+            if b >= n:
+                break
             
-            # 获取所有交易日列表
-            dates = result.index.tolist()
-            date_to_idx = {d: i for i, d in enumerate(dates)}
+            if not can_buy[b]:
+                free = b
+            elif b == n - 1:
+                signal_nums.append(k)
+                buys.append(b)
+                sells.append(n - 1)
+                still_open.append(True)
+                break
+            else:
+                s = min(b + max(hold_days, 1), n - 1)
+                signal_nums.append(k)
+                buys.append(b)
+                sells.append(s)
+                still_open.append(False)
+                free = s
             
-            stock_trades = []
-            pending_buy = None  # 待执行的买入订单
-            position = None     # 当前持仓
+            self.stats['total_signals'] += 1
+            k = int(np.searchsorted(signal_idx, free))
+        
+        return (np.array(signal_nums, dtype=int), np.array(buys, dtype=int),
+                np.array(sells, dtype=int), np.array(still_open, dtype=bool))
+    
+    def evaluate_prepared(self, prepared: Dict, buy_delay: Optional[int] = None,
+                          hold_days: Optional[int] = None) -> pd.DataFrame:
+        """
+        在预计算的信号数组上回测一组 (buy_delay, hold_days)，返回交易表（每列一个字段）
+        
+        列与 backtest_stock 的交易记录相同；hold_days 列为参数值。数据不足
+        (buy_delay + hold_days) + 10 根K线时没有交易。
+        """
+        buy_delay = self.buy_delay if buy_delay is None else buy_delay
+        hold_days = self.hold_days if hold_days is None else hold_days
+        
+        signal_nums, buys, sells, still_open = self.schedule_trades(prepared, buy_delay, hold_days)
+        opens, closes, dates = prepared['opens'], prepared['closes'], prepared['dates']
+        
+        buy_price = opens[buys]
+        buy_cost = buy_price * (1 + self.slippage + self.commission)
+        sell_price = np.where(still_open, closes[sells], opens[sells])
+        sell_net = sell_price * (1 - self.slippage - self.commission)
+        
+        return pd.DataFrame({
+            'stock_code': prepared['code'],
+            'stock_name': prepared['name'],
+            'signal_date': dates[prepared['signal_idx'][signal_nums]],
+            'buy_date': dates[buys],
+            'buy_price': buy_price,
+            'buy_cost': buy_cost,
+            'sell_date': dates[sells],
+            'sell_price': sell_price,
+            'sell_net': sell_net,
+            'profit_pct': (sell_net - buy_cost) / buy_cost * 100,
+            'hold_days': hold_days,
+            'signal_quality': prepared['signal_quality'][signal_nums],
+            'buy_delay': buy_delay,
+            'exit_reason': np.where(still_open, 'open', 'time_exit')
+        })
+    
+    def backtest_portfolio(self, prepared_stocks: List[Dict], max_positions: int = 5) -> Tuple[pd.DataFrame, List[Dict]]:
+        """
+        组合回测：全部股票共用一个资金账户，同时最多持有 max_positions 只
+        
+        买卖点规则与单股回测相同（信号后第 buy_delay 根K线开盘买入，持有 hold_days 根K线开盘卖出，
+        单股同一时间只持有一仓）。待买入和待卖出按日期放进一个事件队列，按事件推进而不是逐日逐股扫描：
+        - 同一天先卖出（回收资金），再按信号质量从高到低买入，最后处理数据结束时的未平仓
+        - 每仓目标金额 = 初始资金 × position_size / max_positions，不超过当前现金，按整手买入
+        - 持仓已满或资金不足一手时放弃本次买入，该股从买入当日起重新等待信号
+        
+        Args:
+            prepared_stocks: prepare_stock 的返回值列表
+            max_positions: 最大同时持仓数
             
-            for i, current_date in enumerate(dates):
-                current_row = result.loc[current_date]
-                
-                # 1. 检查是否需要执行卖出（持有N天到期）
-                if position is not None:
-                    if current_date >= position['planned_sell_date']:
-                        # 执行卖出
-                        sell_price = current_row['open']  # 以开盘价卖出
-                        sell_net = sell_price * (1 - self.slippage - self.commission)
-                        
-                        buy_cost = position['buy_cost']
-                        profit_pct = (sell_net - buy_cost) / buy_cost * 100
-                        hold_days = (current_date - position['buy_date']).days
-                        
-                        trade = {
-                            'stock_code': stock_code,
-                            'stock_name': stock_name,
-                            'signal_date': position['signal_date'],
-                            'buy_date': position['buy_date'],
-                            'buy_price': position['buy_price'],
-                            'buy_cost': buy_cost,
-                            'sell_date': current_date,
-                            'sell_price': sell_price,
-                            'sell_net': sell_net,
-                            'profit_pct': profit_pct,
-                            'hold_days': hold_days,
-                            'signal_quality': position['signal_quality'],
-                            'buy_delay': self.buy_delay,
-                            'hold_days': self.hold_days,
-                            'exit_reason': 'time_exit'
-                        }
-                        stock_trades.append(trade)
-                        position = None
-                
-                # 2. 检查是否需要执行买入（信号后第N天）
-                if pending_buy is not None and current_date >= pending_buy['planned_buy_date']:
-                    # 检查是否还有持仓（单股回测一次只持有一仓）
-                    if position is None:
-                        # 执行买入
-                        buy_price = current_row['open']  # 以开盘价买入
-                        buy_cost = buy_price * (1 + self.slippage + self.commission)
-                        
-                        # 计算可买入股数
-                        position_value = self.initial_capital * self.position_size
-                        shares = int(position_value / buy_cost / 100) * 100
-                        
-                        if shares >= 100:
-                            # 计算计划卖出日期
-                            sell_idx = i + self.hold_days
-                            if sell_idx < len(dates):
-                                planned_sell_date = dates[sell_idx]
-                            else:
-                                planned_sell_date = dates[-1]
-                            
-                            position = {
-                                'shares': shares,
-                                'buy_price': buy_price,
-                                'buy_cost': buy_cost,
-                                'buy_date': current_date,
-                                'planned_sell_date': planned_sell_date,
-                                'signal_date': pending_buy['signal_date'],
-                                'signal_quality': pending_buy['signal_quality']
-                            }
-                    
-                    pending_buy = None
-                
-                # 3. 检查是否有新的买入信号
-                if position is None and pending_buy is None:
-                    has_signal = bool(current_row[signal_col])
-                    
-                    if has_signal:
-                        # 质量过滤
-                        quality = current_row.get('signal_quality', 0) if self.strict_mode else 100
-                        
-                        if quality >= self.min_quality:
-                            # 计算计划买入日期（第buy_delay个交易日）
-                            buy_idx = i + self.buy_delay
-                            if buy_idx < len(dates):
-                                planned_buy_date = dates[buy_idx]
-                                
-                                pending_buy = {
-                                    'signal_date': current_date,
-                                    'planned_buy_date': planned_buy_date,
-                                    'signal_quality': quality
-                                }
-                                self.stats['total_signals'] += 1
+        Returns:
+            (交易表, 每日权益曲线)
+        """
+        self.reset()
+        buy_delay, hold_days = self.buy_delay, self.hold_days
+        target_pos_size = self.initial_capital * self.position_size / max_positions
+        
+        # 公共日期轴；每只股票的K线下标映射到公共日期下标
+        stocks = [p for p in prepared_stocks if len(p['opens']) >= (buy_delay + hold_days) + 10]
+        if stocks:
+            all_dates = pd.DatetimeIndex(np.unique(np.concatenate([p['dates'].values for p in stocks])))
+        else:
+            all_dates = pd.DatetimeIndex([])
+        global_idx = [all_dates.searchsorted(p['dates']) for p in stocks]
+        
+        SELL, BUY, CLOSE_OUT = 0, 1, 2
+        events = []  # (公共日期下标, 事件类型, 排序键, 序号, 股票序号, 信号序号, K线下标)
+        seq = 0
+        
+        def push_next_buy(sid, free):
+            """从第 free 根K线起找下一个信号，登记买入事件"""
+            nonlocal seq
+            prepared = stocks[sid]
+            signal_idx = prepared['signal_idx']
+            n = len(prepared['opens'])
+            k = int(np.searchsorted(signal_idx, free))
+            if k >= len(signal_idx):
+                return
+            i = int(signal_idx[k])
+            b = i + max(buy_delay, 1)
+            if i + buy_delay >= n or b >= n:
+                return
+            self.stats['total_signals'] += 1
+            seq += 1
+            heapq.heappush(events, (global_idx[sid][b], BUY, -prepared['signal_quality'][k], seq, sid, k, b))
+        
+        for sid in range(len(stocks)):
+            push_next_buy(sid, 0)
+        
+        cash_delta = np.zeros(len(all_dates))
+        trade_records = []
+        
+        while events:
+            g, kind, _, _, sid, k, bar = heapq.heappop(events)
+            prepared = stocks[sid]
+            code = prepared['code']
+            n = len(prepared['opens'])
             
-            # 如果最后还有持仓，以最后一天的收盘价平仓
-            if position is not None:
-                last_date = dates[-1]
-                last_row = result.loc[last_date]
-                
-                sell_price = last_row['close']
-                sell_net = sell_price * (1 - self.slippage - self.commission)
+            if kind == BUY:
+                price = prepared['opens'][bar]
+                buy_cost = price * (1 + self.slippage + self.commission)
+                available_cash = min(self.cash, target_pos_size)
+                shares = int(available_cash / buy_cost) // 100 * 100 if buy_cost > 0 else 0
                 
-                buy_cost = position['buy_cost']
-                profit_pct = (sell_net - buy_cost) / buy_cost * 100
-                hold_days = (last_date - position['buy_date']).days
+                if len(self.positions) >= max_positions or shares < 100:
+                    if len(self.positions) >= max_positions:
+                        self.stats['skipped_max_positions'] += 1
+                    else:
+                        self.stats['skipped_insufficient_funds'] += 1
+                    push_next_buy(sid, bar)
+                    continue
                 
-                trade = {
-                    'stock_code': stock_code,
-                    'stock_name': stock_name,
-                    'signal_date': position['signal_date'],
-                    'buy_date': position['buy_date'],
-                    'buy_price': position['buy_price'],
+                self.cash -= shares * buy_cost
+                cash_delta[g] -= shares * buy_cost
+                self.stats['executed_buys'] += 1
+                self.positions[code] = {
+                    'shares': shares,
+                    'buy_price': price,
                     'buy_cost': buy_cost,
-                    'sell_date': last_date,
-                    'sell_price': sell_price,
-                    'sell_net': sell_net,
-                    'profit_pct': profit_pct,
-                    'hold_days': hold_days,
-                    'signal_quality': position['signal_quality'],
-                    'buy_delay': self.buy_delay,
-                    'hold_days': self.hold_days,
-                    'exit_reason': 'open'
+                    'buy_bar': bar,
+                    'signal_num': k
                 }
-                stock_trades.append(trade)
-            
-            return stock_trades
-            
-        except Exception as e:
-            print(f"回测 {stock_code} 时出错: {e}")
-            return []
+                
+                seq += 1
+                if bar == n - 1:
+                    heapq.heappush(events, (g, CLOSE_OUT, 0, seq, sid, k, bar))
+                else:
+                    sell_bar = min(bar + max(hold_days, 1), n - 1)
+                    heapq.heappush(events, (global_idx[sid][sell_bar], SELL, 0, seq, sid, k, sell_bar))
+            else:
+                position = self.positions.pop(code)
+                sell_price = prepared['closes'][bar] if kind == CLOSE_OUT else prepared['opens'][bar]
+                sell_net = sell_price * (1 - self.slippage - self.commission)
+                self.cash += position['shares'] * sell_net
+                cash_delta[g] += position['shares'] * sell_net
+                self.stats['executed_sells'] += 1
+                
+                trade_records.append((sid, position['signal_num'], position['buy_bar'], bar,
+                                      position['shares'], position['buy_price'], position['buy_cost'],
+                                      sell_price, sell_net, 'open' if kind == CLOSE_OUT else 'time_exit'))
+                push_next_buy(sid, bar)
+        
+        # 每日权益 = 现金 + 持仓按收盘价（停牌日沿用最近收盘价）计的市值，只遍历持仓区间
+        market_value = np.zeros(len(all_dates))
+        position_count = np.zeros(len(all_dates), dtype=int)
+        for sid, _, buy_bar, sell_bar, shares, *_ in trade_records:
+            days = np.arange(global_idx[sid][buy_bar], global_idx[sid][sell_bar])
+            bars = np.searchsorted(global_idx[sid], days, side='right') - 1
+            np.add.at(market_value, days, shares * stocks[sid]['closes'][bars])
+            np.add.at(position_count, days, 1)
+        cash = self.initial_capital + np.cumsum(cash_delta)
+        equity = cash + market_value
+        
+        self.equity_curve = [
+            {'date': d.strftime('%Y-%m-%d'), 'equity': e, 'cash': c, 'market_value': m, 'position_count': int(pc)}
+            for d, e, c, m, pc in zip(all_dates, equity.tolist(), cash.tolist(), market_value.tolist(), position_count)
+        ]
+        
+        trade_records.sort(key=lambda t: (global_idx[t[0]][t[3]], global_idx[t[0]][t[2]]))
+        self.trades = [{
+            'stock_code': stocks[sid]['code'],
+            'stock_name': stocks[sid]['name'],
+            'signal_date': stocks[sid]['dates'][stocks[sid]['signal_idx'][k]],
+            'buy_date': stocks[sid]['dates'][buy_bar],
+            'buy_price': buy_price,
+            'buy_cost': buy_cost,
+            'sell_date': stocks[sid]['dates'][sell_bar],
+            'sell_price': sell_price,
+            'sell_net': sell_net,
+            'profit_pct': (sell_net - buy_cost) / buy_cost * 100,
+            'hold_days': hold_days,
+            'signal_quality': stocks[sid]['signal_quality'][k],
+            'buy_delay': buy_delay,
+            'exit_reason': exit_reason,
+            'shares': shares,
+            'profit': shares * (sell_net - buy_cost)
+        } for sid, k, buy_bar, sell_bar, shares, buy_price, buy_cost, sell_price, sell_net, exit_reason in trade_records]
+        
+        trades = pd.DataFrame(self.trades, columns=self.TRADE_COLUMNS + ['shares', 'profit'])
+        return trades, self.equity_curve
     
     def calculate_metrics(self, trades: List[Dict]) -> Dict:
         """
-        计算回测指标
+        计算回测指标（见 metrics.py）
         
         Args:
-            trades: 交易记录列表
+            trades: 交易记录列表或交易表
             
         Returns:
-            指标字典
+            指标字典；profit_factor 为 平均盈利/平均亏损（盈亏比），gross_profit_factor 为 总盈利/总亏损，
+            max_drawdown 为按交易顺序累加收益率的回撤（逐股独立回测没有资金曲线）
         """
-        if not trades:
-            return {
-                'total_trades': 0,
-                'win_count': 0,
-                'loss_count': 0,
-                'win_rate': 0,
-                'avg_profit': 0,
-                'total_return': 0,
-                'max_profit': 0,
-                'min_profit': 0,
-                'avg_hold_days': 0
-            }
-        
-        df = pd.DataFrame(trades)
-        
-        total_trades = len(df)
-        profits = df['profit_pct'].values
-        
-        # 胜率
-        win_count = len(df[df['profit_pct'] > 0])
-        loss_count = total_trades - win_count
-        win_rate = win_count / total_trades * 100 if total_trades > 0 else 0
-        
-        # 收益统计
-        avg_profit = np.mean(profits)
-        total_return = np.sum(profits)
-        max_profit = np.max(profits)
-        min_profit = np.min(profits)
-        
-        # 持有天数
-        avg_hold_days = df['hold_days'].mean()
-        
-        # 盈亏比
-        win_profits = df[df['profit_pct'] > 0]['profit_pct']
-        loss_profits = df[df['profit_pct'] <= 0]['profit_pct']
-        avg_win = win_profits.mean() if len(win_profits) > 0 else 0
-        avg_loss = abs(loss_profits.mean()) if len(loss_profits) > 0 else 0
-        profit_factor = avg_win / avg_loss if avg_loss != 0 else 0
+        stats = trade_metrics(column(trades, 'profit_pct', 0.0), column(trades, 'exit_reason'))
         
-        # 最大回撤（简化计算）
-        equity_curve = 100 + np.cumsum(profits)
-        running_max = np.maximum.accumulate(equity_curve)
-        drawdown = (equity_curve - running_max) / running_max * 100
-        max_drawdown = np.min(drawdown)
+        if stats['total_trades'] == 0:
+            hold_days = 0
+            max_drawdown = 0
+        else:
+            hold_days = float(np.mean(column(trades, 'hold_days')))
+            max_drawdown, _ = drawdown_stats(100 + np.cumsum(column(trades, 'profit_pct').astype(float)))
         
         return {
-            'total_trades': total_trades,
-            'win_count': win_count,
-            'loss_count': loss_count,
-            'win_rate': win_rate,
-            'avg_profit': avg_profit,
-            'total_return': total_return,
-            'max_profit': max_profit,
-            'min_profit': min_profit,
-            'avg_hold_days': avg_hold_days,
-            'avg_win': avg_win,
-            'avg_loss': avg_loss,
-            'profit_factor': profit_factor,
-            'max_drawdown': max_drawdown
+            'total_trades': stats['total_trades'],
+            'win_count': stats['win_count'],
+            'loss_count': stats['loss_count'],
+            'win_rate': stats['win_rate'],
+            'avg_profit': stats['avg_profit'],
+            'total_return': stats['total_profit_pct'],
+            'max_profit': stats['max_profit'],
+            'min_profit': stats['min_profit'],
+            'avg_hold_days': hold_days,
+            'avg_win': stats['avg_win'],
+            'avg_loss': stats['avg_loss'],
+            'profit_factor': stats['payoff_ratio'],
+            'max_drawdown': max_drawdown,
+            'median_profit': stats['median_profit'],
+            'gross_profit_factor': stats['profit_factor'],
+            'exit_reasons': stats['exit_reasons']
         }
 
 
@@ -490,7 +624,7 @@ def run_n_day_backtest(buy_delay: int = 3,
         initial_capital: 初始资金
         
     Returns:
-        回测结果字典
+        回测结果字典（trades 为交易表，每列一个字段）
     """
     print(f"\n{'='*80}")
     print(f"N天延迟回测 - 买入延迟{buy_delay}天, 持有{hold_days}天")
@@ -517,7 +651,7 @@ def run_n_day_backtest(buy_delay: int = 3,
     
     # 逐个股票回测
     print("\n[2/3] 执行回测...")
-    all_trades = []
+    trade_tables = []
     
     for i, stock in enumerate(stock_list):
         if (i + 1) % 10 == 0 or i == 0:
@@ -529,14 +663,17 @@ def run_n_day_backtest(buy_delay: int = 3,
             
             if df is not None and len(df) >= (buy_delay + hold_days) + 10:
                 # 执行回测
-                trades = backtester.backtest_stock(stock['code'], stock['name'], df)
-                all_trades.extend(trades)
+                trades = backtester.backtest_stock_table(stock['code'], stock['name'], df)
+                if len(trades) > 0:
+                    trade_tables.append(trades)
         except Exception as e:
             continue
     
     print(f"\n\n[3/3] 计算指标...")
     
     # 计算指标
+    all_trades = (pd.concat(trade_tables, ignore_index=True) if trade_tables
+                  else pd.DataFrame(columns=NDayBacktester.TRADE_COLUMNS))
     metrics = backtester.calculate_metrics(all_trades)
     
     # 打印结果
@@ -565,57 +702,145 @@ def run_n_day_backtest(buy_delay: int = 3,
     }
 
 
-def compare_n_days(buy_delay_list: List[int] = [1, 3, 5],
-                   hold_days_list: List[int] = [5, 10, 15],
-                   board: str = 'chinext+star',
-                   max_stocks: int = 100,
-                   strict_mode: bool = True,
-                   min_quality: int = 60,
-                   history_days: int = 250) -> pd.DataFrame:
+def load_prepared_stocks(stock_list: List[Dict], backtester: NDayBacktester, history_days: int = 250) -> List[Dict]:
     """
-    对比不同参数组合的回测效果（网格搜索）
+    加载股票数据并计算一次信号（NDayBacktester.prepare_stock），失败或无数据的股票跳过
+    """
+    prepared_stocks = []
+    for i, stock in enumerate(stock_list):
+        if (i + 1) % 10 == 0 or i == 0:
+            print(f"\r进度: {i+1}/{len(stock_list)}", end='', flush=True)
+        try:
+            df = StockDataLoader.get_stock_data(stock['code'], days=history_days)
+            prepared = backtester.prepare_stock(stock['code'], stock['name'], df)
+            if prepared is not None:
+                prepared_stocks.append(prepared)
+        except Exception as e:
+            continue
+    return prepared_stocks
+
+
+def run_n_day_portfolio(buy_delay: int = 3,
+                        hold_days: int = 5,
+                        board: str = 'chinext+star',
+                        max_stocks: int = 100,
+                        max_positions: int = 5,
+                        strict_mode: bool = True,
+                        min_quality: int = 60,
+                        history_days: int = 250,
+                        initial_capital: float = 100000) -> Dict:
+    """
+    运行N天延迟组合回测（共用资金账户，限制最大持仓数）
     
     Args:
-        buy_delay_list: 买入延迟天数列表
-        hold_days_list: 持有天数列表
-        board: 板块筛选
-        max_stocks: 最大股票数量
-        strict_mode: 严格模式
-        min_quality: 最低信号质量
-        history_days: 历史数据天数
+        max_positions: 最大同时持仓数
+        其他参数同 run_n_day_backtest
         
     Returns:
-        对比结果DataFrame
+        回测结果字典（trades 为交易表，equity_curve 为每日权益）
     """
     print(f"\n{'='*80}")
-    print("参数组合对比回测（网格搜索）")
+    print(f"N天延迟组合回测 - 买入延迟{buy_delay}天, 持有{hold_days}天, 最大持仓{max_positions}只")
     print(f"{'='*80}")
-    print(f"买入延迟天数: {buy_delay_list}")
-    print(f"持有天数: {hold_days_list}")
-    print(f"总组合数: {len(buy_delay_list) * len(hold_days_list)}")
+    print(f"板块: {board}")
     print(f"股票池: {max_stocks}只")
+    print(f"模式: {'严格模式' if strict_mode else '标准模式'}")
+    print(f"最低质量: {min_quality}")
+    print(f"初始资金: {initial_capital:,.0f}")
+    
+    print("\n[1/3] 获取股票列表...")
+    stock_list = StockDataLoader.get_stock_list(board_filter=board, max_stocks=max_stocks)
+    print(f"共获取 {len(stock_list)} 只股票")
+    
+    backtester = NDayBacktester(
+        buy_delay=buy_delay,
+        hold_days=hold_days,
+        initial_capital=initial_capital,
+        strict_mode=strict_mode,
+        min_quality=min_quality
+    )
+    
+    print("\n[2/3] 加载数据并计算信号...")
+    prepared_stocks = load_prepared_stocks(stock_list, backtester, history_days)
+    
+    print(f"\n\n[3/3] 组合回测...")
+    trades, equity_curve = backtester.backtest_portfolio(prepared_stocks, max_positions=max_positions)
+    metrics = backtester.calculate_metrics(trades)
+    
+    traded_amount = float((trades['shares'] * (trades['buy_cost'] + trades['sell_net'])).sum()) if len(trades) else 0.0
+    portfolio = equity_metrics(
+        [row['equity'] for row in equity_curve], initial_capital,
+        position_count=[row['position_count'] for row in equity_curve], traded_amount=traded_amount
+    )
+    metrics['portfolio_return'] = portfolio['total_return']
+    metrics['portfolio_max_drawdown'] = portfolio['max_drawdown']
+    metrics['final_equity'] = portfolio['final_equity']
+    metrics['portfolio'] = portfolio
+    final_equity = portfolio['final_equity']
+    
+    print(f"\n{'='*80}")
+    print(f"组合回测结果 (买入延迟{buy_delay}天, 持有{hold_days}天, 最大持仓{max_positions}只)")
+    print(f"{'='*80}")
+    print(f"期末权益: {final_equity:,.2f}")
+    print(f"组合收益率: {metrics['portfolio_return']:.2f}%")
+    print(f"组合最大回撤: {metrics['portfolio_max_drawdown']:.2f}% (持续 {portfolio['max_drawdown_duration']} 个交易日)")
+    print(f"年化收益: {portfolio['cagr']:.2f}% | 波动率: {portfolio['volatility']:.2f}% | 夏普: {portfolio['sharpe']:.2f} | "
+          f"索提诺: {portfolio['sortino']:.2f} | 卡玛: {portfolio['calmar']:.2f}")
+    print(f"持仓占比: {portfolio['exposure']:.1f}% | 年化换手: {portfolio['turnover']:.1f}倍")
+    print(f"总交易次数: {metrics['total_trades']}")
+    print(f"胜率: {metrics['win_rate']:.2f}%")
+    print(f"平均收益: {metrics['avg_profit']:.2f}%")
+    print(f"盈亏比: {metrics['profit_factor']:.2f} | 利润因子: {metrics['gross_profit_factor']:.2f}")
+    if metrics['exit_reasons']:
+        print(f"退出原因: {format_exit_reasons(metrics['exit_reasons'])}")
+    print(f"信号: {backtester.stats['total_signals']} | 持仓已满放弃: {backtester.stats['skipped_max_positions']} | "
+          f"资金不足放弃: {backtester.stats['skipped_insufficient_funds']}")
     print(f"{'='*80}\n")
     
-    results = []
-    total_combinations = len(buy_delay_list) * len(hold_days_list)
-    current = 0
+    return {
+        'buy_delay': buy_delay,
+        'hold_days': hold_days,
+        'max_positions': max_positions,
+        'metrics': metrics,
+        'trades': trades,
+        'equity_curve': equity_curve,
+        'stock_count': len(stock_list)
+    }
+
+
+def evaluate_n_day_grid(prepared_stocks: List[Dict],
+                        buy_delay_list: List[int],
+                        hold_days_list: List[int],
+                        initial_capital: float = 100000,
+                        strict_mode: bool = True,
+                        min_quality: int = 60) -> pd.DataFrame:
+    """
+    在预计算的信号上评估 buy_delay × hold_days 网格中的全部组合
+    
+    每个组合只做数组下标运算（不重新加载数据、不重新计算信号），
+    结果与逐个组合调用 run_n_day_backtest 相同。
     
+    Args:
+        prepared_stocks: NDayBacktester.prepare_stock 的返回值列表
+        
+    Returns:
+        对比结果DataFrame（每个组合一行）
+    """
+    results = []
     for buy_delay in buy_delay_list:
         for hold_days in hold_days_list:
-            current += 1
-            print(f"\n[{current}/{total_combinations}] 测试组合: 买入延迟{buy_delay}天, 持有{hold_days}天")
-            
-            result = run_n_day_backtest(
+            backtester = NDayBacktester(
                 buy_delay=buy_delay,
                 hold_days=hold_days,
-                board=board,
-                max_stocks=max_stocks,
+                initial_capital=initial_capital,
                 strict_mode=strict_mode,
-                min_quality=min_quality,
-                history_days=history_days
+                min_quality=min_quality
             )
+            tables = [backtester.evaluate_prepared(prepared) for prepared in prepared_stocks]
+            tables = [t for t in tables if len(t) > 0]
+            trades = pd.concat(tables, ignore_index=True) if tables else []
+            metrics = backtester.calculate_metrics(trades)
             
-            metrics = result['metrics']
             results.append({
                 '买入延迟': buy_delay,
                 '持有天数': hold_days,
@@ -630,8 +855,55 @@ def compare_n_days(buy_delay_list: List[int] = [1, 3, 5],
                 '平均持有(天)': round(metrics['avg_hold_days'], 1)
             })
     
-    # 创建对比表格
-    df_comparison = pd.DataFrame(results)
+    return pd.DataFrame(results)
+
+
+def compare_n_days(buy_delay_list: List[int] = [1, 3, 5],
+                   hold_days_list: List[int] = [5, 10, 15],
+                   board: str = 'chinext+star',
+                   max_stocks: int = 100,
+                   strict_mode: bool = True,
+                   min_quality: int = 60,
+                   history_days: int = 250) -> pd.DataFrame:
+    """
+    对比不同参数组合的回测效果（网格搜索）
+    
+    股票列表、行情数据和策略信号只加载/计算一次，整个网格一次完成。
+    
+    Args:
+        buy_delay_list: 买入延迟天数列表
+        hold_days_list: 持有天数列表
+        board: 板块筛选
+        max_stocks: 最大股票数量
+        strict_mode: 严格模式
+        min_quality: 最低信号质量
+        history_days: 历史数据天数
+        
+    Returns:
+        对比结果DataFrame
+    """
+    print(f"\n{'='*80}")
+    print("参数组合对比回测（网格搜索）")
+    print(f"{'='*80}")
+    print(f"买入延迟天数: {buy_delay_list}")
+    print(f"持有天数: {hold_days_list}")
+    print(f"总组合数: {len(buy_delay_list) * len(hold_days_list)}")
+    print(f"股票池: {max_stocks}只")
+    print(f"{'='*80}\n")
+    
+    # 股票列表、行情和信号只加载/计算一次，所有参数组合共用
+    print("[1/3] 获取股票列表...")
+    stock_list = StockDataLoader.get_stock_list(board_filter=board, max_stocks=max_stocks)
+    print(f"共获取 {len(stock_list)} 只股票")
+    
+    print("\n[2/3] 加载数据并计算信号...")
+    backtester = NDayBacktester(strict_mode=strict_mode, min_quality=min_quality)
+    prepared_stocks = load_prepared_stocks(stock_list, backtester, history_days)
+    
+    print(f"\n\n[3/3] 评估 {len(buy_delay_list) * len(hold_days_list)} 个参数组合...")
+    df_comparison = evaluate_n_day_grid(prepared_stocks, buy_delay_list, hold_days_list,
+                                        strict_mode=strict_mode, min_quality=min_quality)
+    
     
     print("\n" + "="*80)
     print("参数组合对比结果")
@@ -665,6 +937,9 @@ def main():
     parser.add_argument('--min-quality', type=int, default=60, help='最低信号质量')
     parser.add_argument('--history-days', type=int, default=250, help='历史数据天数')
     parser.add_argument('--compare', action='store_true', help='对比模式（网格搜索测试多个参数组合）')
+    parser.add_argument('--portfolio', action='store_true', help='组合模式（共用资金账户，限制最大持仓数）')
+    parser.add_argument('--max-positions', type=int, default=5, help='组合模式的最大持仓数（默认5）')
+    parser.add_argument('--budget', type=float, default=100000, help='初始资金')
     parser.add_argument('--output', type=str, help='输出结果到JSON文件')
     
     args = parser.parse_args()
@@ -686,6 +961,39 @@ def main():
         if args.output:
             results_df.to_json(args.output, orient='records', force_ascii=False, indent=2)
             print(f"\n结果已保存到: {args.output}")
+    elif args.portfolio:
+        # 组合模式
+        result = run_n_day_portfolio(
+            buy_delay=args.buy_delay,
+            hold_days=args.hold_days,
+            board=args.board,
+            max_stocks=args.max_stocks,
+            max_positions=args.max_positions,
+            strict_mode=args.strict,
+            min_quality=args.min_quality,
+            history_days=args.history_days,
+            initial_capital=args.budget
+        )
+        
+        if args.output:
+            output_data = {
+                'config': {
+                    'buy_delay': args.buy_delay,
+                    'hold_days': args.hold_days,
+                    'board': args.board,
+                    'max_stocks': args.max_stocks,
+                    'max_positions': args.max_positions,
+                    'strict_mode': args.strict,
+                    'min_quality': args.min_quality,
+                    'initial_capital': args.budget
+                },
+                'metrics': result['metrics'],
+                'trades_count': len(result['trades']),
+                'equity_curve': result['equity_curve']
+            }
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(output_data, f, ensure_ascii=False, indent=2)
+            print(f"\n结果已保存到: {args.output}")
     else:
         # 单参数组合模式
         result = run_n_day_backtest(
@@ -695,7 +1003,8 @@ def main():
             max_stocks=args.max_stocks,
             strict_mode=args.strict,
             min_quality=args.min_quality,
-            history_days=args.history_days
+            history_days=args.history_days,
+            initial_capital=args.budget
         )
         
         if args.output:
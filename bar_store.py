@@ -0,0 +1,248 @@
+"""
+本地K线存储
+每个代码一个CSV文件，按需增量补齐缺失的日期，股票和指数共用。
+
+- 已下载过的日期不会重复下载，只补齐缺失的更早或更新的区间
+- 每个代码另存一个元数据文件，记录已确认过的日期范围（节假日、停牌、上市前的空白不会反复查询）
+- 登录或下载返回错误码时抛出异常，失败的区间不记入元数据，下次重新下载
+- 写文件先写临时文件再替换，多个进程同时读写同一目录是安全的
+- prefetch 批量更新多个代码，只登录一次
+- keep_in_memory=True 时已读过的K线和元数据留在内存中（常驻进程每轮只下载新的K线，不再读文件）
+"""
+import json
+import os
+from datetime import datetime, timedelta
+
+import baostock as bs
+import pandas as pd
+
+
+class BarStore:
+    """本地增量K线存储"""
+
+    FIELDS = "date,open,high,low,close,volume"
+
+    # 当天的日线收盘后才会发布，此时刻之前不把今天记为"已确认"
+    DAILY_READY_HOUR = 18
+
+    def __init__(self, cache_dir="data_cache", adjustflag="3", keep_in_memory=False):
+        self.cache_dir = cache_dir
+        self.adjustflag = adjustflag
+        self.keep_in_memory = keep_in_memory
+        self._memory = {}  # {code: (DataFrame, meta)}
+        self._session_depth = 0
+        self._logged_in = False
+
+    def _path(self, code):
+        return os.path.join(self.cache_dir, f"{code}.csv")
+
+    def _meta_path(self, code):
+        return os.path.join(self.cache_dir, f"{code}.meta.json")
+
+    def _write_atomic(self, path, write_func):
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        write_func(tmp_path)
+        os.replace(tmp_path, path)
+
+    def load(self, code):
+        """读取本地K线，不存在或损坏时返回 None"""
+        if self.keep_in_memory and code in self._memory:
+            return self._memory[code][0]
+        path = self._path(code)
+        if not os.path.exists(path):
+            return None
+        try:
+            return pd.read_csv(path, index_col='date', parse_dates=['date'])
+        except Exception:
+            return None
+
+    def _load_meta(self, code):
+        if self.keep_in_memory and code in self._memory:
+            return self._memory[code][1]
+        path = self._meta_path(code)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    def _save(self, code, df, meta):
+        if self.keep_in_memory:
+            self._memory[code] = (df, meta)
+        self._write_atomic(self._path(code), lambda p: df.to_csv(p))
+
+        def write_meta(p):
+            with open(p, 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+        self._write_atomic(self._meta_path(code), write_meta)
+
+    def login(self):
+        """
+        开始批量会话（可嵌套）
+
+        真正的登录推迟到第一次需要下载时，数据全部在本地的会话不会连接服务器。
+        """
+        self._session_depth += 1
+
+    def logout(self):
+        """结束批量会话，最外层结束时登出"""
+        self._session_depth -= 1
+        if self._session_depth == 0 and self._logged_in:
+            bs.logout()
+            self._logged_in = False
+
+    def _ensure_login(self):
+        if not self._logged_in:
+            lg = bs.login()
+            if lg.error_code != '0':
+                raise RuntimeError(f"baostock 登录失败: {lg.error_msg}")
+            self._logged_in = True
+
+    def _fetch(self, code, start_date, end_date):
+        """
+        从服务器下载 [start_date, end_date] 的日K线（调用方负责登录）
+
+        Returns:
+            DataFrame（可能为空），以日期为索引
+        
+        Raises:
+            RuntimeError: 服务器返回错误（网络错误、会话过期等），不能当作"该区间没有数据"
+        """
+        rs = bs.query_history_k_data_plus(
+            code,
+            self.FIELDS,
+            start_date=start_date,
+            end_date=end_date,
+            frequency="d",
+            adjustflag=self.adjustflag
+        )
+
+        data_list = []
+        while rs.error_code == '0' and rs.next():
+            data_list.append(rs.get_row_data())
+        if rs.error_code != '0':
+            raise RuntimeError(f"下载 {code} [{start_date}, {end_date}] 失败: {rs.error_code} {rs.error_msg}")
+
+        df = pd.DataFrame(data_list, columns=self.FIELDS.split(','))
+        df = df[df['close'] != '']
+        for col in ['open', 'high', 'low', 'close', 'volume']:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+        df['date'] = pd.to_datetime(df['date'])
+        return df.set_index('date').sort_index()
+
+    def _confirmed_end(self, end_date):
+        """本次下载后可以记为"已确认"的最后日期"""
+        now = datetime.now()
+        today = now.strftime("%Y-%m-%d")
+        if end_date >= today and now.hour < self.DAILY_READY_HOUR:
+            return (now - timedelta(days=1)).strftime("%Y-%m-%d")
+        return min(end_date, today)
+
+    def update(self, code, start_date, end_date=None):
+        """
+        确保本地存储覆盖 [start_date, end_date]，只下载缺失的区间
+
+        Returns:
+            DataFrame: 本地存储中该代码的全部K线（可能为 None）
+        """
+        end_date = end_date or datetime.now().strftime("%Y-%m-%d")
+        df = self.load(code)
+        meta = self._load_meta(code)
+        if df is None or meta is None:
+            df, meta = None, None
+        elif self.keep_in_memory:
+            self._memory[code] = (df, meta)
+
+        ranges = []
+        if meta is None:
+            ranges.append((start_date, end_date))
+        else:
+            if start_date < meta['start']:
+                before = (pd.Timestamp(meta['start']) - timedelta(days=1)).strftime("%Y-%m-%d")
+                ranges.append((start_date, before))
+            if end_date > meta['end']:
+                after = (pd.Timestamp(meta['end']) + timedelta(days=1)).strftime("%Y-%m-%d")
+                ranges.append((after, end_date))
+
+        if not ranges:
+            return df
+
+        parts = [df] if df is not None else []
+        fetched = []
+        error = None
+        self.login()
+        try:
+            self._ensure_login()
+            for range_start, range_end in ranges:
+                parts.append(self._fetch(code, range_start, range_end))
+                fetched.append((range_start, range_end))
+        except Exception as e:
+            error = e
+        finally:
+            self.logout()
+        if not fetched:
+            raise error
+
+        parts = [p for p in parts if p is not None and len(p) > 0]
+        if parts:
+            merged = pd.concat(parts)
+            merged = merged[~merged.index.duplicated(keep='last')].sort_index()
+        else:
+            merged = pd.DataFrame(columns=['open', 'high', 'low', 'close', 'volume'],
+                                  index=pd.DatetimeIndex([], name='date'))
+
+        # 只把下载成功的区间记为已确认
+        new_meta = dict(meta) if meta else {}
+        for range_start, range_end in fetched:
+            new_meta['start'] = min(range_start, new_meta.get('start', range_start))
+            new_meta['end'] = max(self._confirmed_end(range_end), new_meta.get('end', ''))
+        try:
+            self._save(code, merged, new_meta)
+        except Exception as e:
+            print(f"写入缓存失败: {e}")
+        if error is not None:
+            raise error
+        return merged
+
+    def get_bars(self, code, days=250, end_date=None):
+        """
+        获取最近 days 个自然日的日K线（本地缺失的部分自动下载）
+
+        Returns:
+            DataFrame 或 None（没有数据）
+        """
+        end = datetime.strptime(end_date, "%Y-%m-%d") if end_date else datetime.now()
+        start_date = (end - timedelta(days=days)).strftime("%Y-%m-%d")
+        end_date = end.strftime("%Y-%m-%d")
+
+        df = self.update(code, start_date, end_date)
+        if df is None:
+            return None
+        df = df[(df.index >= pd.Timestamp(start_date)) & (df.index <= pd.Timestamp(end_date))]
+        if len(df) == 0:
+            return None
+        return df
+
+    def prefetch(self, codes, days=250, end_date=None):
+        """
+        批量更新多个代码（只登录一次）
+
+        Returns:
+            {code: DataFrame 或 None}
+        """
+        result = {}
+        self.login()
+        try:
+            for code in codes:
+                try:
+                    result[code] = self.get_bars(code, days=days, end_date=end_date)
+                except Exception as e:
+                    print(f"更新 {code} 失败: {e}")
+                    result[code] = None
+        finally:
+            self.logout()
+        return result
@@ -1,11 +1,16 @@
 import baostock as bs
+import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime, timedelta
-from qqe_trend_strategy import qqe_trend_strategy
+from qqe_trend_strategy import QQETrendStrategy, qqe_trend_strategy, build_bar_panel, qqe_trend_panel
+from bar_store import BarStore
 import time
 import random
 import sys
 
+CACHE_DIR = "data_cache"
+
 
 def get_stock_list(board_filter=None):
     """获取A股股票列表
@@ -125,7 +130,7 @@ def get_recent_stock_data(code, days=120):
     return df
 
 
-def check_buy_signal(stock_data, check_days=2, strict_mode=True, min_quality=60):
+def check_buy_signal(stock_data, check_days=2, strict_mode=True, min_quality=60, prescreen=True):
     """检查最近N天内是否有买入信号
     
     Args:
@@ -133,6 +138,7 @@ def check_buy_signal(stock_data, check_days=2, strict_mode=True, min_quality=60)
         check_days: 检查最近几天，默认2天
         strict_mode: 是否使用严格模式，默认True
         min_quality: 最低信号质量分数(0-100)，默认60
+        prescreen: 严格模式下先用成交量/动能/价格位置预筛选，不可能有信号时跳过QQE计算（结果不变）
         
     Returns:
         buy_date, buy_price, current_price, signal_quality
@@ -141,6 +147,15 @@ def check_buy_signal(stock_data, check_days=2, strict_mode=True, min_quality=60)
         return None, None, None, None
     
     try:
+        # 🆕 只用最后 预热K线数 + check_days 根计算
+        strategy = QQETrendStrategy()
+        stock_data = stock_data.tail(strategy.warmup_bars(strict_mode) + check_days)
+        
+        # 🆕 预筛选：多数股票在成交量放大、连续上涨这一步就不满足
+        if strict_mode and prescreen and \
+                not strategy.strict_prescreen(stock_data, check_days, min_quality):
+            return None, None, None, None
+        
         result = qqe_trend_strategy(stock_data, strict_mode=strict_mode)
         
         # 使用严格模式的买入信号
@@ -270,6 +285,15 @@ def batch_monitor_stocks(board_filter=None, max_stocks=None, random_sample=False
     print(f"监控完成! 找到 {len(buy_signals_found)} 只股票出现买入信号")
     print("=" * 80)
     
+    return report_buy_signals(buy_signals_found)
+
+
+def report_buy_signals(buy_signals_found):
+    """按质量排序并打印买入信号详情、汇总和代码列表
+    
+    Returns:
+        按质量从高到低排序的信号列表
+    """
     if len(buy_signals_found) > 0:
         # 按信号质量排序
         buy_signals_found = sorted(buy_signals_found, key=lambda x: x['quality'], reverse=True)
@@ -325,6 +349,162 @@ def batch_monitor_stocks(board_filter=None, max_stocks=None, random_sample=False
     return buy_signals_found
 
 
+def _fetch_chunk(codes, days, cache_dir, end_date=None):
+    """工作进程：批量更新一组股票到本地K线存储（只登录一次）"""
+    return BarStore(cache_dir).prefetch(codes, days=days, end_date=end_date)
+
+
+def fetch_bars_concurrent(codes, days=120, workers=8, cache_dir=CACHE_DIR, chunk_size=50, end_date=None):
+    """多进程并发下载K线到共用的本地K线存储（已缓存的日期不重复下载）
+    
+    每个进程各自登录 baostock，按 chunk_size 只股票一批领取任务。
+    
+    Returns:
+        {code: DataFrame}（没有数据的股票不包含在内）
+    """
+    chunks = [codes[i:i + chunk_size] for i in range(0, len(codes), chunk_size)]
+    stock_bars = {}
+    done = 0
+    
+    if workers <= 1:
+        results = (_fetch_chunk(chunk, days, cache_dir, end_date) for chunk in chunks)
+        for result in results:
+            stock_bars.update({code: df for code, df in result.items() if df is not None})
+            done += 1
+            print(f"\r下载进度: {min(done * chunk_size, len(codes))}/{len(codes)}", end='', flush=True)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_fetch_chunk, chunk, days, cache_dir, end_date) for chunk in chunks]
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"\n下载失败: {e}")
+                    continue
+                stock_bars.update({code: df for code, df in result.items() if df is not None})
+                done += 1
+                print(f"\r下载进度: {min(done * chunk_size, len(codes))}/{len(codes)}", end='', flush=True)
+    print()
+    return stock_bars
+
+
+def scan_signals_panel(stock_bars, names=None, check_days=2, strict_mode=True, min_quality=60,
+                       prescreen=True):
+    """面板一次计算全部股票的信号，再按最近 check_days 天和 min_quality 过滤
+    
+    结果与对每只股票调用 check_buy_signal 相同。
+    
+    Args:
+        stock_bars: {code: K线DataFrame}
+        names: {code: 名称}
+        prescreen: 严格模式下先预筛选，只对可能有信号的股票计算QQE（结果不变）
+        
+    Returns:
+        买入信号列表（字段同 batch_monitor_stocks）
+    """
+    names = names or {}
+    stock_bars = {code: df for code, df in stock_bars.items() if df is not None and len(df) >= 60}
+    if not stock_bars:
+        return []
+    
+    panel, dates = build_bar_panel(stock_bars)
+    strategy = QQETrendStrategy()
+    window = strategy.warmup_bars(strict_mode) + check_days
+    panel = {field: frame.iloc[-window:] for field, frame in panel.items()}
+    dates = dates.iloc[-window:]
+    if strict_mode and prescreen:
+        candidates = strategy.strict_prescreen(panel, check_days, min_quality)
+        print(f"预筛选: {int(candidates.sum())}/{len(candidates)} 只股票进入QQE计算")
+        if not candidates.any():
+            return []
+        panel = {field: frame.loc[:, candidates] for field, frame in panel.items()}
+        dates = dates.loc[:, candidates]
+    frames = qqe_trend_panel(panel, strict_mode=strict_mode)
+    
+    signal_column = 'buy_signal_strict' if strict_mode else 'buy_signal'
+    length = len(dates)
+    tail = min(check_days, length)
+    signals = frames[signal_column].to_numpy()[length - tail:] == True
+    
+    # 每只股票最近一次信号所在的行
+    has_signal = signals.any(axis=0)
+    rows = length - 1 - signals[::-1].argmax(axis=0)
+    cols = np.flatnonzero(has_signal)
+    rows = rows[cols]
+    
+    if strict_mode:
+        quality = frames['signal_quality'].to_numpy()[rows, cols]
+    else:
+        quality = np.zeros(len(cols))
+    keep = quality >= min_quality
+    
+    codes = dates.columns
+    buy_signals_found = []
+    for row, col, q in zip(rows[keep], cols[keep], quality[keep]):
+        code = codes[col]
+        buy_price = panel['open'].iat[row, col]
+        current_price = panel['close'].iat[length - 1, col]
+        profit = current_price - buy_price
+        buy_signals_found.append({
+            'code': code,
+            'name': names.get(code, ''),
+            'buy_date': pd.Timestamp(dates.iat[row, col]),
+            'buy_price': buy_price,
+            'current_price': current_price,
+            'profit': profit,
+            'profit_pct': (profit / buy_price) * 100,
+            'quality': q
+        })
+    return buy_signals_found
+
+
+def fast_scan_stocks(board_filter=None, max_stocks=None, random_sample=False,
+                     strict_mode=True, min_quality=60, history_days=120,
+                     check_days=2, workers=8):
+    """快速扫描：多进程并发下载到本地K线存储，面板一次计算全部股票的信号
+    
+    参数同 batch_monitor_stocks，workers 为下载进程数。
+    """
+    print("=" * 80)
+    print("开始快速扫描A股股票池...")
+    print("=" * 80)
+    
+    start = time.time()
+    stock_list = get_stock_list(board_filter=board_filter)
+    
+    if len(stock_list) == 0:
+        print("未找到符合条件的股票")
+        return []
+    
+    if random_sample and max_stocks and max_stocks < len(stock_list):
+        stock_list = random.sample(stock_list, max_stocks)
+    elif max_stocks and max_stocks < len(stock_list):
+        stock_list = stock_list[:max_stocks]
+    
+    print(f"筛选模式: {'严格模式' if strict_mode else '标准模式'}")
+    print(f"质量阈值: {min_quality}分")
+    print(f"股票池总数: {len(stock_list)}")
+    print(f"历史数据: {history_days}天")
+    print(f"检查范围: 最近{check_days}天内的买入信号")
+    print(f"下载进程: {workers}")
+    print("=" * 80)
+    
+    stock_bars = fetch_bars_concurrent([s['code'] for s in stock_list], days=history_days, workers=workers)
+    fetch_time = time.time() - start
+    
+    scan_start = time.time()
+    names = {s['code']: s['name'] for s in stock_list}
+    buy_signals_found = scan_signals_panel(stock_bars, names, check_days=check_days,
+                                           strict_mode=strict_mode, min_quality=min_quality)
+    
+    print("\n" + "=" * 80)
+    print(f"扫描完成! {len(stock_bars)} 只股票有数据, 找到 {len(buy_signals_found)} 只股票出现买入信号")
+    print(f"耗时: 下载 {fetch_time:.1f}秒, 信号计算 {time.time() - scan_start:.1f}秒")
+    print("=" * 80)
+    
+    return report_buy_signals(buy_signals_found)
+
+
 def get_stock_data_single(code, days=120):
     """获取单只股票数据
     
@@ -494,6 +674,10 @@ if __name__ == "__main__":
                         help='检查最近几天的买入信号，默认2天')
     parser.add_argument('--delay', type=float, default=0.1,
                         help='请求间隔时间(秒)，避免频繁请求，默认0.1秒')
+    parser.add_argument('--fast', action='store_true',
+                        help='快速扫描：并发下载到本地K线存储，所有股票一次计算信号（适合全市场）')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='快速扫描的下载进程数，默认8')
     
     args = parser.parse_args()
     
@@ -518,14 +702,25 @@ if __name__ == "__main__":
         # 批量监控模式
         board_filter = None if args.board == 'all' else args.board
         
-        batch_monitor_stocks(
-            board_filter=board_filter,
-            max_stocks=max_stocks,
-            random_sample=args.random,
-            strict_mode=strict_mode,
-            min_quality=args.min_quality,
-            history_days=args.history_days,
-            check_days=args.check_days,
-            delay=args.delay
-        )
-
+        if args.fast:
+            fast_scan_stocks(
+                board_filter=board_filter,
+                max_stocks=max_stocks,
+                random_sample=args.random,
+                strict_mode=strict_mode,
+                min_quality=args.min_quality,
+                history_days=args.history_days,
+                check_days=args.check_days,
+                workers=args.workers
+            )
+        else:
+            batch_monitor_stocks(
+                board_filter=board_filter,
+                max_stocks=max_stocks,
+                random_sample=args.random,
+                strict_mode=strict_mode,
+                min_quality=args.min_quality,
+                history_days=args.history_days,
+                check_days=args.check_days,
+                delay=args.delay
+            )
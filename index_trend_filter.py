@@ -2,11 +2,12 @@
 指数趋势过滤器
 用于判断大盘/板块指数是否处于多头趋势，以过滤个股交易信号
 """
+import os
 import baostock as bs
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
 from qqe_trend_strategy import qqe_trend_strategy
+from bar_store import BarStore
 
 
 class IndexTrendFilter:
@@ -24,10 +25,51 @@ class IndexTrendFilter:
         'sz.00': 'sz.399001',         # 00开头 -> 深证成指
     }
     
+    # 趋势判断模式
+    MODES = ('simple', 'moderate', 'strict')
+    
+    # 行业板块合成指数的代码前缀，如 'sector:计算机'
+    SECTOR_PREFIX = 'sector:'
+    
     def __init__(self, cache_dir="index_cache"):
-        """初始化指数过滤器"""
+        """
+        初始化指数过滤器
+        
+        指数K线保存在 cache_dir 下的本地增量存储中（与个股共用 BarStore），
+        构造时先载入本地已有数据；首次查询时一次性为 INDEX_MAP 中的全部指数补齐缺失日期。
+        """
         self.cache_dir = cache_dir
+        self.store = BarStore(cache_dir)
         self.index_data_cache = {}  # {index_code: dataframe}
+        self.regime_cache = {}  # {(index_code, mode): (dataframe, regime)}
+        self.sector_map = {}  # {stock_code: 'sector:<行业>'}，为空时按代码前缀映射大盘指数
+        
+        # 本地已有数据（尚未与服务器同步）
+        self._disk_data = {}
+        for index_code in self.index_codes():
+            df = self.store.load(index_code)
+            if df is not None and len(df) > 0:
+                self._disk_data[index_code] = df
+                self.index_data_cache[index_code] = df
+    
+    @classmethod
+    def index_codes(cls):
+        """INDEX_MAP 中出现的全部指数代码（去重，保持顺序）"""
+        return list(dict.fromkeys(cls.INDEX_MAP.values()))
+    
+    def prefetch_indices(self, days=250):
+        """
+        批量补齐全部指数的缺失日期（只登录一次）
+        
+        下载失败的指数保留本地已有数据。
+        """
+        codes = self.index_codes()
+        fetched = self.store.prefetch(codes, days=days)
+        for index_code in codes:
+            df = fetched.get(index_code)
+            if df is not None and len(df) > 0:
+                self.index_data_cache[index_code] = df
+            self._disk_data.pop(index_code, None)
         
     def _get_index_code(self, stock_code):
         """
@@ -37,8 +79,13 @@ class IndexTrendFilter:
             stock_code: 股票代码，如 'sz.300750'
             
         Returns:
-            指数代码，如 'sz.399006'
+            指数代码，如 'sz.399006'；启用行业映射时返回 'sector:<行业>'
         """
+        # 行业板块映射优先
+        sector_code = self.sector_map.get(stock_code)
+        if sector_code is not None:
+            return sector_code
+        
         # 提取交易所和前缀
         if '.' not in stock_code:
             return 'sz.399001'  # 默认深证成指
@@ -65,6 +112,116 @@ class IndexTrendFilter:
         else:
             return 'sz.399001'
     
+    def load_industry_map(self, refresh=False):
+        """
+        获取个股所属行业（证监会行业分类），只下载一次并保存在 cache_dir/stock_industry.csv
+        
+        Args:
+            refresh: 是否重新下载
+            
+        Returns:
+            dict: {stock_code: 行业名称}
+        """
+        path = os.path.join(self.cache_dir, 'stock_industry.csv')
+        if not refresh and os.path.exists(path):
+            df = pd.read_csv(path, dtype=str).fillna('')
+        else:
+            lg = bs.login()
+            rs = bs.query_stock_industry()
+            data_list = []
+            while (rs.error_code == '0') & rs.next():
+                data_list.append(rs.get_row_data())
+            bs.logout()
+            
+            df = pd.DataFrame(data_list, columns=rs.fields).fillna('')
+            if len(df) == 0:
+                print("警告: 未获取到行业分类数据")
+                return {}
+            if not os.path.exists(self.cache_dir):
+                os.makedirs(self.cache_dir, exist_ok=True)
+            df.to_csv(path, index=False, encoding='utf-8-sig')
+        
+        df = df[df['industry'] != '']
+        return dict(zip(df['code'], df['industry']))
+    
+    @classmethod
+    def build_sector_composites(cls, stock_panel, industry_map, min_members=3):
+        """
+        用本地个股K线构建等权行业合成指数（一次向量化计算全部行业）
+        
+        合成指数收盘价 = 100 × 累计(行业内成分股日收益率的等权平均)，
+        开/高/低为前收盘 × 成分股对应价格相对前收盘的平均比值，成交量为成分股之和。
+        
+        Args:
+            stock_panel: {stock_code: DataFrame(open, high, low, close, volume)}
+            industry_map: {stock_code: 行业名称}
+            min_members: 成分股少于该数量的行业不构建（其成分股仍使用大盘指数）
+            
+        Returns:
+            tuple: (composites, sector_map)
+                composites: {'sector:<行业>': DataFrame}
+                sector_map: {stock_code: 'sector:<行业>'}
+        """
+        members = {code: industry_map[code] for code in stock_panel if code in industry_map}
+        industry = pd.Series(members)
+        counts = industry.value_counts()
+        industry = industry[industry.isin(counts[counts >= min_members].index)]
+        if len(industry) == 0:
+            return {}, {}
+        
+        codes = list(industry.index)
+        fields = {}
+        for col in ['open', 'high', 'low', 'close', 'volume']:
+            fields[col] = pd.concat([stock_panel[code][col].rename(code) for code in codes], axis=1).sort_index()
+        
+        prev_close = fields['close'].shift(1)
+        groups = industry.reindex(fields['close'].columns)
+        
+        def sector_mean(frame):
+            # 按行业对列分组求平均（忽略停牌等缺失值）
+            return frame.T.groupby(groups).mean().T
+        
+        daily_return = sector_mean(fields['close'] / prev_close - 1).fillna(0)
+        close = 100 * (1 + daily_return).cumprod()
+        composite_prev = close.shift(1).fillna(100)
+        opens = composite_prev * sector_mean(fields['open'] / prev_close).fillna(1)
+        highs = composite_prev * sector_mean(fields['high'] / prev_close).fillna(1)
+        lows = composite_prev * sector_mean(fields['low'] / prev_close).fillna(1)
+        volume = fields['volume'].T.groupby(groups).sum().T
+        
+        composites = {}
+        for name in close.columns:
+            df = pd.DataFrame({
+                'open': opens[name],
+                'high': pd.concat([highs[name], close[name], opens[name]], axis=1).max(axis=1),
+                'low': pd.concat([lows[name], close[name], opens[name]], axis=1).min(axis=1),
+                'close': close[name],
+                'volume': volume[name],
+            })
+            df.index.name = 'date'
+            composites[cls.SECTOR_PREFIX + name] = df
+        
+        sector_map = {code: cls.SECTOR_PREFIX + name for code, name in industry.items()}
+        return composites, sector_map
+    
+    def set_sector_data(self, composites, sector_map):
+        """启用行业板块映射：个股按所属行业的合成指数判断趋势"""
+        self.index_data_cache.update(composites)
+        self.sector_map = dict(sector_map)
+    
+    def enable_sector_filter(self, stock_panel, min_members=3):
+        """
+        读取（缓存的）行业分类，用个股K线构建行业合成指数并启用行业映射
+        
+        Returns:
+            int: 启用了行业映射的股票数量
+        """
+        composites, sector_map = self.build_sector_composites(
+            stock_panel, self.load_industry_map(), min_members=min_members
+        )
+        self.set_sector_data(composites, sector_map)
+        return len(sector_map)
+    
     def get_index_data(self, index_code, days=250):
         """
         获取指数数据
@@ -76,153 +233,185 @@ class IndexTrendFilter:
         Returns:
             DataFrame: 指数数据
         """
-        # 检查缓存
-        if index_code in self.index_data_cache:
-            return self.index_data_cache[index_code]
-        
-        # 下载数据
-        lg = bs.login()
-        
-        end_date = datetime.now().strftime("%Y-%m-%d")
-        start_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
-        
-        rs = bs.query_history_k_data_plus(
-            index_code,
-            "date,open,high,low,close,volume",
-            start_date=start_date,
-            end_date=end_date,
-            frequency="d",
-            adjustflag="3"
-        )
-        
-        data_list = []
-        while (rs.error_code == '0') & rs.next():
-            data_list.append(rs.get_row_data())
-        
-        bs.logout()
-        
-        if len(data_list) == 0:
-            return None
-        
-        df = pd.DataFrame(data_list, columns=rs.fields)
-        df = df[df['close'] != '']
-        
-        if len(df) == 0:
-            return None
+        # 检查缓存（本地载入但尚未同步的数据需要先补齐）
+        cached = self.index_data_cache.get(index_code)
+        if cached is not None and cached is not self._disk_data.get(index_code):
+            return cached
         
-        df['open'] = df['open'].astype(float)
-        df['high'] = df['high'].astype(float)
-        df['low'] = df['low'].astype(float)
-        df['close'] = df['close'].astype(float)
-        df['volume'] = df['volume'].astype(float)
-        df['date'] = pd.to_datetime(df['date'])
-        df = df.set_index('date')
-        df = df.sort_index()
+        # 行业合成指数只在本地构建，不下载
+        if index_code.startswith(self.SECTOR_PREFIX):
+            return cached
         
-        # 缓存
-        self.index_data_cache[index_code] = df
+        if index_code in self.INDEX_MAP.values():
+            self.prefetch_indices(days)
+        else:
+            df = self.store.get_bars(index_code, days=days)
+            if df is not None:
+                self.index_data_cache[index_code] = df
         
-        return df
+        return self.index_data_cache.get(index_code)
     
-    def is_bullish_trend(self, index_code, current_date=None, mode='strict'):
+    def get_regime_series(self, index_code, mode='moderate'):
         """
-        判断指数是否处于多头趋势
+        预计算指数在全部历史上每个交易日的趋势状态
+        
+        每个指数、每种模式只计算一次，之后按日期查表；
+        指数数据更新（缓存中的DataFrame被替换）后自动重新计算。
         
         Args:
             index_code: 指数代码
-            current_date: 判断日期（None表示最新）
-            mode: 判断模式
-                - 'simple': 简单模式（价格在均线上方）
-                - 'moderate': 中等模式（多均线金叉 + 趋势向上）
-                - 'strict': 严格模式（QQE信号 + 趋势强度）
-                
+            mode: 判断模式 ('simple', 'moderate', 'strict')
+            
         Returns:
-            bool: True表示多头，False表示空头/震荡
+            DataFrame: 以日期为索引，列 is_bullish / trend_strength；
+                       前59个交易日数据不足，分别为 False / 50。数据获取失败返回 None
         """
         df = self.get_index_data(index_code)
-        if df is None or len(df) < 60:
-            return False
+        if df is None:
+            return None
+        
+        key = (index_code, mode)
+        cached = self.regime_cache.get(key)
+        if cached is not None and cached[0] is df:
+            return cached[1]
+        
+        regime = pd.DataFrame({
+            'is_bullish': self._bullish_series(df, mode),
+            'trend_strength': self._strength_series(df)
+        }, index=df.index)
+        # 与逐日判断保持一致：不足60个交易日时视为非多头、中性强度
+        regime.iloc[:59, regime.columns.get_loc('is_bullish')] = False
+        regime.iloc[:59, regime.columns.get_loc('trend_strength')] = 50.0
+        
+        self.regime_cache[key] = (df, regime)
+        return regime
+    
+    def _lookup_regime(self, index_code, current_date, mode):
+        """查表返回 current_date 当日（或之前最近一个交易日）的 (is_bullish, trend_strength)"""
+        regime = self.get_regime_series(index_code, mode)
+        if regime is None or len(regime) < 60:
+            return False, 50
         
-        # 如果指定日期，截取到该日期
         if current_date:
             if isinstance(current_date, str):
                 current_date = pd.to_datetime(current_date)
-            df = df[df.index <= current_date]
-            
-        if len(df) < 60:
-            return False
+            pos = regime.index.searchsorted(current_date, side='right') - 1
+        else:
+            pos = len(regime) - 1
         
-        # 获取最新数据
-        latest = df.iloc[-1]
-        close = latest['close']
+        if pos < 59:
+            return False, 50
+        return bool(regime['is_bullish'].iat[pos]), float(regime['trend_strength'].iat[pos])
+    
+    def _bullish_series(self, df, mode):
+        """按模式计算每个交易日的多头判断（向量化，只使用当日及之前的数据）"""
+        close = df['close']
         
         if mode == 'simple':
             # 简单模式：价格在20日和60日均线上方
-            ma20 = df['close'].rolling(20).mean().iloc[-1]
-            ma60 = df['close'].rolling(60).mean().iloc[-1]
+            ma20 = close.rolling(20).mean()
+            ma60 = close.rolling(60).mean()
             
-            return close > ma20 and close > ma60 and ma20 > ma60
+            return ((close > ma20) & (close > ma60) & (ma20 > ma60)).to_numpy()
         
         elif mode == 'moderate':
             # 中等模式：多均线金叉 + 趋势向上
-            ma5 = df['close'].rolling(5).mean().iloc[-1]
-            ma10 = df['close'].rolling(10).mean().iloc[-1]
-            ma20 = df['close'].rolling(20).mean().iloc[-1]
-            ma60 = df['close'].rolling(60).mean().iloc[-1]
+            ma5 = close.rolling(5).mean()
+            ma10 = close.rolling(10).mean()
+            ma20 = close.rolling(20).mean()
             
             # 均线多头排列
-            multi_align = close > ma5 > ma10 > ma20
+            multi_align = (close > ma5) & (ma5 > ma10) & (ma10 > ma20)
             
             # 趋势向上（20日均线斜率为正）
-            ma20_prev5 = df['close'].rolling(20).mean().iloc[-6]
-            ma20_rising = ma20 > ma20_prev5
+            ma20_rising = ma20 > ma20.shift(5)
             
             # 价格强度（不在低位震荡）
-            price_60_high = df['close'].rolling(60).max().iloc[-1]
-            price_60_low = df['close'].rolling(60).min().iloc[-1]
+            price_60_high = close.rolling(60).max()
+            price_60_low = close.rolling(60).min()
             price_position = (close - price_60_low) / (price_60_high - price_60_low)
             not_at_bottom = price_position > 0.3  # 不在60日区间的底部30%
             
-            return multi_align and ma20_rising and not_at_bottom
+            return (multi_align & ma20_rising & not_at_bottom).to_numpy()
         
         elif mode == 'strict':
             # 严格模式：使用QQE策略判断
+            # QQE各列只依赖当日及之前的数据，全历史计算一次后逐日读取即可（无未来函数）
             try:
                 result = qqe_trend_strategy(df, strict_mode=True)
                 
-                # 获取最新信号
-                latest_signal = result.iloc[-1]
-                
                 # 1. QQE多头条件
-                qqe_bullish = latest_signal.get('long_condition', False)
+                long_condition = result['long_condition'].fillna(False).astype(bool)
                 
                 # 2. 趋势强度
-                trend = latest_signal.get('trend', 0)
-                strong_trend = trend > 10
+                strong_trend = result['trend'] > 10
                 
                 # 3. 价格在趋势MA上方
-                price_above_ma = latest_signal['close'] > latest_signal.get('ha_close_ma', latest_signal['close'])
+                price_above_ma = result['close'] > result['ha_close_ma']
                 
                 # 4. RSI不过热
-                secondary_rsi = latest_signal.get('secondary_rsi', 50)
-                rsi_ok = 30 < secondary_rsi < 80
+                rsi_ok = (result['secondary_rsi'] > 30) & (result['secondary_rsi'] < 80)
                 
                 # 5. 连续性检查（最近5天至少3天多头）
-                recent_5 = result.iloc[-5:]
-                bullish_days = recent_5['long_condition'].sum()
-                sustained = bullish_days >= 3
+                sustained = long_condition.astype(int).rolling(5, min_periods=1).sum() >= 3
                 
-                return qqe_bullish and strong_trend and price_above_ma and rsi_ok and sustained
+                return (long_condition & strong_trend & price_above_ma & rsi_ok & sustained).to_numpy()
                 
             except Exception as e:
                 print(f"警告: QQE判断失败 ({e})，降级为中等模式")
-                return self.is_bullish_trend(index_code, current_date, mode='moderate')
+                return self._bullish_series(df, 'moderate')
         
-        return False
+        return np.zeros(len(df), dtype=bool)
+    
+    @staticmethod
+    def _strength_series(df):
+        """计算每个交易日的趋势强度评分 (0-100)，向量化"""
+        close = df['close']
+        
+        # 1. 均线位置 (0-25分)
+        ma20 = close.rolling(20).mean()
+        ma60 = close.rolling(60).mean()
+        score = (close > ma20) * 10.0 + (close > ma60) * 10.0 + (ma20 > ma60) * 5.0
+        
+        # 2. 价格相对位置 (0-25分)
+        high_60 = df['high'].rolling(60).max()
+        low_60 = df['low'].rolling(60).min()
+        price_range = high_60 - low_60
+        price_position = ((close - low_60) / price_range).where(price_range > 0, 0.5)
+        score += price_position * 25
+        
+        # 3. 趋势方向 (0-25分)
+        ma20_5ago = ma20.shift(5)
+        trend_direction = ((ma20 - ma20_5ago) / ma20_5ago).where(ma20_5ago > 0, 0)
+        score += (trend_direction * 500).clip(0, 25)  # 归一化到0-25
+        
+        # 4. 动能 (0-25分)
+        close_5ago = close.shift(5)
+        momentum = ((close - close_5ago) / close_5ago).where(close_5ago > 0, 0)
+        score += (momentum * 250).clip(0, 25)  # 归一化到0-25
+        
+        return score.clip(0, 100).to_numpy()
+    
+    def is_bullish_trend(self, index_code, current_date=None, mode='strict'):
+        """
+        判断指数是否处于多头趋势（查预计算的趋势序列）
+        
+        Args:
+            index_code: 指数代码
+            current_date: 判断日期（None表示最新）
+            mode: 判断模式
+                - 'simple': 简单模式（价格在均线上方）
+                - 'moderate': 中等模式（多均线金叉 + 趋势向上）
+                - 'strict': 严格模式（QQE信号 + 趋势强度）
+                
+        Returns:
+            bool: True表示多头，False表示空头/震荡
+        """
+        return self._lookup_regime(index_code, current_date, mode)[0]
     
     def get_trend_strength(self, index_code, current_date=None):
         """
-        获取指数趋势强度评分 (0-100)
+        获取指数趋势强度评分 (0-100)（查预计算的趋势序列）
         
         Args:
             index_code: 指数代码
@@ -231,51 +420,85 @@ class IndexTrendFilter:
         Returns:
             float: 趋势强度评分，0表示强空头，50表示震荡，100表示强多头
         """
-        df = self.get_index_data(index_code)
-        if df is None or len(df) < 60:
-            return 50  # 数据不足，返回中性
-        
-        # 如果指定日期，截取到该日期
-        if current_date:
-            if isinstance(current_date, str):
-                current_date = pd.to_datetime(current_date)
-            df = df[df.index <= current_date]
-        
-        if len(df) < 60:
-            return 50
-        
-        close = df['close'].iloc[-1]
-        
-        # 多个维度评分
-        score = 0
-        
-        # 1. 均线位置 (0-25分)
-        ma20 = df['close'].rolling(20).mean().iloc[-1]
-        ma60 = df['close'].rolling(60).mean().iloc[-1]
-        if close > ma20:
-            score += 10
-        if close > ma60:
-            score += 10
-        if ma20 > ma60:
-            score += 5
-        
-        # 2. 价格相对位置 (0-25分)
-        high_60 = df['high'].rolling(60).max().iloc[-1]
-        low_60 = df['low'].rolling(60).min().iloc[-1]
-        price_position = (close - low_60) / (high_60 - low_60) if (high_60 - low_60) > 0 else 0.5
-        score += price_position * 25
+        # 强度与模式无关，复用 simple 模式的序列
+        return self._lookup_regime(index_code, current_date, 'simple')[1]
+    
+    def get_regime_panel(self, index_codes=None, modes=MODES, dates=None):
+        """
+        一次性计算多个指数、多种模式在每个交易日的趋势状态
         
-        # 3. 趋势方向 (0-25分)
-        ma20_5ago = df['close'].rolling(20).mean().iloc[-6] if len(df) >= 6 else ma20
-        trend_direction = (ma20 - ma20_5ago) / ma20_5ago if ma20_5ago > 0 else 0
-        score += max(0, min(25, trend_direction * 500))  # 归一化到0-25
+        与逐个调用 is_bullish_trend / get_trend_strength 的结果一致，
+        但按日期批量查表，适合对比不同模式、扫描 min_strength 等批量分析。
         
-        # 4. 动能 (0-25分)
-        close_5ago = df['close'].iloc[-6] if len(df) >= 6 else close
-        momentum = (close - close_5ago) / close_5ago if close_5ago > 0 else 0
-        score += max(0, min(25, momentum * 250))  # 归一化到0-25
+        Args:
+            index_codes: 指数代码列表（默认 INDEX_MAP 中的全部指数）
+            modes: 判断模式列表
+            dates: 查询日期（默认各指数交易日的并集）；非交易日取之前最近一个交易日
+            
+        Returns:
+            dict:
+                'dates': DatetimeIndex (D)
+                'indices': 指数代码列表 (I)
+                'modes': 模式列表 (M)
+                'is_bullish': bool 数组 (D, I, M)
+                'strength': float 数组 (D, I)，趋势强度与模式无关
+        """
+        index_codes = list(index_codes) if index_codes is not None else self.index_codes()
+        modes = list(modes)
+        
+        regimes = {}
+        for index_code in index_codes:
+            for mode in modes:
+                regimes[(index_code, mode)] = self.get_regime_series(index_code, mode)
+        
+        if dates is None:
+            all_dates = set()
+            for regime in regimes.values():
+                if regime is not None:
+                    all_dates.update(regime.index)
+            dates = pd.DatetimeIndex(sorted(all_dates))
+        else:
+            dates = pd.DatetimeIndex(pd.to_datetime(dates))
+        
+        is_bullish = np.zeros((len(dates), len(index_codes), len(modes)), dtype=bool)
+        strength = np.full((len(dates), len(index_codes)), 50.0)
+        
+        for i, index_code in enumerate(index_codes):
+            for m, mode in enumerate(modes):
+                regime = regimes[(index_code, mode)]
+                if regime is None or len(regime) < 60:
+                    continue
+                # 每个查询日期对应的最近交易日下标；不足60个交易日的保持默认值
+                pos = regime.index.searchsorted(dates, side='right') - 1
+                valid = pos >= 59
+                is_bullish[valid, i, m] = regime['is_bullish'].to_numpy(dtype=bool)[pos[valid]]
+                if m == 0:
+                    strength[valid, i] = regime['trend_strength'].to_numpy(dtype=float)[pos[valid]]
+        
+        return {
+            'dates': dates,
+            'indices': index_codes,
+            'modes': modes,
+            'is_bullish': is_bullish,
+            'strength': strength,
+        }
+    
+    @staticmethod
+    def sweep_min_strength(panel, min_strengths, mode='moderate'):
+        """
+        在预计算的趋势面板上批量评估不同的最小趋势强度
         
-        return max(0, min(100, score))
+        Args:
+            panel: get_regime_panel 的返回值
+            min_strengths: 最小趋势强度列表 (T)
+            mode: 判断模式
+            
+        Returns:
+            bool 数组 (T, D, I)：各阈值下每个交易日、每个指数是否允许开仓
+        """
+        bullish = panel['is_bullish'][:, :, panel['modes'].index(mode)]
+        thresholds = np.asarray(min_strengths, dtype=float)
+        return bullish[np.newaxis] & (panel['strength'][np.newaxis] >= thresholds[:, np.newaxis, np.newaxis])
     
     def should_allow_entry(self, stock_code, current_date=None, mode='moderate', min_strength=60):
         """
@@ -293,11 +516,8 @@ class IndexTrendFilter:
         # 获取对应指数
         index_code = self._get_index_code(stock_code)
         
-        # 判断趋势
-        is_bullish = self.is_bullish_trend(index_code, current_date, mode)
-        
-        # 获取强度
-        strength = self.get_trend_strength(index_code, current_date)
+        # 判断趋势与强度（一次查表）
+        is_bullish, strength = self._lookup_regime(index_code, current_date, mode)
         
         # 综合判断
         allow = is_bullish and strength >= min_strength
@@ -321,22 +541,39 @@ def test_index_filter():
         ('sz.399001', '深证成指'),
     ]
     
-    print("\n当前指数趋势状态:")
+    # 一次性计算全部指数、全部模式的趋势面板
+    panel = filter.get_regime_panel([code for code, _ in test_indices])
+    if len(panel['dates']) == 0:
+        print("没有可用的指数数据。")
+        return
+    
+    print(f"\n当前指数趋势状态 ({panel['dates'][-1].strftime('%Y-%m-%d')}):")
     print("-" * 80)
     print(f"{'指数':<15} | {'简单模式':<10} | {'中等模式':<10} | {'严格模式':<10} | {'趋势强度':<10}")
     print("-" * 80)
     
-    for code, name in test_indices:
-        simple = filter.is_bullish_trend(code, mode='simple')
-        moderate = filter.is_bullish_trend(code, mode='moderate')
-        strict = filter.is_bullish_trend(code, mode='strict')
-        strength = filter.get_trend_strength(code)
+    latest = panel['is_bullish'][-1]
+    for i, (code, name) in enumerate(test_indices):
+        simple, moderate, strict = latest[i]
+        strength = panel['strength'][-1, i]
         
         print(f"{name:<15} | {'✓' if simple else '✗':<10} | {'✓' if moderate else '✗':<10} | "
               f"{'✓' if strict else '✗':<10} | {strength:<10.1f}")
     
     print("-" * 80)
     
+    # 各模式下允许开仓的交易日占比（扫描最小趋势强度）
+    thresholds = [0, 40, 50, 60, 70, 80]
+    print(f"\n允许开仓的交易日占比 (共 {len(panel['dates'])} 天):")
+    print("-" * 80)
+    print(f"{'指数':<15} | {'模式':<10} | " + " | ".join(f"强度>={t:<3}" for t in thresholds))
+    print("-" * 80)
+    for mode in panel['modes']:
+        allow_rate = filter.sweep_min_strength(panel, thresholds, mode).mean(axis=1) * 100
+        for i, (code, name) in enumerate(test_indices):
+            print(f"{name:<15} | {mode:<10} | " + " | ".join(f"{rate:>7.1f}%" for rate in allow_rate[:, i]))
+    print("-" * 80)
+    
     # 测试股票过滤
     print("\n股票开仓过滤测试:")
     print("-" * 80)
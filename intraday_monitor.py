@@ -0,0 +1,331 @@
+"""
+盘中监控
+交易时间内按固定间隔拉取自选股的实时行情，把当天未完成的日K线接在已收盘的K线后面，
+试算买入/卖出/止损条件，并标注信号是否已连续多次出现（稳定）。
+
+- 已收盘的K线只在启动时加载一次（预热需要的根数），盘中的K线只用于试算，不写入本地存储
+- 所有股票拼成面板一次计算，几百只股票每轮只需几秒（大部分时间是行情请求）
+- 未收盘的成交量按已交易时间折算成全天成交量，再参与成交量放大判断
+- 行情日期不是今天或不晚于最后一根已收盘K线的股票不参与试算（开盘前、节假日、停牌时新浪返回的是旧行情）
+- 实时行情来自新浪行情接口，每次请求最多 200 只
+"""
+import argparse
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time as dt_time
+
+import numpy as np
+import pandas as pd
+import requests
+
+from bar_store import BarStore
+from portfolio_journal import PortfolioJournal
+from qqe_trend_strategy import QQETrendStrategy, build_bar_panel, qqe_trend_panel, history_days
+
+SINA_QUOTE_URL = "https://hq.sinajs.cn/list="
+SINA_HEADERS = {'Referer': 'https://finance.sina.com.cn'}
+
+# A股连续竞价时段
+SESSIONS = [(dt_time(9, 30), dt_time(11, 30)), (dt_time(13, 0), dt_time(15, 0))]
+SESSION_MINUTES = 240
+
+
+def _full_code(code):
+    """补全市场前缀：300750 -> sz.300750"""
+    if '.' in code:
+        return code
+    return f'sh.{code}' if code.startswith('6') else f'sz.{code}'
+
+
+def parse_sina_quotes(text):
+    """
+    解析新浪行情接口的返回内容
+
+    Returns:
+        DataFrame(index=代码 sh.600000 格式)，列: name, open, prev_close, close, high, low, volume, amount, date, time；
+        停牌（价格为0）和无效代码不包含在内
+    """
+    rows = []
+    for symbol, content in re.findall(r'var hq_str_(\w+)="([^"]*)";', text):
+        fields = content.split(',')
+        if len(fields) < 32:
+            continue
+        try:
+            price = float(fields[3])
+            if price <= 0:
+                continue
+            rows.append({
+                'code': f"{symbol[:2]}.{symbol[2:]}",
+                'name': fields[0],
+                'open': float(fields[1]),
+                'prev_close': float(fields[2]),
+                'close': price,
+                'high': float(fields[4]),
+                'low': float(fields[5]),
+                'volume': float(fields[8]),
+                'amount': float(fields[9]),
+                'date': fields[30],
+                'time': fields[31],
+            })
+        except ValueError:
+            continue
+    columns = ['name', 'open', 'prev_close', 'close', 'high', 'low', 'volume', 'amount', 'date', 'time']
+    if not rows:
+        return pd.DataFrame(columns=columns, index=pd.Index([], name='code'))
+    return pd.DataFrame(rows).set_index('code')[columns]
+
+
+def fetch_realtime_quotes(codes, batch_size=200, workers=4, timeout=5):
+    """
+    批量获取实时行情（多个请求并发）
+
+    Returns:
+        parse_sina_quotes 的 DataFrame；请求失败的批次跳过
+    """
+    symbols = [code.replace('.', '') for code in codes]
+    batches = [symbols[i:i + batch_size] for i in range(0, len(symbols), batch_size)]
+
+    def fetch(batch):
+        try:
+            response = requests.get(SINA_QUOTE_URL + ','.join(batch), headers=SINA_HEADERS, timeout=timeout)
+            return parse_sina_quotes(response.content.decode('gbk', errors='ignore'))
+        except Exception as e:
+            print(f"获取行情失败: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        parts = [p for p in executor.map(fetch, batches) if p is not None and len(p) > 0]
+    if not parts:
+        return parse_sina_quotes('')
+    return pd.concat(parts)
+
+
+def is_trading_time(now):
+    """是否处于连续竞价时段（工作日）"""
+    if now.weekday() >= 5:
+        return False
+    return any(start <= now.time() <= end for start, end in SESSIONS)
+
+
+def session_fraction(now):
+    """当天已交易时间占全天的比例（开盘前为0，收盘后为1）"""
+    minutes = 0.0
+    for start, end in SESSIONS:
+        start_dt = datetime.combine(now.date(), start)
+        end_dt = datetime.combine(now.date(), end)
+        minutes += min(max((now - start_dt).total_seconds() / 60, 0), (end_dt - start_dt).total_seconds() / 60)
+    return minutes / SESSION_MINUTES
+
+
+class IntradayMonitor:
+    """盘中试算：已收盘K线 + 当天未完成的K线"""
+
+    def __init__(self, codes, names=None, strict_mode=True, min_quality=60, positions=None,
+                 stop_loss=0.10, stable_polls=3, project_volume=True):
+        """
+        Args:
+            codes: 自选股代码列表
+            names: {代码: 名称}
+            positions: 持仓 {代码: {'shares', 'cost_basis', ...}}（PortfolioManager.positions），用于卖出和止损
+            stop_loss: 止损比例（相对成本价）
+            stable_polls: 连续出现多少轮视为稳定
+            project_volume: 是否把未收盘的成交量按已交易时间折算成全天
+        """
+        self.codes = [_full_code(c) for c in codes]
+        self.names = dict(names or {})
+        self.strict_mode = strict_mode
+        self.min_quality = min_quality
+        self.positions = positions or {}
+        self.stop_loss = stop_loss
+        self.stable_polls = stable_polls
+        self.project_volume = project_volume
+        self.warmup = QQETrendStrategy().warmup_bars(strict_mode)
+        self._arrays = {}  # {字段: ndarray(行=K线, 列=股票)}，已收盘的K线
+        self._columns = []  # 面板中的股票代码（按列顺序）
+        self._last_dates = np.array([], dtype='datetime64[ns]')  # 每列最后一根已收盘K线的日期
+        self.stale_codes = []  # 上一轮因行情日期过期而跳过的股票
+        self._streaks = {}  # {(代码, 条件): 连续出现的轮数}
+
+    def load_history(self, stock_bars=None, today=None, store=None):
+        """
+        加载已收盘的日K线（只保留预热需要的根数）
+
+        Args:
+            stock_bars: {代码: K线DataFrame}；不提供时从本地K线存储获取
+            today: 当天日期，当天及以后的K线会被去掉（由实时行情提供）
+        """
+        today = pd.Timestamp(today or datetime.now().date())
+        if stock_bars is None:
+            store = store or BarStore()
+            stock_bars = store.prefetch(self.codes, days=history_days(self.warmup + 5))
+
+        committed = {}
+        for code in self.codes:
+            df = stock_bars.get(code)
+            if df is None:
+                continue
+            df = df[df.index < today]
+            if len(df) < 60:
+                continue
+            committed[code] = df.tail(self.warmup)
+
+        panel, _ = build_bar_panel(committed)
+        self._columns = list(committed)
+        self._last_dates = np.array([committed[code].index[-1] for code in self._columns], dtype='datetime64[ns]')
+        self._arrays = {field: frame.to_numpy() for field, frame in panel.items()}
+        print(f"已加载 {len(self._columns)}/{len(self.codes)} 只股票的日K线（每只 {self.warmup} 根）")
+
+    def evaluate(self, quotes, now=None):
+        """
+        用实时行情作为当天的K线试算信号（不修改已收盘的K线）
+
+        行情日期不是 now 当天、或不晚于该股票最后一根已收盘K线的股票被跳过（记录在 self.stale_codes），
+        避免把旧行情当作新的一根K线重复接上。
+
+        Returns:
+            DataFrame(index=代码)，列: buy_signal, sell_signal, signal_quality, trend
+        """
+        now = now or datetime.now()
+        present = [j for j, code in enumerate(self._columns) if code in quotes.index]
+        present_codes = [self._columns[j] for j in present]
+        quote_dates = pd.to_datetime(quotes['date'].reindex(present_codes), errors='coerce').to_numpy()
+        today = np.datetime64(pd.Timestamp(now.date()))
+        fresh = (quote_dates == today) & (quote_dates > self._last_dates[present])
+        self.stale_codes = [code for code, ok in zip(present_codes, fresh) if not ok]
+        columns = [j for j, ok in zip(present, fresh) if ok]
+        codes = [self._columns[j] for j in columns]
+        if not codes:
+            return pd.DataFrame(columns=['buy_signal', 'sell_signal', 'signal_quality', 'trend'])
+
+        partial = quotes.loc[codes]
+        fraction = session_fraction(now)
+        volume_scale = 1 / fraction if self.project_volume and 0 < fraction < 1 else 1.0
+        panel = {}
+        for field, values in self._arrays.items():
+            today_values = partial[field].to_numpy(dtype=float)
+            if field == 'volume':
+                today_values = today_values * volume_scale
+            panel[field] = pd.DataFrame(np.vstack([values[:, columns], today_values]), columns=codes)
+
+        frames = qqe_trend_panel(panel, strict_mode=self.strict_mode)
+        buy_column = 'buy_signal_strict' if self.strict_mode else 'buy_signal'
+        return pd.DataFrame({
+            'buy_signal': frames[buy_column].iloc[-1].to_numpy(dtype=bool),
+            'sell_signal': frames['sell_signal'].iloc[-1].to_numpy(dtype=bool),
+            'signal_quality': frames['signal_quality'].iloc[-1].to_numpy() if self.strict_mode else 0.0,
+            'trend': frames['trend'].iloc[-1].to_numpy(),
+        }, index=pd.Index(codes, name='code'))
+
+    def poll(self, quotes, now=None):
+        """
+        一轮试算：买入（未持有）、卖出和止损（持有）条件
+
+        Returns:
+            条件列表 [{'code', 'name', 'condition', 'price', 'change_pct', 'quality', 'streak', 'stable'}]，
+            止损已经触发，直接视为稳定
+        """
+        signals = self.evaluate(quotes, now)
+        found = []
+        for code, row in signals.iterrows():
+            quote = quotes.loc[code]
+            conditions = []
+            if code in self.positions:
+                pos = self.positions[code]
+                stop_price = pos['cost_basis'] / pos['shares'] * (1 - self.stop_loss)
+                if quote['low'] <= stop_price:
+                    conditions.append('止损')
+                elif row['sell_signal']:
+                    conditions.append('卖出')
+            elif row['buy_signal'] and row['signal_quality'] >= self.min_quality:
+                conditions.append('买入')
+            for condition in conditions:
+                found.append({
+                    'code': code,
+                    'name': self.names.get(code) or quote.get('name', ''),
+                    'condition': condition,
+                    'price': quote['close'],
+                    'change_pct': (quote['close'] / quote['prev_close'] - 1) * 100 if quote['prev_close'] > 0 else 0.0,
+                    'quality': row['signal_quality'],
+                })
+
+        # 连续出现的轮数：本轮没有出现的条件清零
+        current = {(item['code'], item['condition']) for item in found}
+        self._streaks = {key: self._streaks.get(key, 0) + 1 for key in current}
+        for item in found:
+            item['streak'] = self._streaks[(item['code'], item['condition'])]
+            item['stable'] = item['condition'] == '止损' or item['streak'] >= self.stable_polls
+        found.sort(key=lambda x: (x['condition'] != '止损', x['condition'] != '卖出', -x['quality']))
+        return found
+
+    def report(self, found, now=None):
+        """打印一轮试算结果"""
+        now = now or datetime.now()
+        print(f"\n[{now.strftime('%H:%M:%S')}] 盘中试算（未收盘，信号可能变化）: {len(found)} 个条件")
+        if not found:
+            return
+        print(f"{'条件':<6}{'代码':<12}{'名称':<10}{'现价':>8}{'涨跌%':>8}{'质量':>7}  {'稳定':<8}")
+        for item in found:
+            stable = '✅' if item['stable'] else f"{item['streak']}/{self.stable_polls}"
+            print(f"{item['condition']:<6}{item['code']:<12}{item['name']:<10}{item['price']:>8.2f}"
+                  f"{item['change_pct']:>+8.2f}{item['quality']:>7.1f}  {stable:<8}")
+
+    def run(self, interval=30, once=False):
+        """交易时间内每 interval 秒试算一轮，收盘后退出（once=True 时只运行一轮）"""
+        while True:
+            now = datetime.now()
+            if once or is_trading_time(now):
+                start = time.time()
+                quotes = fetch_realtime_quotes(self._columns)
+                found = self.poll(quotes, now)
+                self.report(found, now)
+                print(f"本轮: {len(quotes)} 只行情, 耗时 {time.time() - start:.1f}秒")
+                if self.stale_codes:
+                    print(f"行情日期过期（开盘前/停牌），跳过 {len(self.stale_codes)} 只")
+                if once:
+                    return found
+            elif now.time() > SESSIONS[-1][1] or now.weekday() >= 5:
+                print("已收盘，盘中监控结束。")
+                return None
+            time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='盘中监控：实时行情试算买入/卖出/止损条件')
+    parser.add_argument('--codes', type=str, nargs='+', default=[], help='自选股代码，如 300750 sh.688001')
+    parser.add_argument('--board', type=str, help='加入板块股票 chinext/star/chinext+star/all')
+    parser.add_argument('--max-stocks', type=int, default=300, help='板块股票数量上限 (默认300)')
+    parser.add_argument('--portfolio', type=str, default='portfolio.json', help='持仓文件，持仓股票自动加入并检查卖出/止损')
+    parser.add_argument('--interval', type=int, default=30, help='轮询间隔秒数 (默认30)')
+    parser.add_argument('--stop-loss', type=float, default=0.10, help='止损比例 (默认0.10)')
+    parser.add_argument('--no-strict', action='store_true', help='使用标准模式')
+    parser.add_argument('--min-quality', type=float, default=60, help='最低信号质量 (默认60)')
+    parser.add_argument('--stable-polls', type=int, default=3, help='连续出现多少轮视为稳定 (默认3)')
+    parser.add_argument('--once', action='store_true', help='只运行一轮（不检查交易时间）')
+    args = parser.parse_args()
+
+    positions = {}
+    journal = PortfolioJournal(args.portfolio)
+    if journal.exists():
+        positions = journal.load(default_cash=0, read_only=True)[1]  # 只读，不修改持仓文件
+
+    codes = [_full_code(c) for c in args.codes]
+    names = {code: pos.get('name', code) for code, pos in positions.items()}
+    if args.board:
+        from backtest import StockDataLoader
+        for stock in StockDataLoader.get_stock_list(board_filter=args.board, max_stocks=args.max_stocks):
+            codes.append(stock['code'])
+            names[stock['code']] = stock['name']
+    codes = list(dict.fromkeys(codes + list(positions)))
+    if not codes:
+        print("请通过 --codes / --board 指定自选股，或在持仓文件中有持仓。")
+        return
+
+    monitor = IntradayMonitor(codes, names=names, strict_mode=not args.no_strict, min_quality=args.min_quality,
+                              positions=positions, stop_loss=args.stop_loss, stable_polls=args.stable_polls)
+    monitor.load_history()
+    monitor.run(interval=args.interval, once=args.once)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+回测绩效指标
+输入权益曲线数组和列式交易表，全部用 numpy 向量化计算，各回测引擎和参数优化器共用。
+
+- equity_metrics: 收益率、年化收益(CAGR)、波动率、夏普、索提诺、卡玛、最大回撤及持续天数、持仓占比、换手率
+- trade_metrics: 胜率、平均/中位收益、盈亏比、利润因子、按退出原因分组统计
+- 无风险利率按 0 计算，年化按每年 252 个交易日
+"""
+import numpy as np
+import pandas as pd
+
+TRADING_DAYS = 252
+
+
+def column(trades, name, default=None):
+    """
+    从交易表取一列为数组（支持 DataFrame、{列名: 数组} 和记录列表）
+
+    列不存在时返回 default（None 或填充值）
+    """
+    if isinstance(trades, pd.DataFrame):
+        if name not in trades.columns:
+            return None if default is None else np.full(len(trades), default)
+        return trades[name].to_numpy()
+    if isinstance(trades, dict):
+        if name not in trades:
+            return None if default is None else np.full(len(next(iter(trades.values()), [])), default)
+        return np.asarray(trades[name])
+    if len(trades) == 0 or name not in trades[0]:
+        return None if default is None else np.full(len(trades), default)
+    return np.array([t.get(name, default) for t in trades])
+
+
+def drawdown_stats(equity):
+    """
+    最大回撤及最长回撤持续期
+
+    Returns:
+        (max_drawdown, max_drawdown_duration)
+            max_drawdown: 相对前高的最大回撤（%，负数或0）
+            max_drawdown_duration: 最长的低于前高的K线数（未修复的回撤计到最后一根）
+    """
+    equity = np.asarray(equity, dtype=float)
+    if len(equity) == 0:
+        return 0.0, 0
+    running_max = np.maximum.accumulate(equity)
+    max_dd = float(((equity - running_max) / running_max * 100).min())
+
+    bars = np.arange(len(equity))
+    last_peak = np.maximum.accumulate(np.where(equity >= running_max, bars, 0))
+    duration = int((bars - last_peak).max())
+    return max_dd, duration
+
+
+def equity_metrics(equity, initial_capital=None, position_count=None, traded_amount=0.0,
+                   periods_per_year=TRADING_DAYS):
+    """
+    基于每日权益的组合指标
+
+    Args:
+        equity: 每日权益数组
+        initial_capital: 初始资金（默认取第一天权益），收益率和日收益从它起算
+        position_count: 每日持仓数数组，用于计算持仓占比（可选）
+        traded_amount: 买入+卖出成交总金额，用于计算换手率（可选）
+        periods_per_year: 每年交易日数
+
+    Returns:
+        指标字典（百分比指标单位为%）
+    """
+    equity = np.asarray(equity, dtype=float)
+    if len(equity) == 0:
+        return {
+            'total_return': 0.0, 'cagr': 0.0, 'volatility': 0.0, 'sharpe': 0.0, 'sortino': 0.0,
+            'calmar': 0.0, 'max_drawdown': 0.0, 'max_drawdown_duration': 0, 'exposure': 0.0,
+            'turnover': 0.0, 'final_equity': float(initial_capital or 0.0)
+        }
+
+    initial = float(initial_capital) if initial_capital else float(equity[0])
+    values = np.concatenate(([initial], equity))
+    final_equity = float(equity[-1])
+    total_return = (final_equity - initial) / initial * 100
+    years = len(equity) / periods_per_year
+    cagr = ((final_equity / initial) ** (1 / years) - 1) * 100 if final_equity > 0 else -100.0
+
+    returns = np.diff(values) / values[:-1]
+    mean_return = returns.mean()
+    std = returns.std(ddof=1) if len(returns) > 1 else 0.0
+    downside = np.sqrt(np.mean(np.minimum(returns, 0) ** 2))
+    volatility = std * np.sqrt(periods_per_year) * 100
+    sharpe = mean_return / std * np.sqrt(periods_per_year) if std > 0 else 0.0
+    sortino = mean_return / downside * np.sqrt(periods_per_year) if downside > 0 else 0.0
+
+    max_dd, dd_duration = drawdown_stats(equity)
+    calmar = cagr / abs(max_dd) if max_dd < 0 else 0.0
+
+    if position_count is not None and len(position_count) == len(equity):
+        exposure = float(np.mean(np.asarray(position_count) > 0) * 100)
+    else:
+        exposure = 0.0
+    # 年化换手率（倍）：单边成交额 / 平均权益 / 年数
+    turnover = traded_amount / 2 / equity.mean() / years if equity.mean() > 0 else 0.0
+
+    return {
+        'total_return': float(total_return),
+        'cagr': float(cagr),
+        'volatility': float(volatility),
+        'sharpe': float(sharpe),
+        'sortino': float(sortino),
+        'calmar': float(calmar),
+        'max_drawdown': max_dd,
+        'max_drawdown_duration': dd_duration,
+        'exposure': exposure,
+        'turnover': float(turnover),
+        'final_equity': final_equity,
+    }
+
+
+def trade_metrics(profit_pct, exit_reason=None, profit=None):
+    """
+    基于已平仓交易的统计
+
+    Args:
+        profit_pct: 每笔收益率数组（%）
+        exit_reason: 每笔退出原因数组（可选），用于分组统计
+        profit: 每笔盈亏金额数组（可选）；提供时利润因子按金额计算，否则按收益率
+
+    Returns:
+        指标字典；payoff_ratio 为 平均盈利/平均亏损（盈亏比），profit_factor 为 总盈利/总亏损，
+        exit_reasons 为 {原因: {'count', 'win_rate', 'avg_profit', 'total_profit'}}
+    """
+    profit_pct = np.asarray(profit_pct, dtype=float)
+    n = len(profit_pct)
+    if n == 0:
+        return {
+            'total_trades': 0, 'win_count': 0, 'loss_count': 0, 'win_rate': 0.0,
+            'avg_profit': 0.0, 'median_profit': 0.0, 'total_profit_pct': 0.0,
+            'max_profit': 0.0, 'min_profit': 0.0, 'avg_win': 0.0, 'avg_loss': 0.0,
+            'payoff_ratio': 0.0, 'profit_factor': 0.0, 'exit_reasons': {}
+        }
+
+    wins = profit_pct > 0
+    win_count = int(wins.sum())
+    loss_count = n - win_count
+    avg_win = float(profit_pct[wins].mean()) if win_count else 0.0
+    avg_loss = float(abs(profit_pct[~wins].mean())) if loss_count else 0.0
+
+    amounts = profit_pct if profit is None else np.asarray(profit, dtype=float)
+    gross_win = amounts[amounts > 0].sum()
+    gross_loss = -amounts[amounts < 0].sum()
+
+    exit_reasons = {}
+    if exit_reason is not None:
+        reasons, inverse = np.unique(np.asarray(exit_reason, dtype=str), return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(reasons))
+        win_counts = np.bincount(inverse, weights=wins, minlength=len(reasons))
+        totals = np.bincount(inverse, weights=profit_pct, minlength=len(reasons))
+        for r, reason in enumerate(reasons):
+            exit_reasons[str(reason)] = {
+                'count': int(counts[r]),
+                'win_rate': float(win_counts[r] / counts[r] * 100),
+                'avg_profit': float(totals[r] / counts[r]),
+                'total_profit': float(totals[r]),
+            }
+
+    return {
+        'total_trades': n,
+        'win_count': win_count,
+        'loss_count': loss_count,
+        'win_rate': win_count / n * 100,
+        'avg_profit': float(profit_pct.mean()),
+        'median_profit': float(np.median(profit_pct)),
+        'total_profit_pct': float(profit_pct.sum()),
+        'max_profit': float(profit_pct.max()),
+        'min_profit': float(profit_pct.min()),
+        'avg_win': avg_win,
+        'avg_loss': avg_loss,
+        'payoff_ratio': avg_win / avg_loss if avg_loss != 0 else 0.0,
+        'profit_factor': float(gross_win / gross_loss) if gross_loss > 0 else 0.0,
+        'exit_reasons': exit_reasons,
+    }
+
+
+def format_exit_reasons(exit_reasons):
+    """按退出原因分组统计的单行摘要"""
+    items = sorted(exit_reasons.items(), key=lambda x: -x[1]['count'])
+    return ', '.join(f"{reason} {s['count']}笔/胜率{s['win_rate']:.0f}%/均{s['avg_profit']:.2f}%"
+                     for reason, s in items)
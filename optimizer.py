@@ -0,0 +1,682 @@
+"""
+参数优化器
+对组合回测引擎(PortfolioBacktester)和策略(qqe_trend_strategy)参数做网格/随机搜索
+
+- 多进程并行评估参数组合
+- 每个结果（参数哈希、指标、权益摘要）持久化到本地SQLite数据库
+- 重复运行时自动跳过已评估的参数点
+- 输出 收益率 vs 最大回撤 的帕累托前沿
+- 可选逐级减半搜索：短窗口淘汰差参数，幸存者续跑更长窗口
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import itertools
+import json
+import os
+import random
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+
+from qqe_trend_strategy import qqe_trend_strategy
+from backtest import PortfolioBacktester, StockDataLoader
+from metrics import column, equity_metrics, trade_metrics
+
+
+# 影响信号计算的策略参数（传给 qqe_trend_strategy）
+STRATEGY_PARAMS = [
+    'strict_mode', 'enhanced_entry',
+    'rsi_length_primary', 'rsi_smoothing_primary', 'qqe_factor_primary', 'threshold_primary',
+    'rsi_length_secondary', 'rsi_smoothing_secondary', 'qqe_factor_secondary', 'threshold_secondary',
+    'bollinger_length', 'bollinger_multiplier', 'ma_type', 'ma_period', 'alma_offset', 'alma_sigma',
+]
+
+# 组合引擎参数（传给 PortfolioBacktester，注意 max_stocks 表示最大持仓数）
+ENGINE_PARAMS = [
+    'max_stocks', 'commission', 'slippage', 'stop_loss', 'take_profit', 'trailing_stop',
+    'layered_tp', 'pyramid_enabled', 'use_index_filter', 'index_filter_mode', 'index_min_strength',
+    'use_atr_stop', 'atr_multiplier', 'use_drawdown_exit', 'drawdown_threshold', 'min_profit_for_drawdown',
+]
+
+# 撮合参数（传给 run_on_market_data）
+RUN_PARAMS = ['min_quality']
+
+# 默认搜索空间
+DEFAULT_SEARCH_SPACE = {
+    'min_quality': [50, 60, 70],
+    'stop_loss': [0.08, 0.10, 0.12],
+    'take_profit': [0.15, 0.20, 0.30],
+    'use_drawdown_exit': [False, True],
+}
+
+
+def split_params(params):
+    """
+    将一组参数拆分为 (策略参数, 引擎参数, 撮合参数)
+
+    Raises:
+        ValueError: 出现未知参数名
+    """
+    strategy_kwargs, engine_kwargs, run_kwargs = {}, {}, {}
+    for key, value in params.items():
+        if key in STRATEGY_PARAMS:
+            strategy_kwargs[key] = value
+        elif key in ENGINE_PARAMS:
+            engine_kwargs[key] = value
+        elif key in RUN_PARAMS:
+            run_kwargs[key] = value
+        else:
+            raise ValueError(f"未知参数: {key}")
+    strategy_kwargs.setdefault('strict_mode', True)
+    return strategy_kwargs, engine_kwargs, run_kwargs
+
+
+def params_hash(params, context=None):
+    """计算参数点的哈希（包含数据上下文，数据变化后不会误用旧结果）"""
+    payload = json.dumps({'params': params, 'context': context or {}}, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def _to_builtin(value):
+    """numpy 标量转为 Python 内置类型，便于JSON序列化"""
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def grid_points(space):
+    """
+    生成网格搜索的全部参数点
+
+    Args:
+        space: {param: [values]} 或 {param: {'min':, 'max':, 'step':}}
+    """
+    keys = sorted(space.keys())
+    value_lists = []
+    for key in keys:
+        spec = space[key]
+        if isinstance(spec, dict):
+            if 'step' not in spec:
+                raise ValueError(f"网格搜索的区间参数 {key} 需要指定 step")
+            values = np.arange(spec['min'], spec['max'] + spec['step'] / 2, spec['step'])
+            if spec.get('type') == 'int':
+                values = values.astype(int)
+            value_lists.append([_to_builtin(v) for v in values])
+        else:
+            value_lists.append(list(spec))
+
+    for combo in itertools.product(*value_lists):
+        yield dict(zip(keys, combo))
+
+
+def random_points(space, n_samples, seed=None):
+    """
+    随机采样参数点（列表=等概率选取，区间=均匀分布，'log': true 时在对数空间采样）
+    """
+    rng = random.Random(seed)
+    keys = sorted(space.keys())
+    seen = set()
+    points = []
+    max_attempts = n_samples * 20
+    attempts = 0
+
+    while len(points) < n_samples and attempts < max_attempts:
+        attempts += 1
+        point = {}
+        for key in keys:
+            spec = space[key]
+            if isinstance(spec, dict):
+                low, high = spec['min'], spec['max']
+                if spec.get('type') == 'int':
+                    value = rng.randint(int(low), int(high))
+                elif spec.get('log'):
+                    value = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+                else:
+                    value = rng.uniform(low, high)
+                if 'round' in spec:
+                    value = round(value, spec['round'])
+                point[key] = value
+            else:
+                point[key] = rng.choice(list(spec))
+
+        key_str = json.dumps(point, sort_keys=True)
+        if key_str in seen:
+            continue
+        seen.add(key_str)
+        points.append(point)
+
+    return points
+
+
+def pareto_front(rows, return_key='total_return', dd_key='max_drawdown'):
+    """
+    计算 收益率(越大越好) vs 最大回撤(负值，越接近0越好) 的帕累托前沿
+
+    Returns:
+        非支配的结果列表，按最大回撤从小到大(由好到差)排序
+    """
+    candidates = [r for r in rows if r.get(return_key) is not None and r.get(dd_key) is not None]
+    # 按回撤由好到差排序，回撤相同时收益高的在前；依次保留收益创新高的点
+    candidates.sort(key=lambda r: (-r[dd_key], -r[return_key]))
+
+    front = []
+    best_return = -np.inf
+    for row in candidates:
+        if row[return_key] > best_return:
+            front.append(row)
+            best_return = row[return_key]
+    return front
+
+
+class ResultStore:
+    """优化结果存储（SQLite）"""
+
+    def __init__(self, db_path='optimizer_results.db'):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                params_hash TEXT PRIMARY KEY,
+                params TEXT NOT NULL,
+                context TEXT,
+                total_return REAL,
+                max_drawdown REAL,
+                trade_count INTEGER,
+                metrics TEXT,
+                equity_summary TEXT,
+                elapsed REAL,
+                created_at TEXT
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_results_return ON results(total_return)")
+        self.conn.commit()
+
+    def has(self, p_hash):
+        cur = self.conn.execute("SELECT 1 FROM results WHERE params_hash = ?", (p_hash,))
+        return cur.fetchone() is not None
+
+    def evaluated_hashes(self):
+        return {row[0] for row in self.conn.execute("SELECT params_hash FROM results")}
+
+    def save(self, p_hash, params, context, metrics, equity_summary, elapsed):
+        self.conn.execute(
+            """INSERT OR REPLACE INTO results
+               (params_hash, params, context, total_return, max_drawdown, trade_count,
+                metrics, equity_summary, elapsed, created_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (
+                p_hash,
+                json.dumps(params, sort_keys=True),
+                json.dumps(context or {}, sort_keys=True),
+                metrics.get('total_return'),
+                metrics.get('max_drawdown'),
+                metrics.get('trade_count'),
+                json.dumps(metrics, default=_to_builtin),
+                json.dumps(equity_summary, default=_to_builtin),
+                elapsed,
+                datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            )
+        )
+        self.conn.commit()
+
+    def load_results(self, context=None):
+        """读取结果（指定context时只返回该数据上下文下的结果）"""
+        rows = []
+        for row in self.conn.execute(
+            "SELECT params_hash, params, context, metrics, equity_summary FROM results"
+        ):
+            row_context = json.loads(row[2]) if row[2] else {}
+            if context is not None and row_context != json.loads(json.dumps(context, sort_keys=True)):
+                continue
+            item = {'params_hash': row[0], 'params': json.loads(row[1])}
+            item.update(json.loads(row[3]))
+            item['equity_summary'] = json.loads(row[4]) if row[4] else {}
+            rows.append(item)
+        return rows
+
+    def close(self):
+        self.conn.close()
+
+
+def summarize_run(equity_curve, trades, initial_capital):
+    """根据权益曲线和交易记录汇总指标与权益摘要（指标计算见 metrics.py）"""
+    if not equity_curve:
+        metrics = {'total_return': 0.0, 'max_drawdown': 0.0, 'trade_count': 0,
+                   'sell_count': 0, 'win_rate': 0.0, 'final_equity': initial_capital}
+        return metrics, {}
+
+    equity = np.fromiter((x['equity'] for x in equity_curve), dtype=float, count=len(equity_curve))
+    position_count = np.fromiter((x['position_count'] for x in equity_curve), dtype=float, count=len(equity_curve))
+    traded_amount = float(sum(abs(t.get('amount', 0)) for t in trades))
+    sells = [t for t in trades if t['action'] == 'SELL']
+
+    eq = equity_metrics(equity, initial_capital, position_count=position_count, traded_amount=traded_amount)
+    tm = trade_metrics(column(sells, 'profit_pct', 0.0), column(sells, 'reason', ''), column(sells, 'profit', 0.0))
+
+    metrics = {
+        'total_return': eq['total_return'],
+        'max_drawdown': eq['max_drawdown'],
+        'trade_count': len(trades),
+        'sell_count': len(sells),
+        'win_rate': tm['win_rate'],
+        'final_equity': eq['final_equity'],
+        'cagr': eq['cagr'],
+        'volatility': eq['volatility'],
+        'sharpe': eq['sharpe'],
+        'sortino': eq['sortino'],
+        'calmar': eq['calmar'],
+        'max_drawdown_duration': eq['max_drawdown_duration'],
+        'exposure': eq['exposure'],
+        'turnover': eq['turnover'],
+        'profit_factor': tm['profit_factor'],
+        'payoff_ratio': tm['payoff_ratio'],
+        'exit_reasons': tm['exit_reasons'],
+    }
+    equity_summary = {
+        'start_date': equity_curve[0]['date'],
+        'end_date': equity_curve[-1]['date'],
+        'days': len(equity_curve),
+        'min_equity': float(equity.min()),
+        'max_equity': float(equity.max()),
+        'final_equity': eq['final_equity'],
+        'avg_positions': float(position_count.mean()),
+    }
+    return metrics, equity_summary
+
+
+def load_stock_data(board='chinext+star', max_stocks=100, history_days=250):
+    """
+    加载股票池原始K线（只下载一次，供所有参数组合复用）
+
+    Returns:
+        {code: {'name': str, 'df': DataFrame}}
+    """
+    stock_list = StockDataLoader.get_stock_list(board_filter=board, max_stocks=max_stocks)
+    stock_data = {}
+    for i, stock in enumerate(stock_list):
+        print(f"\r下载进度: {i+1}/{len(stock_list)}", end='', flush=True)
+        try:
+            df = StockDataLoader.get_stock_data(stock['code'], days=history_days)
+            if df is not None and len(df) >= 60:
+                stock_data[stock['code']] = {'name': stock['name'], 'df': df}
+        except Exception:
+            continue
+    print(f"\n有效股票数据: {len(stock_data)}只")
+    return stock_data
+
+
+# ---- 进程内评估状态（每个工作进程各自持有一份） ----
+_STOCK_DATA = None
+_MARKET_CACHE = {}  # strategy_key -> (market_data, sorted_dates)
+
+
+def _init_worker(stock_data):
+    global _STOCK_DATA, _MARKET_CACHE
+    _STOCK_DATA = stock_data
+    _MARKET_CACHE = {}
+
+
+def get_market_data(strategy_kwargs):
+    """
+    获取某组策略参数下的按日行情（同一进程内按策略参数缓存，
+    只改引擎参数的参数点不会重复计算信号）
+    """
+    key = json.dumps(strategy_kwargs, sort_keys=True)
+    if key not in _MARKET_CACHE:
+        market_data_cache = {}
+        for code, item in _STOCK_DATA.items():
+            try:
+                result = qqe_trend_strategy(item['df'], **strategy_kwargs)
+                market_data_cache[code] = {'name': item['name'], 'data': result}
+            except Exception:
+                continue
+        market_data, sorted_dates, _ = PortfolioBacktester.build_market_data(
+            market_data_cache, strict_mode=strategy_kwargs.get('strict_mode', True)
+        )
+        _MARKET_CACHE[key] = (market_data, sorted_dates)
+    return _MARKET_CACHE[key]
+
+
+def evaluate_params(params, initial_capital=100000, quiet=True):
+    """
+    评估单个参数点
+
+    Returns:
+        (metrics, equity_summary, elapsed)
+    """
+    start = time.time()
+    strategy_kwargs, engine_kwargs, run_kwargs = split_params(params)
+    market_data, sorted_dates = get_market_data(strategy_kwargs)
+
+    engine = PortfolioBacktester(
+        initial_capital=initial_capital,
+        strict_mode=strategy_kwargs['strict_mode'],
+        **engine_kwargs
+    )
+    output = io.StringIO() if quiet else None
+    with contextlib.redirect_stdout(output) if quiet else contextlib.nullcontext():
+        equity_curve, trades = engine.run_on_market_data(
+            market_data, sorted_dates, min_quality=run_kwargs.get('min_quality', 60)
+        )
+
+    metrics, equity_summary = summarize_run(equity_curve, trades, initial_capital)
+    return metrics, equity_summary, time.time() - start
+
+
+def _evaluate_task(p_hash, params, initial_capital):
+    metrics, equity_summary, elapsed = evaluate_params(params, initial_capital)
+    return p_hash, params, metrics, equity_summary, elapsed
+
+
+def run_search(stock_data, points, store, context, initial_capital=100000, workers=1):
+    """
+    并行评估参数点并写入结果库（已评估的参数点直接跳过）
+
+    Returns:
+        本次新评估的参数点数量
+    """
+    evaluated = store.evaluated_hashes()
+    pending = []
+    for params in points:
+        p_hash = params_hash(params, context)
+        if p_hash not in evaluated:
+            pending.append((p_hash, params))
+            evaluated.add(p_hash)
+
+    skipped = len(points) - len(pending)
+    print(f"参数点: {len(points)} 个, 已评估跳过: {skipped} 个, 待评估: {len(pending)} 个")
+    if not pending:
+        return 0
+
+    done = 0
+    if workers <= 1:
+        _init_worker(stock_data)
+        for p_hash, params in pending:
+            _, _, metrics, equity_summary, elapsed = _evaluate_task(p_hash, params, initial_capital)
+            store.save(p_hash, params, context, metrics, equity_summary, elapsed)
+            done += 1
+            print(f"\r评估进度: {done}/{len(pending)}", end='', flush=True)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(stock_data,)) as executor:
+            futures = [executor.submit(_evaluate_task, p_hash, params, initial_capital)
+                       for p_hash, params in pending]
+            for future in as_completed(futures):
+                try:
+                    p_hash, params, metrics, equity_summary, elapsed = future.result()
+                except Exception as e:
+                    print(f"\n评估失败: {e}")
+                    continue
+                store.save(p_hash, params, context, metrics, equity_summary, elapsed)
+                done += 1
+                print(f"\r评估进度: {done}/{len(pending)}", end='', flush=True)
+    print()
+    return done
+
+
+def _advance_task(p_hash, params, engine, start_idx, end_idx, initial_capital):
+    """
+    将某个参数点的回测从 start_idx 推进到 end_idx（日期下标）
+
+    engine 为 None 时新建引擎；否则在其已有状态（现金、持仓、权益曲线）上继续撮合。
+    """
+    start = time.time()
+    strategy_kwargs, engine_kwargs, run_kwargs = split_params(params)
+    market_data, sorted_dates = get_market_data(strategy_kwargs)
+
+    if engine is None:
+        engine = PortfolioBacktester(
+            initial_capital=initial_capital,
+            strict_mode=strategy_kwargs['strict_mode'],
+            **engine_kwargs
+        )
+    with contextlib.redirect_stdout(io.StringIO()):
+        engine.run_on_market_data(
+            market_data, sorted_dates[start_idx:end_idx],
+            min_quality=run_kwargs.get('min_quality', 60)
+        )
+    return p_hash, params, engine, time.time() - start
+
+
+def halving_schedule(n_dates, min_days=40, eta=3):
+    """
+    逐轮加长的回测窗口（日期下标的截止位置），最后一轮覆盖全部日期
+    """
+    ends = []
+    window = max(1, min_days)
+    while window < n_dates:
+        ends.append(window)
+        window *= eta
+    ends.append(n_dates)
+    return ends
+
+
+SCORE_METRICS = ['total_return', 'return_dd', 'sharpe', 'calmar']
+
+
+def score_run(metrics, metric='total_return'):
+    """候选排序分数：total_return=总收益率, return_dd=收益率/最大回撤, sharpe=夏普比率, calmar=卡玛比率"""
+    if metric == 'return_dd':
+        return metrics['total_return'] / max(abs(metrics['max_drawdown']), 1.0)
+    if metric in ('sharpe', 'calmar'):
+        return metrics.get(metric, 0.0)
+    return metrics['total_return']
+
+
+def run_successive_halving(stock_data, points, store, context, initial_capital=100000, workers=1,
+                           min_days=40, eta=3, metric='total_return'):
+    """
+    逐级减半搜索（Successive Halving）
+
+    所有候选先在最前面的 min_days 个交易日上回测，按分数保留前 1/eta，
+    幸存者从上一轮结束的位置继续撮合（复用引擎状态，不从头重跑），窗口扩大 eta 倍，
+    直到覆盖全部日期。只有跑完全程的参数点会写入结果库。
+
+    Returns:
+        本次写入结果库的参数点数量
+    """
+    evaluated = store.evaluated_hashes()
+    candidates = {}
+    for params in points:
+        p_hash = params_hash(params, context)
+        if p_hash not in evaluated and p_hash not in candidates:
+            candidates[p_hash] = {'params': params, 'engine': None, 'elapsed': 0.0}
+
+    print(f"参数点: {len(points)} 个, 已评估跳过: {len(points) - len(candidates)} 个, 参与减半搜索: {len(candidates)} 个")
+    if not candidates:
+        return 0
+    searched = len(candidates)  # 去掉重复和已评估的参数点后实际参与搜索的数量
+
+    all_dates = set()
+    for item in stock_data.values():
+        all_dates.update(item['df'].index)
+    n_dates = len(all_dates)
+    schedule = halving_schedule(n_dates, min_days=min_days, eta=eta)
+    print(f"交易日: {n_dates} | 各轮窗口: {schedule} | 淘汰比例: 每轮保留 1/{eta}")
+
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                       initargs=(stock_data,))
+    else:
+        _init_worker(stock_data)
+
+    simulated_days = 0
+    prev_end = 0
+    try:
+        for rung, end in enumerate(schedule, 1):
+            tasks = [(p_hash, c['params'], c['engine'], prev_end, end, initial_capital)
+                     for p_hash, c in candidates.items()]
+            if executor is None:
+                outputs = [_advance_task(*task) for task in tasks]
+            else:
+                outputs = []
+                futures = [executor.submit(_advance_task, *task) for task in tasks]
+                for future in as_completed(futures):
+                    try:
+                        outputs.append(future.result())
+                    except Exception as e:
+                        print(f"\n评估失败: {e}")
+
+            simulated_days += len(outputs) * (end - prev_end)
+            scored = []
+            for p_hash, params, engine, elapsed in outputs:
+                candidates[p_hash]['engine'] = engine
+                candidates[p_hash]['elapsed'] += elapsed
+                metrics, _ = summarize_run(engine.equity_curve, engine.trades, initial_capital)
+                scored.append((score_run(metrics, metric), p_hash))
+
+            scored.sort(reverse=True)
+            if end < n_dates:
+                keep = max(1, int(np.ceil(len(scored) / eta)))
+                survivors = {p_hash for _, p_hash in scored[:keep]}
+                candidates = {h: c for h, c in candidates.items() if h in survivors}
+                print(f"第{rung}轮: 窗口 {end} 天, 评估 {len(scored)} 组, 保留 {len(candidates)} 组"
+                      f" (最高分 {scored[0][0]:.2f})" if scored else f"第{rung}轮: 无有效结果")
+            else:
+                candidates = {h: c for h, c in candidates.items() if h in {p for _, p in scored}}
+                print(f"第{rung}轮: 全周期 {end} 天, 评估 {len(scored)} 组")
+            prev_end = end
+            if not candidates:
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    for p_hash, c in candidates.items():
+        engine = c['engine']
+        metrics, equity_summary = summarize_run(engine.equity_curve, engine.trades, initial_capital)
+        store.save(p_hash, c['params'], context, metrics, equity_summary, c['elapsed'])
+
+    full_cost = searched * n_dates
+    print(f"模拟交易日总量: {simulated_days} (全量评估需要 {full_cost}, 节省 "
+          f"{(1 - simulated_days / full_cost) * 100 if full_cost else 0:.1f}%)")
+    return len(candidates)
+
+
+def print_report(rows, top_n=10):
+    """打印最佳结果和帕累托前沿"""
+    if not rows:
+        print("没有可用的评估结果。")
+        return
+
+    def fmt_params(params):
+        return ', '.join(f"{k}={v}" for k, v in sorted(params.items()))
+
+    def fmt_ratio(row, key):
+        # 旧版本结果库中没有这些指标
+        return f"{row[key]:<8.2f}" if key in row else f"{'-':<8}"
+
+    print("\n" + "=" * 100)
+    print(f"收益率最高的 {min(top_n, len(rows))} 组参数")
+    print("=" * 100)
+    print(f"{'总收益率':<12} | {'最大回撤':<12} | {'夏普':<8} | {'卡玛':<8} | {'交易数':<8} | 参数")
+    print("-" * 100)
+    for row in sorted(rows, key=lambda r: r['total_return'], reverse=True)[:top_n]:
+        print(f"{row['total_return']:<11.2f}% | {row['max_drawdown']:<11.2f}% | {fmt_ratio(row, 'sharpe')} | "
+              f"{fmt_ratio(row, 'calmar')} | {row['trade_count']:<8} | {fmt_params(row['params'])}")
+
+    front = pareto_front(rows)
+    print("\n" + "=" * 100)
+    print(f"帕累托前沿 (收益率 vs 最大回撤, 共 {len(front)} 组)")
+    print("=" * 100)
+    print(f"{'总收益率':<12} | {'最大回撤':<12} | {'夏普':<8} | {'卡玛':<8} | {'交易数':<8} | 参数")
+    print("-" * 100)
+    for row in front:
+        print(f"{row['total_return']:<11.2f}% | {row['max_drawdown']:<11.2f}% | {fmt_ratio(row, 'sharpe')} | "
+              f"{fmt_ratio(row, 'calmar')} | {row['trade_count']:<8} | {fmt_params(row['params'])}")
+    print("=" * 100)
+
+
+def load_search_space(path):
+    """从JSON文件加载搜索空间"""
+    if not path:
+        return dict(DEFAULT_SEARCH_SPACE)
+    with open(path, 'r', encoding='utf-8') as f:
+        space = json.load(f)
+    # 提前校验参数名
+    split_params({k: None for k in space})
+    return space
+
+
+def main():
+    parser = argparse.ArgumentParser(description='QQE策略参数优化器（网格/随机搜索）')
+    parser.add_argument('--space', type=str, help='搜索空间JSON文件，如 {"stop_loss": [0.08, 0.1], "take_profit": {"min": 0.1, "max": 0.3}}')
+    parser.add_argument('--method', type=str, default='grid', choices=['grid', 'random'], help='搜索方式')
+    parser.add_argument('--samples', type=int, default=50, help='随机搜索的采样数量')
+    parser.add_argument('--seed', type=int, default=42, help='随机搜索种子')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='并行进程数')
+    parser.add_argument('--db', type=str, default='optimizer_results.db', help='结果数据库路径')
+    parser.add_argument('--board', type=str, default='chinext+star', help='板块筛选')
+    parser.add_argument('--max-stocks', type=int, default=100, help='股票池大小')
+    parser.add_argument('--history-days', type=int, default=250, help='历史数据天数')
+    parser.add_argument('--budget', type=float, default=100000, help='初始资金')
+    parser.add_argument('--halving', action='store_true', help='使用逐级减半搜索：短窗口初筛，幸存者续跑更长窗口')
+    parser.add_argument('--min-days', type=int, default=40, help='逐级减半的首轮窗口（交易日）')
+    parser.add_argument('--eta', type=int, default=3, help='逐级减半每轮保留 1/eta，窗口扩大 eta 倍')
+    parser.add_argument('--metric', type=str, default='total_return', choices=SCORE_METRICS,
+                        help='逐级减半的排序指标: total_return(总收益率), return_dd(收益率/最大回撤)')
+    parser.add_argument('--top', type=int, default=10, help='显示前N组结果')
+    parser.add_argument('--report-only', action='store_true', help='只从结果库输出报告，不做新的评估')
+
+    args = parser.parse_args()
+
+    store = ResultStore(args.db)
+
+    if args.report_only:
+        print_report(store.load_results(), top_n=args.top)
+        store.close()
+        return
+
+    space = load_search_space(args.space)
+    if args.method == 'grid':
+        points = list(grid_points(space))
+    else:
+        points = random_points(space, args.samples, seed=args.seed)
+
+    print("=" * 100)
+    print("QQE策略参数优化器")
+    print("=" * 100)
+    print(f"搜索方式: {args.method}{' + 逐级减半' if args.halving else ''} | 参数点: {len(points)} | 并行进程: {args.workers}")
+    print(f"搜索空间: {json.dumps(space, ensure_ascii=False)}")
+    print(f"结果库: {args.db}")
+    print("=" * 100)
+
+    print("\n[1/3] 加载市场数据...")
+    stock_data = load_stock_data(args.board, args.max_stocks, args.history_days)
+    if not stock_data:
+        print("没有可用的股票数据。")
+        store.close()
+        return
+
+    last_date = max(item['df'].index[-1] for item in stock_data.values()).strftime('%Y-%m-%d')
+    context = {
+        'board': args.board,
+        'max_stocks': args.max_stocks,
+        'history_days': args.history_days,
+        'initial_capital': args.budget,
+        'data_end': last_date,
+    }
+
+    print("\n[2/3] 评估参数组合...")
+    start = time.time()
+    if args.halving:
+        run_successive_halving(stock_data, points, store, context, initial_capital=args.budget,
+                               workers=args.workers, min_days=args.min_days, eta=args.eta,
+                               metric=args.metric)
+    else:
+        run_search(stock_data, points, store, context, initial_capital=args.budget, workers=args.workers)
+    print(f"耗时: {time.time() - start:.1f}秒")
+
+    print("\n[3/3] 汇总结果...")
+    print_report(store.load_results(context), top_n=args.top)
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+"""
+持仓日志
+持仓状态保存为"快照 + 追加日志"，每次更新只在日志末尾追加一行，不再重写整个持仓文件。
+
+- 快照：portfolio.json（现金、持仓、已包含的最后一条日志序号 seq），不含交易历史
+- 日志：portfolio.journal.jsonl，每行一条记录（成交、资金变动、持仓变动），追加后 fsync
+- 历史：portfolio.history.jsonl，压缩时把日志记录移入，只在查看交易历史时读取
+- 日志超过 snapshot_every 条时写新快照（先写临时文件再替换）并清空日志
+- 启动时读取快照，只重放序号大于快照 seq 的日志；末尾写了一半的行（写入时崩溃）会被忽略
+- 旧格式的 portfolio.json（带 history 列表）在第一次加载时自动迁移
+- 只读的进程（盘中监控、导入数据库）用 load(read_only=True) / records()，不截断日志、不迁移、不写任何文件，
+  不会和正在写入的实盘助手冲突
+
+记录格式：{"seq", "time", "type", "code", "cash", "position", "history"}
+    cash 为现金变动；position 为新的持仓（null 表示清仓），没有该字段表示持仓不变；
+    history 为交易历史条目（可选）
+"""
+import json
+import os
+from datetime import datetime
+
+
+class PortfolioJournal:
+    """持仓快照 + 追加日志"""
+
+    def __init__(self, portfolio_file='portfolio.json', snapshot_every=100):
+        self.portfolio_file = portfolio_file
+        base = os.path.splitext(portfolio_file)[0]
+        self.journal_file = f"{base}.journal.jsonl"
+        self.history_file = f"{base}.history.jsonl"
+        self.snapshot_every = snapshot_every
+        self.seq = 0
+        self.journal_count = 0  # 日志中的记录数
+
+    def exists(self):
+        return os.path.exists(self.portfolio_file) or os.path.exists(self.journal_file)
+
+    def file_state(self):
+        """快照和日志的修改时间与大小（判断其他进程是否修改过）"""
+        state = []
+        for path in (self.portfolio_file, self.journal_file):
+            if os.path.exists(path):
+                stat = os.stat(path)
+                state.append((stat.st_mtime, stat.st_size))
+            else:
+                state.append(None)
+        return tuple(state)
+
+    @staticmethod
+    def apply(record, cash, positions):
+        """把一条记录应用到状态上，返回新的现金"""
+        cash += record.get('cash', 0)
+        if 'position' in record:
+            if record['position'] is None:
+                positions.pop(record['code'], None)
+            else:
+                positions[record['code']] = record['position']
+        return cash
+
+    def _read_journal(self, repair=False):
+        """
+        读取日志记录，遇到损坏的行（写入时崩溃）停止
+
+        repair=True 时把损坏的行及其后的内容截掉，之后追加的记录从新的一行开始。
+        """
+        records = []
+        if not os.path.exists(self.journal_file):
+            return records
+        with open(self.journal_file, 'rb') as f:
+            data = f.read()
+        good_end = 0
+        for line_no, line in enumerate(data.split(b'\n'), 1):
+            if line.strip():
+                try:
+                    records.append(json.loads(line.decode('utf-8')))
+                except (UnicodeDecodeError, json.JSONDecodeError):
+                    print(f"持仓日志第 {line_no} 行不完整，已忽略其后的记录")
+                    if repair:
+                        with open(self.journal_file, 'r+b') as f:
+                            f.truncate(good_end)
+                    break
+            good_end = min(good_end + len(line) + 1, len(data))
+        return records
+
+    def _read_snapshot(self):
+        if not os.path.exists(self.portfolio_file):
+            return {}
+        with open(self.portfolio_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def load(self, default_cash, read_only=False):
+        """
+        读取快照并重放日志
+
+        Args:
+            read_only: 只读取，不截断损坏的日志行、不迁移旧格式（其他进程可能正在写入）
+
+        Returns:
+            (cash, positions)
+        """
+        snapshot = self._read_snapshot()
+        cash = snapshot.get('cash', default_cash)
+        positions = snapshot.get('positions', {})
+        self.seq = snapshot.get('seq', 0)
+
+        records = self._read_journal(repair=not read_only)
+        self.journal_count = len(records)
+        for record in records:
+            if record['seq'] > self.seq:
+                cash = self.apply(record, cash, positions)
+                self.seq = record['seq']
+
+        if 'history' in snapshot and not read_only:
+            self._migrate(snapshot, cash, positions)
+        return cash, positions
+
+    @staticmethod
+    def _legacy_records(snapshot):
+        return [{'seq': 0, 'type': 'legacy', 'history': entry} for entry in snapshot.get('history', [])]
+
+    def _migrate(self, snapshot, cash, positions):
+        """
+        旧格式：交易历史移入历史文件，快照不再包含历史
+
+        先写历史再写快照（崩溃时历史不丢）；上次迁移写完历史后崩溃的，已写入的旧历史条目不再重复写入。
+        """
+        migrated = 0
+        if os.path.exists(self.history_file):
+            with open(self.history_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        migrated += json.loads(line).get('type') == 'legacy'
+                    except json.JSONDecodeError:
+                        continue
+        legacy = self._legacy_records(snapshot)[migrated:]
+        if legacy:
+            with open(self.history_file, 'a', encoding='utf-8') as f:
+                f.write(''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in legacy))
+                f.flush()
+                os.fsync(f.fileno())
+        self.write_snapshot(cash, positions, snapshot.get('total_budget'))
+        print(f"持仓文件已迁移为日志格式（{len(snapshot['history'])} 条历史记录移至 {self.history_file}）")
+
+    def append(self, records):
+        """追加记录（一次写入并 fsync），返回追加后是否需要压缩"""
+        if not records:
+            return False
+        directory = os.path.dirname(self.journal_file)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        lines = ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records)
+        with open(self.journal_file, 'a', encoding='utf-8') as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        self.journal_count += len(records)
+        return self.journal_count >= self.snapshot_every
+
+    def new_record(self, type, code=None, cash=0.0, history=None, **fields):
+        """生成下一条记录（position 通过 fields 传入，未传表示持仓不变）"""
+        self.seq += 1
+        record = {'seq': self.seq, 'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'type': type}
+        if code is not None:
+            record['code'] = code
+        if cash:
+            record['cash'] = cash
+        record.update(fields)
+        if history is not None:
+            record['history'] = history
+        return record
+
+    def write_snapshot(self, cash, positions, total_budget=None):
+        """原子写入快照（包含到当前 seq 为止的全部记录）"""
+        data = {
+            'update_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'total_budget': total_budget,
+            'cash': cash,
+            'positions': positions,
+            'seq': self.seq,
+        }
+        directory = os.path.dirname(self.portfolio_file)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.portfolio_file}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=4, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.portfolio_file)
+
+    def _last_archived_seq(self):
+        """历史文件最后一条记录的序号"""
+        if not os.path.exists(self.history_file):
+            return 0
+        with open(self.history_file, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 65536))
+            lines = f.read().decode('utf-8', errors='ignore').splitlines()
+        for line in reversed(lines):
+            try:
+                return json.loads(line)['seq']
+            except (json.JSONDecodeError, KeyError):
+                continue
+        return 0
+
+    def compact(self, cash, positions, total_budget=None):
+        """
+        写新快照，把日志记录移入历史文件，清空日志
+
+        顺序保证任一步崩溃都不丢记录：快照写入后日志中 seq 不大于快照的记录重放时会被跳过；
+        已移入历史文件的记录按序号去重。
+        """
+        self.write_snapshot(cash, positions, total_budget)
+        archived = self._last_archived_seq()
+        records = [r for r in self._read_journal() if r['seq'] > archived]
+        if records:
+            with open(self.history_file, 'a', encoding='utf-8') as f:
+                f.write(''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records))
+                f.flush()
+                os.fsync(f.fileno())
+        open(self.journal_file, 'w').close()
+        self.journal_count = 0
+
+    def records(self):
+        """
+        全部记录（历史文件 + 当前日志中未归档的），只读
+
+        尚未迁移的旧格式快照中的历史作为 type='legacy' 的记录放在最前面。
+        """
+        records = []
+        if os.path.exists(self.history_file):
+            with open(self.history_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+        snapshot = self._read_snapshot()
+        if 'history' in snapshot:
+            # 未迁移（或迁移中途崩溃）：旧历史以快照为准
+            records = self._legacy_records(snapshot) + [r for r in records if r.get('type') != 'legacy']
+        archived = self._last_archived_seq()
+        records += [r for r in self._read_journal() if r['seq'] > archived]
+        return records
+
+    def history(self):
+        """全部交易历史条目（历史文件 + 当前日志）"""
+        return [r['history'] for r in self.records() if 'history' in r]
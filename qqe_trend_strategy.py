@@ -2,6 +2,12 @@ import pandas as pd
 import numpy as np
 from typing import Tuple, Optional
 
+# 严格买入信号的组成条件，strict_conditions 位掩码的第 i 位对应第 i 个条件
+STRICT_CONDITIONS = (
+    'long_condition', 'strong_trend', 'volume_surge', 'price_momentum', 'rsi_not_overbought',
+    'not_at_high', 'qqe_double_confirm', 'trend_sustained', 'price_breakout',
+)
+
 
 class QQETrendStrategy:
     def __init__(
@@ -38,8 +44,15 @@ class QQETrendStrategy:
 
     def _calculate_rsi(self, series: pd.Series, period: int) -> pd.Series:
         delta = series.diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
+        gain = delta.where(delta > 0, 0)
+        loss = -delta.where(delta < 0, 0)
+        if isinstance(series, pd.DataFrame):
+            # 面板：各列第一根K线之前的空行保持 NaN，不计入滚动窗口
+            padding = np.arange(len(series))[:, None] < self._first_rows(series)
+            gain = gain.mask(padding)
+            loss = loss.mask(padding)
+        gain = gain.rolling(window=period).mean()
+        loss = loss.rolling(window=period).mean()
         rs = gain / loss
         rsi = 100 - (100 / (1 + rs))
         return rsi
@@ -52,7 +65,7 @@ class QQETrendStrategy:
         计算ATR (Average True Range)
         
         Args:
-            data: DataFrame with columns: high, low, close
+            data: DataFrame with columns: high, low, close（或面板 {字段: DataFrame}）
             period: ATR计算周期，默认14
             
         Returns:
@@ -67,7 +80,8 @@ class QQETrendStrategy:
         tr2 = abs(high - close.shift(1))
         tr3 = abs(low - close.shift(1))
         
-        tr = pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
+        tr = self._like(np.fmax(np.fmax(tr1.to_numpy(dtype=float), tr2.to_numpy(dtype=float)),
+                                tr3.to_numpy(dtype=float)), tr1)
         
         # ATR = EMA(TR, period)
         atr = self._calculate_ema(tr, period)
@@ -116,6 +130,66 @@ class QQETrendStrategy:
         zlema_series = series + series - series.shift(lag)
         return self._calculate_ema(zlema_series, period)
 
+    @staticmethod
+    def _like(values, template):
+        """把 numpy 数组包装成与 template 相同的 Series（单股）或 DataFrame（面板）"""
+        if isinstance(template, pd.DataFrame):
+            return pd.DataFrame(values, index=template.index, columns=template.columns)
+        return pd.Series(values, index=template.index)
+
+    @staticmethod
+    def _first_rows(series):
+        """
+        每列第一根K线所在的行
+        
+        单股从第0行开始；面板中K线按最后一根对齐，K线较少的股票前面是空行。
+        """
+        if isinstance(series, pd.DataFrame):
+            valid = series.notna().to_numpy()
+            return np.where(valid.any(axis=0), valid.argmax(axis=0), len(series))
+        return np.zeros(1, dtype=int)
+
+    @staticmethod
+    def _qqe_bands(smoothed_rsi, new_long_band, new_short_band, first_rows):
+        """
+        QQE 上下轨与趋势方向的逐行递推
+        
+        每一行对所有列同时计算（单股为一列），每列从自己的第一根K线开始递推，
+        第一根K线的上下轨和方向为0，之前的空行为 NaN。
+        """
+        shape = smoothed_rsi.shape
+        rsi = smoothed_rsi.reshape(len(smoothed_rsi), -1)
+        new_long = new_long_band.reshape(rsi.shape)
+        new_short = new_short_band.reshape(rsi.shape)
+        
+        # 第一根K线之前（面板的空行）为 NaN
+        rows = np.arange(len(rsi))[:, None]
+        long_band = np.where(rows < first_rows, np.nan, 0.0)
+        short_band = long_band.copy()
+        trend_direction = np.zeros(rsi.shape, dtype=int)
+        
+        for i in range(1, len(rsi)):
+            prev_rsi, cur_rsi = rsi[i - 1], rsi[i]
+            prev_long, prev_short, prev_trend = long_band[i - 1], short_band[i - 1], trend_direction[i - 1]
+            
+            # 与内置 max/min 一致：只有新值更大/更小时才替换（NaN 不替换）
+            keep_long = (prev_rsi > prev_long) & (cur_rsi > prev_long)
+            long_i = np.where(keep_long, np.where(new_long[i] > prev_long, new_long[i], prev_long), new_long[i])
+            keep_short = (prev_rsi < prev_short) & (cur_rsi < prev_short)
+            short_i = np.where(keep_short, np.where(new_short[i] < prev_short, new_short[i], prev_short), new_short[i])
+            
+            long_band_cross = (prev_long > prev_rsi) & (long_i < cur_rsi)
+            short_band_cross = ((prev_rsi <= prev_short) & (cur_rsi > prev_short)) | \
+                               ((prev_rsi >= prev_short) & (cur_rsi < prev_short))
+            trend_i = np.where(short_band_cross, 1, np.where(long_band_cross, -1, prev_trend))
+            
+            started = i > first_rows
+            long_band[i] = np.where(started, long_i, long_band[i])
+            short_band[i] = np.where(started, short_i, short_band[i])
+            trend_direction[i] = np.where(started, trend_i, 0)
+        
+        return long_band.reshape(shape), short_band.reshape(shape), trend_direction.reshape(shape)
+
     def calculate_qqe(
         self,
         data: pd.DataFrame,
@@ -134,57 +208,54 @@ class QQETrendStrategy:
         smoothed_atr_rsi = self._calculate_ema(atr_rsi, wilders_length)
         dynamic_atr_rsi = smoothed_atr_rsi * qqe_factor
         
-        long_band = pd.Series(0.0, index=data.index)
-        short_band = pd.Series(0.0, index=data.index)
-        trend_direction = pd.Series(0, index=data.index)
-        
         atr_delta = dynamic_atr_rsi
         new_short_band = smoothed_rsi + atr_delta
         new_long_band = smoothed_rsi - atr_delta
         
-        for i in range(1, len(data)):
-            if i > 0:
-                prev_smoothed_rsi = smoothed_rsi.iloc[i - 1]
-                prev_long_band = long_band.iloc[i - 1]
-                prev_short_band = short_band.iloc[i - 1]
-                prev_trend_direction = trend_direction.iloc[i - 1] if i > 0 else 0
-                
-                if prev_smoothed_rsi > prev_long_band and smoothed_rsi.iloc[i] > prev_long_band:
-                    long_band.iloc[i] = max(prev_long_band, new_long_band.iloc[i])
-                else:
-                    long_band.iloc[i] = new_long_band.iloc[i]
-                
-                if prev_smoothed_rsi < prev_short_band and smoothed_rsi.iloc[i] < prev_short_band:
-                    short_band.iloc[i] = min(prev_short_band, new_short_band.iloc[i])
-                else:
-                    short_band.iloc[i] = new_short_band.iloc[i]
-                
-                long_band_cross = (prev_long_band > smoothed_rsi.iloc[i - 1]) and (long_band.iloc[i] < smoothed_rsi.iloc[i])
-                
-                if (prev_smoothed_rsi <= prev_short_band and smoothed_rsi.iloc[i] > short_band.iloc[i - 1]) or \
-                   (prev_smoothed_rsi >= prev_short_band and smoothed_rsi.iloc[i] < short_band.iloc[i - 1]):
-                    trend_direction.iloc[i] = 1
-                elif long_band_cross:
-                    trend_direction.iloc[i] = -1
-                else:
-                    trend_direction.iloc[i] = prev_trend_direction
-        
-        qqe_trend_line = pd.Series(np.where(trend_direction == 1, long_band, short_band), index=data.index)
+        long_band, short_band, trend_direction = self._qqe_bands(
+            smoothed_rsi.to_numpy(dtype=float), new_long_band.to_numpy(dtype=float),
+            new_short_band.to_numpy(dtype=float), self._first_rows(source_series)
+        )
+        
+        qqe_trend_line = self._like(np.where(trend_direction == 1, long_band, short_band), source_series)
         
         return qqe_trend_line, smoothed_rsi
 
+    def _heikin_ashi_frames(self, bars) -> Tuple:
+        """
+        Heikin-Ashi 的 open/high/low/close（bars 为单股K线 DataFrame 或面板 {字段: DataFrame}）
+        """
+        ha_close = (bars['open'] + bars['high'] + bars['low'] + bars['close']) / 4
+        
+        opens = bars['open'].to_numpy(dtype=float)
+        closes = bars['close'].to_numpy(dtype=float)
+        
+        # ha_open 逐行递推（所有列同时计算），每列第一根K线取 (open + close) / 2
+        o = opens.reshape(len(opens), -1)
+        c = closes.reshape(o.shape)
+        hc = ha_close.to_numpy(dtype=float).reshape(o.shape)
+        first_rows = self._first_rows(bars['close'])
+        ha_open = np.empty(o.shape)
+        if len(o) > 0:
+            ha_open[0] = (o[0] + c[0]) / 2
+        for i in range(1, len(o)):
+            ha_open[i] = np.where(i == first_rows, (o[i] + c[i]) / 2, (ha_open[i - 1] + hc[i - 1]) / 2)
+        ha_open = ha_open.reshape(opens.shape)
+        
+        bar_high = np.fmax(np.fmax(opens, bars['high'].to_numpy(dtype=float)),
+                           np.fmax(bars['low'].to_numpy(dtype=float), closes))
+        bar_low = np.fmin(np.fmin(opens, bars['high'].to_numpy(dtype=float)),
+                          np.fmin(bars['low'].to_numpy(dtype=float), closes))
+        ha_high = np.fmax(bar_high, ha_open)
+        ha_low = np.fmin(bar_low, ha_open)
+        
+        template = bars['close']
+        return (self._like(ha_open, template), self._like(ha_high, template),
+                self._like(ha_low, template), ha_close)
+
     def _calculate_heikin_ashi(self, data: pd.DataFrame) -> pd.DataFrame:
         ha_df = data.copy()
-        ha_open = pd.Series(0.0, index=data.index)
-        ha_close = (data['open'] + data['high'] + data['low'] + data['close']) / 4
-        
-        ha_open.iloc[0] = (data['open'].iloc[0] + data['close'].iloc[0]) / 2
-        
-        for i in range(1, len(data)):
-            ha_open.iloc[i] = (ha_open.iloc[i - 1] + ha_close.iloc[i - 1]) / 2
-        
-        ha_high = pd.concat([data[['open', 'high', 'low', 'close']].max(axis=1), ha_open], axis=1).max(axis=1)
-        ha_low = pd.concat([data[['open', 'high', 'low', 'close']].min(axis=1), ha_open], axis=1).min(axis=1)
+        ha_open, ha_high, ha_low, ha_close = self._heikin_ashi_frames(data)
         
         ha_df['open'] = ha_open
         ha_df['high'] = ha_high
@@ -218,16 +289,30 @@ class QQETrendStrategy:
 
     def generate_signals(self, data: pd.DataFrame) -> pd.DataFrame:
         result = data.copy()
+        for name, values in self.signal_frames(data).items():
+            result[name] = values
+        return result
+
+    def signal_frames(self, bars) -> dict:
+        """
+        计算标准模式的指标和信号
         
+        Args:
+            bars: 单股K线 DataFrame（列: open, high, low, close, volume），
+                  或面板 {字段: DataFrame(行=K线, 列=股票)}，所有股票一次计算
+                  
+        Returns:
+            {列名: Series 或 DataFrame}，顺序即 generate_signals 追加的列顺序
+        """
         primary_qqe_trend_line, primary_rsi = self.calculate_qqe(
-            data,
+            bars,
             self.rsi_length_primary,
             self.rsi_smoothing_primary,
             self.qqe_factor_primary
         )
         
         secondary_qqe_trend_line, secondary_rsi = self.calculate_qqe(
-            data,
+            bars,
             self.rsi_length_secondary,
             self.rsi_smoothing_secondary,
             self.qqe_factor_secondary
@@ -238,14 +323,15 @@ class QQETrendStrategy:
         bollinger_upper = bollinger_basis + bollinger_deviation
         bollinger_lower = bollinger_basis - bollinger_deviation
         
-        ha_data = self._calculate_heikin_ashi(data)
+        ha_open, ha_high, ha_low, ha_close = self._heikin_ashi_frames(bars)
         
-        volume = data['volume'] if 'volume' in data.columns else pd.Series(1, index=data.index)
+        close = bars['close']
+        volume = bars['volume'] if 'volume' in bars else self._like(np.ones(close.shape, dtype=int), close)
         
-        ha_open_ma = self._calculate_trend_ma(ha_data['open'], volume)
-        ha_close_ma = self._calculate_trend_ma(ha_data['close'], volume)
-        ha_high_ma = self._calculate_trend_ma(ha_data['high'], volume)
-        ha_low_ma = self._calculate_trend_ma(ha_data['low'], volume)
+        ha_open_ma = self._calculate_trend_ma(ha_open, volume)
+        ha_close_ma = self._calculate_trend_ma(ha_close, volume)
+        ha_high_ma = self._calculate_trend_ma(ha_high, volume)
+        ha_low_ma = self._calculate_trend_ma(ha_low, volume)
         
         trend = 100 * (ha_close_ma - ha_open_ma) / (ha_high_ma - ha_low_ma)
         
@@ -257,8 +343,8 @@ class QQETrendStrategy:
         trend_green = trend > 0
         trend_red = trend < 0
         
-        price_above_green = (data['close'] > ha_close_ma) & trend_green
-        price_below_red = (data['close'] < ha_close_ma) & trend_red
+        price_above_green = (close > ha_close_ma) & trend_green
+        price_below_red = (close < ha_close_ma) & trend_red
         
         qqe_long_ok = (qqe_value > 0) & qqe_blue
         qqe_short_ok = (qqe_value < 0) & qqe_red
@@ -266,29 +352,27 @@ class QQETrendStrategy:
         long_condition = price_above_green & qqe_long_ok
         short_condition = price_below_red & qqe_short_ok
         
-        result['primary_qqe_trend_line'] = primary_qqe_trend_line
-        result['primary_rsi'] = primary_rsi
-        result['secondary_qqe_trend_line'] = secondary_qqe_trend_line
-        result['secondary_rsi'] = secondary_rsi
-        result['qqe_value'] = qqe_value
-        result['trend'] = trend
-        result['ha_close_ma'] = ha_close_ma
-        result['bollinger_upper'] = bollinger_upper
-        result['bollinger_lower'] = bollinger_lower
-        result['qqe_blue'] = qqe_blue
-        result['qqe_red'] = qqe_red
-        result['trend_green'] = trend_green
-        result['trend_red'] = trend_red
-        result['long_condition'] = long_condition
-        result['short_condition'] = short_condition
-        
-        result['buy_signal'] = long_condition & ~(long_condition.shift(1).fillna(False).astype(bool))
-        result['sell_signal'] = short_condition & ~(short_condition.shift(1).fillna(False).astype(bool))
-        
-        # 🆕 添加ATR计算（用于动态止损）
-        result['atr'] = self._calculate_atr(data, period=14)
-        
-        return result
+        return {
+            'primary_qqe_trend_line': primary_qqe_trend_line,
+            'primary_rsi': primary_rsi,
+            'secondary_qqe_trend_line': secondary_qqe_trend_line,
+            'secondary_rsi': secondary_rsi,
+            'qqe_value': qqe_value,
+            'trend': trend,
+            'ha_close_ma': ha_close_ma,
+            'bollinger_upper': bollinger_upper,
+            'bollinger_lower': bollinger_lower,
+            'qqe_blue': qqe_blue,
+            'qqe_red': qqe_red,
+            'trend_green': trend_green,
+            'trend_red': trend_red,
+            'long_condition': long_condition,
+            'short_condition': short_condition,
+            'buy_signal': long_condition & ~(long_condition.shift(1).fillna(False).astype(bool)),
+            'sell_signal': short_condition & ~(short_condition.shift(1).fillna(False).astype(bool)),
+            # 🆕 添加ATR计算（用于动态止损）
+            'atr': self._calculate_atr(bars, period=14),
+        }
 
     def generate_signals_strict(self, data: pd.DataFrame) -> pd.DataFrame:
         """生成交易信号 - 严格模式（更高质量，更少信号）
@@ -301,47 +385,112 @@ class QQETrendStrategy:
         5. 风险控制：避免高位买入
         """
         result = self.generate_signals(data)
+        for name, values in self.strict_frames(data, result).items():
+            result[name] = values
+        return result
+
+    def _price_volume_frames(self, bars) -> dict:
+        """
+        严格模式中只依赖原始K线的条件（成交量放大、连续上涨、20日价格位置）
+        
+        Returns:
+            {'volume_ratio', 'volume_surge', 'price_momentum', 'price_position', 'not_at_high'}，
+            没有成交量时 volume_ratio 为 None
+        """
+        close = bars['close']
+        if 'volume' in bars:
+            volume_ma = bars['volume'].rolling(window=20).mean()
+            volume_ratio = bars['volume'] / volume_ma
+            volume_surge = volume_ratio > 1.2  # 成交量放大20%以上
+        else:
+            volume_ratio = None
+            volume_surge = self._like(np.ones(close.shape, dtype=bool), close)
+        
+        price_momentum = (close > close.shift(1)) & \
+                        (close.shift(1) > close.shift(2))
+        
+        high_20 = bars['high'].rolling(window=20).max()
+        low_20 = bars['low'].rolling(window=20).min()
+        price_position = (close - low_20) / (high_20 - low_20)
+        not_at_high = price_position < 0.8  # 不在20日高低点的80%位置以上
+        
+        return {
+            'volume_ratio': volume_ratio,
+            'volume_surge': volume_surge,
+            'price_momentum': price_momentum,
+            'price_position': price_position,
+            'not_at_high': not_at_high,
+        }
+
+    def strict_prescreen(self, bars, check_days: int = 2, min_quality: float = 0):
+        """
+        严格模式预筛选：最近 check_days 根K线中是否可能出现严格买入信号
+        
+        只检查不需要 QQE 的必要条件（成交量放大、连续上涨、不在高位，以及信号质量的上限
+        不低于 min_quality），返回 False 的股票一定没有严格信号，不必再计算 QQE/Heikin-Ashi。
+        
+        Args:
+            bars: 单股K线 DataFrame 或面板（同 signal_frames）
+            
+        Returns:
+            单股返回 bool，面板返回每只股票的 bool Series
+        """
+        raw = self._price_volume_frames(bars)
+        candidate = raw['volume_surge'] & raw['price_momentum'] & raw['not_at_high']
+        if min_quality > 0:
+            # 趋势强度和RSI两项按满分计（40 + 15）
+            best_quality = (1 - raw['price_position'].clip(0, 1)) * 15 + 55
+            if raw['volume_ratio'] is not None:
+                best_quality = best_quality + raw['volume_ratio'].clip(0, 3) * 10
+            else:
+                best_quality = best_quality + 30
+            candidate = candidate & (best_quality >= min_quality - 1e-6)
+        return candidate.tail(check_days).any()
+
+    def strict_frames(self, bars, signals) -> dict:
+        """
+        在标准模式结果上计算严格模式的买入信号和信号质量（bars 同 signal_frames）
+        
+        Returns:
+            {'buy_signal_strict': ..., 'signal_quality': ..., 'strict_conditions': ...}，
+            strict_conditions 为每根K线满足的条件位掩码（见 STRICT_CONDITIONS）
+        """
+        close = bars['close']
+        raw = self._price_volume_frames(bars)
+        volume_ratio = raw['volume_ratio']
+        price_position = raw['price_position']
         
         # 1. 趋势强度过滤 - 趋势值需要足够强
         trend_strength_threshold = 10  # 趋势强度阈值
-        strong_trend = result['trend'] > trend_strength_threshold
+        strong_trend = signals['trend'] > trend_strength_threshold
         
         # 2. 成交量确认 - 买入时成交量应大于均量
-        if 'volume' in data.columns:
-            volume_ma = data['volume'].rolling(window=20).mean()
-            volume_ratio = data['volume'] / volume_ma
-            volume_surge = volume_ratio > 1.2  # 成交量放大20%以上
-        else:
-            volume_surge = pd.Series(True, index=data.index)
+        volume_surge = raw['volume_surge']
         
         # 3. 价格动能 - 收盘价需要连续上涨
-        price_momentum = (data['close'] > data['close'].shift(1)) & \
-                        (data['close'].shift(1) > data['close'].shift(2))
+        price_momentum = raw['price_momentum']
         
         # 4. RSI不能过高 - 避免追高
-        rsi_not_overbought = result['secondary_rsi'] < 70
+        rsi_not_overbought = signals['secondary_rsi'] < 70
         
         # 5. 价格相对位置 - 不在高位买入
-        high_20 = data['high'].rolling(window=20).max()
-        low_20 = data['low'].rolling(window=20).min()
-        price_position = (data['close'] - low_20) / (high_20 - low_20)
-        not_at_high = price_position < 0.8  # 不在20日高低点的80%位置以上
+        not_at_high = raw['not_at_high']
         
         # 6. QQE双重确认 - primary和secondary QQE都处于上升趋势
-        primary_rising = result['primary_rsi'] > result['primary_rsi'].shift(1)
-        secondary_rising = result['secondary_rsi'] > result['secondary_rsi'].shift(1)
+        primary_rising = signals['primary_rsi'] > signals['primary_rsi'].shift(1)
+        secondary_rising = signals['secondary_rsi'] > signals['secondary_rsi'].shift(1)
         qqe_double_confirm = primary_rising & secondary_rising
         
         # 7. 趋势持续性 - 趋势需要连续2天以上为正
         trend_sustained = strong_trend & strong_trend.shift(1).fillna(False)
         
         # 8. 价格突破确认 - 价格突破均线且有一定幅度
-        price_breakout = (data['close'] > result['ha_close_ma']) & \
-                        ((data['close'] - result['ha_close_ma']) / result['ha_close_ma'] > 0.02)  # 突破2%以上
+        price_breakout = (close > signals['ha_close_ma']) & \
+                        ((close - signals['ha_close_ma']) / signals['ha_close_ma'] > 0.02)  # 突破2%以上
         
         # 组合所有严格条件
         strict_long_condition = (
-            result['long_condition'] &  # 原始买入条件
+            signals['long_condition'] &  # 原始买入条件
             strong_trend &              # 强趋势
             volume_surge &              # 成交量放大
             price_momentum &            # 价格动能
@@ -352,19 +501,81 @@ class QQETrendStrategy:
             price_breakout              # 价格突破
         )
         
-        # 生成严格买入信号
-        result['buy_signal_strict'] = strict_long_condition & ~(strict_long_condition.shift(1).fillna(False).astype(bool))
+        # 🆕 记录每个条件是否满足，供扫描计划判断离信号还差几个条件
+        conditions = {
+            'long_condition': signals['long_condition'], 'strong_trend': strong_trend,
+            'volume_surge': volume_surge, 'price_momentum': price_momentum,
+            'rsi_not_overbought': rsi_not_overbought, 'not_at_high': not_at_high,
+            'qqe_double_confirm': qqe_double_confirm, 'trend_sustained': trend_sustained,
+            'price_breakout': price_breakout,
+        }
+        strict_conditions = self._like(np.zeros(close.shape, dtype=np.int64), close)
+        for bit, name in enumerate(STRICT_CONDITIONS):
+            strict_conditions += conditions[name].fillna(False).astype(np.int64) * (1 << bit)
         
         # 添加信号质量评分 (0-100)
-        signal_quality = pd.Series(0.0, index=data.index)
-        signal_quality += result['trend'].clip(0, 20) * 2  # 趋势强度 (0-40分)
+        signal_quality = self._like(np.zeros(close.shape), close)
+        signal_quality += signals['trend'].clip(0, 20) * 2  # 趋势强度 (0-40分)
         signal_quality += volume_ratio.clip(0, 3) * 10  # 成交量 (0-30分)
-        signal_quality += (100 - result['secondary_rsi'].clip(50, 100)) * 0.3  # RSI位置 (0-15分)
+        signal_quality += (100 - signals['secondary_rsi'].clip(50, 100)) * 0.3  # RSI位置 (0-15分)
         signal_quality += (1 - price_position.clip(0, 1)) * 15  # 价格位置 (0-15分)
         
-        result['signal_quality'] = signal_quality.clip(0, 100)
+        return {
+            # 生成严格买入信号
+            'buy_signal_strict': strict_long_condition & ~(strict_long_condition.shift(1).fillna(False).astype(bool)),
+            'signal_quality': signal_quality.clip(0, 100),
+            'strict_conditions': strict_conditions,
+        }
+
+    @staticmethod
+    def _ema_warmup(period: int, tolerance: float) -> int:
+        """EMA(span=period) 的初始值影响衰减到 tolerance 以下所需的K线数"""
+        alpha = 2 / (period + 1)
+        return int(np.ceil(np.log(tolerance) / np.log(1 - alpha)))
+
+    def _trend_ma_warmup(self, tolerance: float) -> int:
+        """趋势均线所需的K线数"""
+        if self.ma_type == 'HMA':
+            return self.ma_period + int(np.sqrt(self.ma_period))
+        if self.ma_type == 'SWMA':
+            return 5
+        if self.ma_type in ('ALMA', 'SMA', 'VWMA', 'WMA'):
+            return self.ma_period
+        if self.ma_type == 'ZLEMA':
+            return (self.ma_period - 1) // 2 + self._ema_warmup(self.ma_period, tolerance)
+        return self._ema_warmup(self.ma_period, tolerance)
+
+    def warmup_bars(self, strict_mode: bool = False, enhanced_entry: bool = False,
+                    tolerance: float = 1e-3) -> int:
+        """
+        计算某根K线的信号之前需要的历史K线数
         
-        return result
+        滚动窗口（RSI、布林带、20/60日均量等）按窗口长度计；EMA 和 Heikin-Ashi 的递推
+        按初始值的影响衰减到 tolerance 以下计。依赖链上的各环节逐个累加，取各条链的最大值。
+        只用最后 warmup_bars() + N 根K线计算，最后 N 根的信号与用全部历史计算相同
+        （指标数值的差异在 tolerance 量级）。
+        """
+        def qqe_warmup(rsi_length, smoothing):
+            # RSI(diff + 滚动均值) -> 平滑EMA -> shift(1) -> Wilders EMA
+            return (rsi_length + 1 + self._ema_warmup(smoothing, tolerance) + 1 +
+                    self._ema_warmup(rsi_length * 2 - 1, tolerance))
+        
+        primary = qqe_warmup(self.rsi_length_primary, self.rsi_smoothing_primary)
+        secondary = qqe_warmup(self.rsi_length_secondary, self.rsi_smoothing_secondary)
+        # Heikin-Ashi 开盘价每根K线把上一根的影响减半
+        heikin_ashi = int(np.ceil(np.log(tolerance) / np.log(0.5))) + self._trend_ma_warmup(tolerance)
+        
+        condition = max(primary + self.bollinger_length - 1, secondary, heikin_ashi)
+        warmup = max(condition + 1,  # buy_signal 比较前一根的 long_condition
+                     1 + self._ema_warmup(14, tolerance))  # ATR
+        if strict_mode:
+            # trend_sustained / RSI上升比较前一根，buy_signal_strict 再比较前一根；20日均量和高低点
+            warmup = max(warmup, condition + 2, 20 + 2) + 1
+        if enhanced_entry:
+            # 连续3天 long_condition；60日均量；前一日的20日高点
+            warmup = max(warmup, condition + 2, 60, 21) + 1
+        return warmup
+
 
 
 def qqe_trend_strategy(
@@ -474,3 +685,80 @@ def qqe_trend_strategy(
         result['buy_signal'] = enhanced_buy & ~(enhanced_buy.shift(1).fillna(False).astype(bool))
     
     return result
+
+
+def qqe_trend_tail(data: pd.DataFrame, last_n: int = 1, tolerance: float = 1e-3, **params) -> pd.DataFrame:
+    """
+    只计算最后 last_n 根K线的信号（实盘检查只需要最新几根）
+    
+    只取最后 warmup_bars() + last_n 根K线调用 qqe_trend_strategy，数据不足时使用全部数据。
+    
+    Args:
+        data: K线 DataFrame
+        last_n: 需要信号的K线数
+        tolerance: 指标递推的收敛精度（见 QQETrendStrategy.warmup_bars）
+        **params: qqe_trend_strategy 的参数（含 strict_mode、enhanced_entry）
+        
+    Returns:
+        最后 last_n 行的 qqe_trend_strategy 结果
+    """
+    strict_mode = params.get('strict_mode', False)
+    enhanced_entry = params.get('enhanced_entry', False)
+    strategy = QQETrendStrategy(**{k: v for k, v in params.items() if k not in ('strict_mode', 'enhanced_entry')})
+    warmup = strategy.warmup_bars(strict_mode, enhanced_entry, tolerance)
+    return qqe_trend_strategy(data.tail(warmup + last_n), **params).tail(last_n)
+
+
+def history_days(bars: int) -> int:
+    """获取 bars 根日K线需要向前取的自然日数（每年约240个交易日，另留长假余量）"""
+    return int(np.ceil(bars * 365 / 240)) + 15
+
+
+def build_bar_panel(stock_bars: dict, fields=('open', 'high', 'low', 'close', 'volume')) -> Tuple[dict, pd.DataFrame]:
+    """
+    把多只股票的K线拼成面板，每只股票的最后一根K线对齐到最后一行
+    
+    按K线序号而不是日期对齐，停牌、上市较晚的股票不会插入空行，
+    逐列计算的结果与单独对该股票调用 qqe_trend_strategy 完全相同。
+    
+    Args:
+        stock_bars: {代码: K线DataFrame}
+        
+    Returns:
+        (panel, dates)
+            panel: {字段: DataFrame(行=K线序号, 列=代码)}，K线较少的股票前面为 NaN
+            dates: DataFrame(行=K线序号, 列=代码)，每个位置对应的日期
+    """
+    codes = list(stock_bars)
+    length = max((len(df) for df in stock_bars.values()), default=0)
+    arrays = {field: np.full((length, len(codes)), np.nan) for field in fields}
+    dates = np.full((length, len(codes)), np.datetime64('NaT'), dtype='datetime64[ns]')
+    
+    for j, code in enumerate(codes):
+        df = stock_bars[code]
+        n = len(df)
+        if n == 0:
+            continue
+        for field in fields:
+            arrays[field][length - n:, j] = df[field].to_numpy(dtype=float)
+        dates[length - n:, j] = df.index.to_numpy(dtype='datetime64[ns]')
+    
+    panel = {field: pd.DataFrame(values, columns=codes) for field, values in arrays.items()}
+    return panel, pd.DataFrame(dates, columns=codes)
+
+
+def qqe_trend_panel(panel: dict, strict_mode: bool = False, **params) -> dict:
+    """
+    对面板中的所有股票一次计算信号（参数同 qqe_trend_strategy，不支持 enhanced_entry）
+    
+    Args:
+        panel: build_bar_panel 返回的 {字段: DataFrame}
+        
+    Returns:
+        {列名: DataFrame}，与 qqe_trend_strategy 结果的各列一一对应
+    """
+    strategy = QQETrendStrategy(**params)
+    frames = strategy.signal_frames(panel)
+    if strict_mode:
+        frames.update(strategy.strict_frames(panel, frames))
+    return frames
@@ -0,0 +1,209 @@
+"""
+扫描计划
+按廉价的预计算特征给股票池排序，在时间预算内按优先级扫描，预算用完时返回已找到的候选。
+
+特征（每次扫描后更新，存入本地文件，下次扫描直接使用）：
+- liquidity: 20日平均成交额
+- volatility: 20日收益率标准差
+- dist_high: 收盘价距20日最高价的比例
+- near_count: 最后一根K线满足的严格模式原始条件数（成交量放大、连续上涨、不在高位，0-3）
+
+严格模式下还保存上次扫描的接近信号状态：
+- conditions: 满足的严格条件位掩码（见 qqe_trend_strategy.STRICT_CONDITIONS），n_conditions 为满足的条件数
+- trend / rsi / quality: 趋势值、次要RSI、信号质量分
+- scan_date: 状态的扫描日期
+
+上次满足 near_conditions 个以上条件的股票最先扫描；设置 min_conditions 时，
+最近 recheck_days 天内扫描过且满足的条件少于 min_conditions 的股票直接跳过。
+没有特征的股票（从未扫描过）按中等优先级排列，保证逐步覆盖整个股票池。
+"""
+import os
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from qqe_trend_strategy import QQETrendStrategy, STRICT_CONDITIONS
+
+FEATURE_COLUMNS = ['last_date', 'liquidity', 'volatility', 'dist_high', 'near_count']
+STATE_COLUMNS = ['scan_date', 'conditions', 'n_conditions', 'trend', 'rsi', 'quality']
+
+# 排序得分的权重：near_count 按 0-1 归一化，其余按在股票池中的百分位
+DEFAULT_WEIGHTS = {'near': 1.0, 'liquidity': 0.5, 'volatility': 0.3, 'proximity': 0.5}
+
+
+def signal_state(result):
+    """
+    从严格模式结果的最后一行取接近信号状态
+
+    Returns:
+        状态字典；结果中没有 strict_conditions（标准模式）时返回 None
+    """
+    if result is None or result.empty or 'strict_conditions' not in result:
+        return None
+    last = result.iloc[-1]
+    conditions = int(last['strict_conditions'])
+    return {
+        'scan_date': date.today().isoformat(),
+        'conditions': conditions,
+        'n_conditions': bin(conditions).count('1'),
+        'trend': float(last['trend']),
+        'rsi': float(last['secondary_rsi']),
+        'quality': float(last['signal_quality']),
+    }
+
+
+def compute_features(df):
+    """
+    计算单只股票的排序特征（只用最后约20根K线）
+
+    Returns:
+        特征字典；K线不足时返回 None
+    """
+    if df is None or len(df) < 21:
+        return None
+    tail = df.tail(40)
+    raw = QQETrendStrategy()._price_volume_frames(tail)
+    close = tail['close'].to_numpy(dtype=float)
+    recent = slice(-20, None)
+    high_20 = tail['high'].to_numpy(dtype=float)[recent].max()
+    returns = np.diff(close[-21:]) / close[-21:-1]
+    near_count = sum(bool(raw[name].iloc[-1]) for name in ('volume_surge', 'price_momentum', 'not_at_high'))
+    return {
+        'last_date': tail.index[-1].strftime('%Y-%m-%d'),
+        'liquidity': float((close[recent] * tail['volume'].to_numpy(dtype=float)[recent]).mean()),
+        'volatility': float(returns.std()),
+        'dist_high': float((high_20 - close[-1]) / high_20) if high_20 > 0 else 0.0,
+        'near_count': near_count,
+    }
+
+
+class ScanPlanner:
+    """按特征排序的限时扫描"""
+
+    def __init__(self, path=os.path.join("data_cache", "scan_features.csv"), weights=None,
+                 near_conditions=7, min_conditions=0, recheck_days=3):
+        self.path = path
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.near_conditions = near_conditions  # 上次满足这么多条件的股票最先扫描
+        self.min_conditions = min_conditions  # 上次满足的条件少于此数的股票跳过（0 表示不跳过）
+        self.recheck_days = recheck_days  # 状态超过这么多天的股票不跳过，重新扫描
+        self.features = self._load()
+        self.skipped = []
+
+    def _load(self):
+        columns = FEATURE_COLUMNS + STATE_COLUMNS
+        if os.path.exists(self.path):
+            try:
+                return pd.read_csv(self.path, index_col='code', dtype={'code': str}).reindex(columns=columns)
+            except Exception as e:
+                print(f"读取扫描特征失败: {e}")
+        return pd.DataFrame(columns=columns, index=pd.Index([], name='code'))
+
+    def save(self):
+        """原子写入特征文件"""
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        self.features.to_csv(tmp_path)
+        os.replace(tmp_path, self.path)
+
+    def update(self, code, df, result=None):
+        """用本次扫描取到的K线和策略结果更新特征与接近信号状态"""
+        features = compute_features(df)
+        if features is not None:
+            self.features.loc[code, FEATURE_COLUMNS] = [features[c] for c in FEATURE_COLUMNS]
+        state = signal_state(result)
+        if state is not None:
+            self.features.loc[code, STATE_COLUMNS] = [state[c] for c in STATE_COLUMNS]
+
+    def scores(self, codes):
+        """
+        每只股票的优先级得分（越高越先扫描）
+
+        Returns:
+            Series(index=codes)
+        """
+        known = self.features.reindex(codes)
+        w = self.weights
+        # 百分位在整个股票池中计算；没有特征的股票各项取中间值 0.5
+        liquidity = known['liquidity'].astype(float).rank(pct=True).fillna(0.5)
+        volatility = known['volatility'].astype(float).rank(pct=True).fillna(0.5)
+        proximity = (1 - known['dist_high'].astype(float).rank(pct=True)).fillna(0.5)
+        # 有严格条件状态时按满足的条件数，否则按原始条件数
+        near = (known['n_conditions'].astype(float) / len(STRICT_CONDITIONS)).fillna(
+            known['near_count'].astype(float) / 3).fillna(0.5)
+        return (w['near'] * near + w['liquidity'] * liquidity +
+                w['volatility'] * volatility + w['proximity'] * proximity)
+
+    def plan(self, codes, max_count=None, today=None):
+        """
+        扫描顺序：上次接近信号的股票在前，其余按得分从高到低（得分相同保持原顺序），最多 max_count 只
+
+        跳过的股票（离信号太远）记录在 self.skipped。
+        """
+        codes = list(codes)
+        known = self.features.reindex(codes)
+        n_conditions = known['n_conditions'].astype(float).to_numpy()
+        near = n_conditions >= self.near_conditions
+        scores = self.scores(codes).to_numpy()
+        order = np.lexsort((-scores, ~near))
+
+        skip = np.zeros(len(codes), dtype=bool)
+        if self.min_conditions > 0:
+            today = pd.Timestamp(today or date.today())
+            age = (today - pd.to_datetime(known['scan_date'])).dt.days.to_numpy()
+            skip = (n_conditions < self.min_conditions) & (age < self.recheck_days)
+        self.skipped = [codes[i] for i in order if skip[i]]
+        ordered = [codes[i] for i in order if not skip[i]]
+        return ordered[:max_count] if max_count else ordered
+
+    def scan(self, codes, evaluate, budget_seconds=None, max_count=None):
+        """
+        按优先级扫描，预算用完即停止
+
+        Args:
+            codes: 股票池代码列表
+            evaluate: evaluate(code) -> (候选 或 None, K线DataFrame 或 None, 策略结果 或 None)
+            budget_seconds: 时间预算（秒），None 表示不限
+            max_count: 最多扫描的股票数
+
+        Returns:
+            (candidates, stats)
+                candidates: 已找到的候选列表（按扫描顺序）
+                stats: {'planned', 'scanned', 'skipped', 'elapsed', 'budget_exhausted'}
+        """
+        ordered = self.plan(codes, max_count)
+        start = time.time()
+        candidates = []
+        scanned = 0
+        exhausted = False
+        for code in ordered:
+            if budget_seconds is not None and time.time() - start >= budget_seconds:
+                exhausted = True
+                break
+            candidate, df, result = evaluate(code)
+            scanned += 1
+            if df is not None:
+                self.update(code, df, result)
+            if candidate is not None:
+                candidates.append(candidate)
+                # 接近信号的股票先扫描，找到的候选立即显示
+                print(f"\r发现买入信号: {candidate.get('name', code)} ({code})")
+            print(f"\r进度: {scanned}/{len(ordered)}", end='', flush=True)
+        print()
+
+        try:
+            self.save()
+        except Exception as e:
+            print(f"保存扫描特征失败: {e}")
+        stats = {
+            'planned': len(ordered),
+            'scanned': scanned,
+            'skipped': len(self.skipped),
+            'elapsed': time.time() - start,
+            'budget_exhausted': exhausted,
+        }
+        return candidates, stats
@@ -0,0 +1,226 @@
+"""
+测试回测断点续跑与追加回测
+使用模拟数据验证：分段撮合 + 引擎状态保存/恢复 与一次性回测结果一致、信号缓存分块保存不随断点重写、
+下载阶段和撮合阶段中断后续跑结果一致、断点文件大小不随回测长度增长
+"""
+import os
+import tempfile
+import contextlib
+import io
+import pickle
+from backtest import PortfolioBacktester, BacktestCheckpoint, StockDataLoader, run_backtest, extend_backtest
+from qqe_trend_strategy import qqe_trend_strategy
+from test_optimizer import create_test_stocks
+
+
+def test_checkpoint_resume():
+    """测试断点保存、恢复与续跑结果一致性"""
+    print("=" * 80)
+    print("回测断点续跑测试")
+    print("=" * 80)
+
+    cache = {}
+    for code, item in create_test_stocks(count=5, days=200).items():
+        cache[code] = {'name': item['name'], 'data': qqe_trend_strategy(item['df'], strict_mode=False)}
+    market_data, dates, _ = PortfolioBacktester.build_market_data(cache, strict_mode=False)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        full = PortfolioBacktester(strict_mode=False)
+        full.run_on_market_data(market_data, dates, min_quality=0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint = BacktestCheckpoint({'board': 'test', 'max_stocks': 5}, checkpoint_dir=tmp)
+        assert not checkpoint.exists()
+
+        # 前半段撮合后保存断点，丢弃引擎
+        with contextlib.redirect_stdout(io.StringIO()):
+            engine = PortfolioBacktester(strict_mode=False)
+            engine.run_on_market_data(market_data, dates[:90], min_quality=0)
+        checkpoint.save({'engine_state': engine.get_state(), 'date_index': 90})
+        assert checkpoint.exists()
+        del engine
+
+        # 用新引擎从断点恢复并跑完后半段
+        state = checkpoint.load()
+        print(f"断点: {checkpoint.path}, 交易日下标 {state['date_index']}")
+        with contextlib.redirect_stdout(io.StringIO()):
+            resumed = PortfolioBacktester(strict_mode=False)
+            resumed.set_state(state['engine_state'])
+            resumed.run_on_market_data(market_data, dates[state['date_index']:], min_quality=0)
+
+        print(f"一次性回测: {full.equity_curve[-1]['equity']:,.2f}, 交易 {len(full.trades)} 笔")
+        print(f"断点续跑:   {resumed.equity_curve[-1]['equity']:,.2f}, 交易 {len(resumed.trades)} 笔")
+        assert resumed.equity_curve == full.equity_curve
+        assert resumed.trades == full.trades
+        assert resumed.cash == full.cash
+
+        # 信号缓存分块追加保存，断点文件不包含信号缓存
+        codes = list(cache)
+        checkpoint.save_signals({code: cache[code] for code in codes[:3]})
+        checkpoint.save_signals({code: cache[code] for code in codes[3:]})
+        checkpoint.save({'engine_state': resumed.get_state(), 'date_index': len(dates), 'market_data_cache': cache})
+        signals_size = sum(os.path.getsize(os.path.join(checkpoint.signals_dir, f))
+                           for f in os.listdir(checkpoint.signals_dir))
+        print(f"断点文件: {os.path.getsize(checkpoint.path):,} 字节, 信号缓存: {signals_size:,} 字节 "
+              f"({len(os.listdir(checkpoint.signals_dir))} 个分块)")
+        assert os.path.getsize(checkpoint.path) < signals_size
+        loaded = checkpoint.load()['market_data_cache']
+        assert list(loaded) == codes and all(loaded[c]['data'].equals(cache[c]['data']) for c in codes)
+
+        # 配置不同时断点文件不同
+        other = BacktestCheckpoint({'board': 'test', 'max_stocks': 6}, checkpoint_dir=tmp)
+        assert other.path != checkpoint.path
+        assert other.load() is None
+
+        checkpoint.clear()
+        assert not checkpoint.exists() and not os.path.exists(checkpoint.signals_dir)
+
+    print("\n✓ 回测断点续跑测试通过")
+
+
+def test_extend_backtest():
+    """测试追加回测：先回测前200天再追加60天，与直接回测260天一致"""
+    print("=" * 80)
+    print("追加回测测试")
+    print("=" * 80)
+
+    stock_data = create_test_stocks(count=5, days=260)
+    stock_list = [{'code': code, 'name': item['name']} for code, item in stock_data.items()]
+    available = {'days': 200}
+
+    original = (StockDataLoader.get_stock_list, StockDataLoader.get_stock_data)
+    StockDataLoader.get_stock_list = staticmethod(lambda board_filter=None, max_stocks=None: stock_list)
+    StockDataLoader.get_stock_data = staticmethod(
+        lambda code, days=250: stock_data[code]['df'].iloc[:available['days']])
+    cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            kwargs = dict(quality_thresholds=[0], strict_mode=False, checkpoint_every=0)
+            with contextlib.redirect_stdout(io.StringIO()):
+                run_backtest(state_file='run_state.pkl', **kwargs)
+                available['days'] = 260
+                extended = extend_backtest('run_state.pkl')
+                full = run_backtest(**kwargs)
+    finally:
+        os.chdir(cwd)
+        StockDataLoader.get_stock_list, StockDataLoader.get_stock_data = original
+
+    print(f"追加回测: 收益 {extended[0]['return']:.4f}%, 交易 {extended[0]['trades']} 笔")
+    print(f"全量回测: 收益 {full[0]['return']:.4f}%, 交易 {full[0]['trades']} 笔")
+    assert abs(extended[0]['return'] - full[0]['return']) < 1e-9
+    assert extended[0]['trades'] == full[0]['trades']
+
+    print("\n✓ 追加回测测试通过")
+
+
+def test_interrupted_download():
+    """测试下载阶段中断：已计算的信号分块保存，续跑不重复下载，结果与一次性回测一致"""
+    stock_data = create_test_stocks(count=5, days=200)
+    stock_list = [{'code': code, 'name': item['name']} for code, item in stock_data.items()]
+    downloads = []
+
+    def get_stock_data(code, days=250):
+        if len(downloads) == 3 and interrupt['on']:
+            interrupt['on'] = False
+            raise KeyboardInterrupt
+        downloads.append(code)
+        return stock_data[code]['df']
+
+    interrupt = {'on': True}
+    original = (StockDataLoader.get_stock_list, StockDataLoader.get_stock_data)
+    StockDataLoader.get_stock_list = staticmethod(lambda board_filter=None, max_stocks=None: stock_list)
+    StockDataLoader.get_stock_data = staticmethod(get_stock_data)
+    cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            kwargs = dict(quality_thresholds=[0], strict_mode=False, checkpoint_every=20)
+            with contextlib.redirect_stdout(io.StringIO()):
+                try:
+                    run_backtest(**kwargs)
+                    assert False, "应在下载阶段中断"
+                except KeyboardInterrupt:
+                    pass
+                assert len(os.listdir(os.path.join(tmp, 'checkpoints'))) == 2  # 断点文件 + 信号分块目录
+                resumed = run_backtest(resume=True, **kwargs)
+                assert downloads == [item['code'] for item in stock_list]  # 续跑只下载剩下的股票
+                full = run_backtest(**kwargs)
+            assert os.listdir(os.path.join(tmp, 'checkpoints')) == []
+    finally:
+        os.chdir(cwd)
+        StockDataLoader.get_stock_list, StockDataLoader.get_stock_data = original
+
+    print(f"中断续跑: 收益 {resumed[0]['return']:.4f}%, 一次性回测: {full[0]['return']:.4f}%")
+    assert abs(resumed[0]['return'] - full[0]['return']) < 1e-9 and resumed[0]['trades'] == full[0]['trades']
+    print("✓ 下载中断续跑测试通过")
+
+
+def test_interrupted_matching():
+    """测试撮合阶段中断：断点只含行数，运行记录和已完成阈值的终态另存，续跑结果与一次性回测一致"""
+    stock_data = create_test_stocks(count=5, days=200)
+    stock_list = [{'code': code, 'name': item['name']} for code, item in stock_data.items()]
+    calls = {'n': 0, 'interrupt_at': 15}
+    sizes = []
+
+    def run_on_market_data(self, market_data, dates, min_quality=60):
+        calls['n'] += 1
+        if calls['n'] == calls['interrupt_at']:
+            raise KeyboardInterrupt
+        return original_run(self, market_data, dates, min_quality)
+
+    def save(self, state):
+        original_save(self, state)
+        sizes.append(os.path.getsize(self.path))
+
+    original = (StockDataLoader.get_stock_list, StockDataLoader.get_stock_data)
+    original_run, original_save = PortfolioBacktester.run_on_market_data, BacktestCheckpoint.save
+    StockDataLoader.get_stock_list = staticmethod(lambda board_filter=None, max_stocks=None: stock_list)
+    StockDataLoader.get_stock_data = staticmethod(lambda code, days=250: stock_data[code]['df'])
+    PortfolioBacktester.run_on_market_data = run_on_market_data
+    BacktestCheckpoint.save = save
+    cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            kwargs = dict(quality_thresholds=[-1, 0], strict_mode=False, checkpoint_every=20)
+            with contextlib.redirect_stdout(io.StringIO()):
+                try:
+                    run_backtest(**kwargs)
+                    assert False, "应在撮合阶段中断"
+                except KeyboardInterrupt:
+                    pass
+
+                # 断点中没有运行记录和已完成阈值的终态，只有行数
+                path = next(os.path.join('checkpoints', f) for f in os.listdir('checkpoints') if f.endswith('.pkl'))
+                with open(path, 'rb') as f:
+                    raw = pickle.load(f)
+                assert raw['done_thresholds'] == [-1] and raw['current_threshold'] == 0
+                assert 'final_states' not in raw and 'trades' not in raw['engine_state']
+                assert raw['ledger']['chunks'] == raw['date_index'] // 20
+                ledger_files = os.listdir(path.replace('.pkl', '.ledger'))
+                assert 'final_q-1.pkl' in ledger_files and not any(f.startswith('q-1_') for f in ledger_files)
+
+                resumed = run_backtest(resume=True, **kwargs)
+                calls['interrupt_at'] = None
+                full = run_backtest(**kwargs)
+            assert os.listdir('checkpoints') == []
+    finally:
+        os.chdir(cwd)
+        StockDataLoader.get_stock_list, StockDataLoader.get_stock_data = original
+        PortfolioBacktester.run_on_market_data, BacktestCheckpoint.save = original_run, original_save
+
+    print(f"断点文件大小: 最小 {min(sizes):,} 字节, 最大 {max(sizes):,} 字节 ({len(sizes)} 次保存)")
+    assert max(sizes) < min(sizes) * 1.5
+    for r, f in zip(resumed, full):
+        print(f"阈值 {f['threshold']}: 续跑收益 {r['return']:.4f}%, 一次性回测 {f['return']:.4f}%")
+        assert r['threshold'] == f['threshold'] and abs(r['return'] - f['return']) < 1e-9
+        assert r['trades'] == f['trades'] > 0
+    print("✓ 撮合中断续跑测试通过")
+
+
+if __name__ == "__main__":
+    test_checkpoint_resume()
+    test_extend_backtest()
+    test_interrupted_download()
+    test_interrupted_matching()
@@ -0,0 +1,124 @@
+"""
+测试N天延迟回测
+使用模拟数据验证：一次计算信号后的网格评估与逐个组合回测结果一致、组合模式的资金与持仓约束
+"""
+import numpy as np
+import pandas as pd
+from backtest_n_days import NDayBacktester, evaluate_n_day_grid
+from test_optimizer import create_test_stocks
+
+
+def test_n_day_grid():
+    """测试网格评估：与逐个组合调用 backtest_stock 的结果一致"""
+    print("=" * 80)
+    print("N天延迟回测网格评估测试")
+    print("=" * 80)
+
+    stock_data = create_test_stocks(count=5, days=200)
+    buy_delay_list = [0, 1, 3]
+    hold_days_list = [0, 2, 5]
+
+    prepared_stocks = []
+    for code, item in stock_data.items():
+        prepared = NDayBacktester(strict_mode=False).prepare_stock(code, item['name'], item['df'])
+        prepared_stocks.append(prepared)
+
+    grid = evaluate_n_day_grid(prepared_stocks, buy_delay_list, hold_days_list, strict_mode=False)
+    print(grid.to_string(index=False))
+    assert len(grid) == len(buy_delay_list) * len(hold_days_list)
+
+    for buy_delay in buy_delay_list:
+        for hold_days in hold_days_list:
+            backtester = NDayBacktester(buy_delay=buy_delay, hold_days=hold_days, strict_mode=False)
+            trades = []
+            for code, item in stock_data.items():
+                trades.extend(backtester.backtest_stock(code, item['name'], item['df']))
+
+            grid_trades = pd.concat([backtester.evaluate_prepared(p) for p in prepared_stocks], ignore_index=True)
+            assert grid_trades.to_dict('records') == trades
+
+            row = grid[(grid['买入延迟'] == buy_delay) & (grid['持有天数'] == hold_days)].iloc[0]
+            metrics = backtester.calculate_metrics(trades)
+            assert row['交易次数'] == metrics['total_trades']
+            assert row['总收益(%)'] == round(metrics['total_return'], 2)
+
+            # 单股同一时间只持有一仓：下一笔买入不早于上一笔卖出
+            for code in stock_data:
+                stock_trades = grid_trades[grid_trades['stock_code'] == code]
+                assert (stock_trades['buy_date'].iloc[1:].values >= stock_trades['sell_date'].iloc[:-1].values).all()
+
+    print("\n✓ N天延迟回测网格评估测试通过")
+
+
+def test_schedule_trades():
+    """测试按信号下标推算买卖点：持仓/待买期间忽略信号、资金不足放弃、最后一天买入计为未平仓"""
+    print("=" * 80)
+    print("N天延迟回测买卖点测试")
+    print("=" * 80)
+
+    n = 30
+    opens = np.full(n, 10.0)
+    opens[16] = 5000.0  # 资金不足一手
+    closes = opens + 0.5
+    signal_idx = np.array([2, 3, 9, 12, 14, 16, 25, 28, 29])
+    prepared = {
+        'code': 'sz.300001', 'name': '测试',
+        'dates': pd.bdate_range('2024-01-01', periods=n),
+        'opens': opens, 'closes': closes,
+        'signal_idx': signal_idx, 'signal_quality': np.full(len(signal_idx), 100.0)
+    }
+
+    backtester = NDayBacktester(buy_delay=2, hold_days=3, strict_mode=False)
+    signal_nums, buys, sells, still_open = backtester.schedule_trades(prepared, 2, 3)
+    print(f"信号: {signal_idx[signal_nums].tolist()} 买入: {buys.tolist()} 卖出: {sells.tolist()}")
+    assert signal_idx[signal_nums].tolist() == [2, 9, 16, 25]
+    assert buys.tolist() == [4, 11, 18, 27]
+    assert sells.tolist() == [7, 14, 21, 29]
+    assert not still_open.any()
+
+    # 最后一根K线买入：按收盘价计为未平仓
+    prepared = dict(prepared, signal_idx=np.array([28]), signal_quality=np.array([100.0]))
+    trades = NDayBacktester(buy_delay=1, hold_days=5, strict_mode=False).evaluate_prepared(prepared)
+    assert len(trades) == 1
+    last = trades.iloc[-1]
+    assert last['exit_reason'] == 'open'
+    assert last['buy_date'] == last['sell_date'] == prepared['dates'][-1]
+    assert last['sell_price'] == closes[-1]
+    assert list(trades.columns) == NDayBacktester.TRADE_COLUMNS
+
+    print("\n✓ N天延迟回测买卖点测试通过")
+
+
+def test_n_day_portfolio():
+    """测试组合回测：持仓数上限、资金守恒，资金和仓位不受限时与单股回测一致"""
+    print("=" * 80)
+    print("N天延迟组合回测测试")
+    print("=" * 80)
+
+    stock_data = create_test_stocks(count=8, days=200)
+    backtester = NDayBacktester(buy_delay=1, hold_days=3, strict_mode=False)
+    prepared_stocks = [backtester.prepare_stock(code, item['name'], item['df']) for code, item in stock_data.items()]
+
+    trades, equity_curve = backtester.backtest_portfolio(prepared_stocks, max_positions=2)
+    print(f"交易: {len(trades)} 笔, 期末权益: {equity_curve[-1]['equity']:,.2f}, 统计: {backtester.stats}")
+    assert len(trades) > 0
+    assert max(row['position_count'] for row in equity_curve) <= 2
+    assert min(row['cash'] for row in equity_curve) >= 0
+    assert abs(equity_curve[-1]['equity'] - (100000 + trades['profit'].sum())) < 1e-6
+    assert backtester.stats['skipped_max_positions'] > 0
+
+    # 资金充足、不限持仓时，每只股票的交易与单股回测相同
+    rich = NDayBacktester(buy_delay=1, hold_days=3, strict_mode=False, initial_capital=1e8)
+    trades, _ = rich.backtest_portfolio(prepared_stocks, max_positions=len(prepared_stocks))
+    single = pd.concat([backtester.evaluate_prepared(p) for p in prepared_stocks], ignore_index=True)
+    key = ['stock_code', 'buy_date', 'sell_date', 'exit_reason']
+    assert (trades[key].sort_values(key).reset_index(drop=True)
+            .equals(single[key].sort_values(key).reset_index(drop=True)))
+
+    print("\n✓ N天延迟组合回测测试通过")
+
+
+if __name__ == "__main__":
+    test_n_day_grid()
+    test_schedule_trades()
+    test_n_day_portfolio()
@@ -0,0 +1,196 @@
+"""
+测试本地增量K线存储
+用模拟的下载函数验证：只下载缺失区间、批量预取、下载失败不标记为已缓存、指数过滤器复用本地数据
+"""
+import os
+import tempfile
+import pandas as pd
+import bar_store
+from bar_store import BarStore
+from index_trend_filter import IndexTrendFilter
+from test_optimizer import create_test_stocks
+
+
+class FakeBarStore(BarStore):
+    """不连接服务器，从模拟数据中"下载"，并记录每次下载的区间"""
+
+    def __init__(self, cache_dir, source):
+        super().__init__(cache_dir)
+        self.source = source
+        self.fetch_log = []
+        self.login_count = 0
+
+    def _ensure_login(self):
+        if not self._logged_in:
+            self.login_count += 1
+            self._logged_in = True
+
+    def logout(self):
+        self._session_depth -= 1
+        if self._session_depth == 0:
+            self._logged_in = False
+
+    def _fetch(self, code, start_date, end_date):
+        self.fetch_log.append((code, start_date, end_date))
+        df = self.source[code]
+        return df[(df.index >= pd.Timestamp(start_date)) & (df.index <= pd.Timestamp(end_date))]
+
+
+def test_bar_store():
+    """测试增量补齐与批量预取"""
+    print("=" * 80)
+    print("本地K线存储测试")
+    print("=" * 80)
+
+    source = {code: item['df'] for code, item in create_test_stocks(count=3, days=200).items()}
+    codes = list(source)
+    last_day = source[codes[0]].index[-1]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = FakeBarStore(tmp, source)
+
+        # 首次：下载最近60天
+        end = last_day.strftime('%Y-%m-%d')
+        df = store.get_bars(codes[0], days=60, end_date=end)
+        assert len(store.fetch_log) == 1
+        assert df.index[0] >= last_day - pd.Timedelta(days=60)
+
+        # 再次获取同一区间：不下载
+        again = store.get_bars(codes[0], days=60, end_date=end)
+        assert len(store.fetch_log) == 1
+        pd.testing.assert_frame_equal(df, again, check_freq=False)
+
+        # 扩大到120天：只下载更早的缺失区间
+        longer = store.get_bars(codes[0], days=120, end_date=end)
+        code, start, fetch_end = store.fetch_log[-1]
+        assert len(store.fetch_log) == 2 and fetch_end < df.index[0].strftime('%Y-%m-%d')
+        expected = source[codes[0]][source[codes[0]].index >= pd.Timestamp(start)]
+        pd.testing.assert_frame_equal(longer, expected, check_freq=False)
+        print(f"增量补齐: {[log[1:] for log in store.fetch_log]}")
+
+        # 新的存储对象（另一个进程）直接读取本地文件
+        other = FakeBarStore(tmp, source)
+        other.get_bars(codes[0], days=120, end_date=end)
+        assert other.fetch_log == [] and other.login_count == 0
+
+        # 批量预取只登录一次
+        store.login_count = 0
+        result = store.prefetch(codes, days=90, end_date=end)
+        assert all(result[c] is not None for c in codes)
+        assert store.login_count == 1
+        print(f"批量预取: {len(codes)} 个代码, 登录 {store.login_count} 次")
+
+    print("\n✓ 本地K线存储测试通过")
+
+
+class FakeBaostock:
+    """替换 bar_store.bs：登录或查询可以设置为返回错误码"""
+
+    class Result:
+        def __init__(self, error_code='0', rows=()):
+            self.error_code = error_code
+            self.error_msg = '' if error_code == '0' else '网络接收错误'
+            self.rows = list(rows)
+
+        def next(self):
+            return bool(self.rows)
+
+        def get_row_data(self):
+            return self.rows.pop(0)
+
+    def __init__(self, df):
+        self.df = df
+        self.login_error = False
+        self.query_error = False
+        self.queries = []
+
+    def login(self):
+        return self.Result('10002007' if self.login_error else '0')
+
+    def logout(self):
+        pass
+
+    def query_history_k_data_plus(self, code, fields, start_date, end_date, frequency, adjustflag):
+        self.queries.append((start_date, end_date))
+        if self.query_error:
+            return self.Result('10002007')
+        df = self.df[(self.df.index >= pd.Timestamp(start_date)) & (self.df.index <= pd.Timestamp(end_date))]
+        rows = [[d.strftime('%Y-%m-%d'), *(str(v) for v in row)]
+                for d, row in zip(df.index, df[['open', 'high', 'low', 'close', 'volume']].to_numpy())]
+        return self.Result('0', rows)
+
+
+def test_fetch_failure():
+    """测试下载失败：抛出异常，失败的区间不记入元数据，下次重新下载"""
+    df = create_test_stocks(count=1, days=120)['sz.300000']['df']
+    code = 'sz.300000'
+    end = df.index[-1].strftime('%Y-%m-%d')
+    middle = df.index[60].strftime('%Y-%m-%d')
+    fake = FakeBaostock(df)
+    original = bar_store.bs
+    bar_store.bs = fake
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            store = BarStore(tmp)
+
+            # 登录失败：不写入任何缓存
+            fake.login_error = True
+            try:
+                store.get_bars(code, days=30, end_date=middle)
+                assert False, "登录失败应抛出异常"
+            except RuntimeError as e:
+                print(f"登录失败: {e}")
+            assert store._load_meta(code) is None
+            fake.login_error = False
+
+            first = store.get_bars(code, days=30, end_date=middle)
+            meta = store._load_meta(code)
+            assert meta['end'] == middle and first.index[-1] == df.index[60]
+
+            # 查询失败：抛出异常，元数据不扩展
+            fake.query_error = True
+            try:
+                store.get_bars(code, days=30, end_date=end)
+                assert False, "下载失败应抛出异常"
+            except RuntimeError as e:
+                print(f"下载失败: {e}")
+            assert store._load_meta(code) == meta
+            fake.query_error = False
+
+            # 恢复后重新下载失败的区间
+            fake.queries.clear()
+            bars = store.get_bars(code, days=30, end_date=end)
+            assert fake.queries and fake.queries[0][0] > middle
+            assert bars.index[-1] == df.index[-1] and store._load_meta(code)['end'] == end
+            print(f"恢复后补齐: {fake.queries}")
+    finally:
+        bar_store.bs = original
+
+    print("✓ 下载失败测试通过")
+
+
+def test_index_filter_uses_store():
+    """测试指数过滤器构造时载入本地指数数据"""
+    print("=" * 80)
+    print("指数数据本地存储测试")
+    print("=" * 80)
+
+    index_df = create_test_stocks(count=1, days=150)['sz.300000']['df']
+    with tempfile.TemporaryDirectory() as tmp:
+        store = BarStore(tmp)
+        store._save('sz.399006', index_df, {'start': '2000-01-01', 'end': '2000-01-01'})
+
+        index_filter = IndexTrendFilter(cache_dir=tmp)
+        assert 'sz.399006' in index_filter.index_data_cache
+        assert len(index_filter.index_data_cache['sz.399006']) == len(index_df)
+        assert 'sh.000688' not in index_filter.index_data_cache
+        assert IndexTrendFilter.index_codes() == ['sz.399006', 'sh.000688', 'sh.000001', 'sz.399001']
+        print(f"构造时载入: {list(index_filter.index_data_cache)}")
+
+    print("\n✓ 指数数据本地存储测试通过")
+
+
+if __name__ == "__main__":
+    test_bar_store()
+    test_fetch_failure()
+    test_index_filter_uses_store()
@@ -0,0 +1,133 @@
+"""
+测试快速扫描
+使用模拟数据验证：面板一次计算的信号与逐只股票计算完全一致，并发下载写入共用的本地K线存储，预筛选不改变扫描结果
+"""
+import tempfile
+import warnings
+import pandas as pd
+import batch_monitor
+from batch_monitor import check_buy_signal, scan_signals_panel, fetch_bars_concurrent
+from qqe_trend_strategy import QQETrendStrategy, qqe_trend_strategy, build_bar_panel, qqe_trend_panel
+from test_bar_store import FakeBarStore
+from test_optimizer import create_test_stocks
+
+warnings.simplefilter('ignore', FutureWarning)
+
+
+def _test_bars():
+    stock_data = create_test_stocks(count=12, days=160)
+    bars = {}
+    for k, (code, item) in enumerate(stock_data.items()):
+        df = item['df']
+        if k % 3 == 1:
+            df = df.iloc[30 + k:]  # 上市较晚
+        if k % 4 == 2:
+            df = df.iloc[:-2]  # 最近停牌
+        bars[code] = df
+    return bars
+
+
+def test_panel_signals():
+    """测试面板信号：每列与单独调用 qqe_trend_strategy 的结果逐值相同"""
+    print("=" * 80)
+    print("面板信号测试")
+    print("=" * 80)
+
+    bars = _test_bars()
+    panel, dates = build_bar_panel(bars)
+    for strict_mode in (False, True):
+        frames = qqe_trend_panel(panel, strict_mode=strict_mode)
+        for code, df in bars.items():
+            expected = qqe_trend_strategy(df, strict_mode=strict_mode)
+            n = len(df)
+            assert (dates[code].to_numpy()[-n:] == df.index.to_numpy()).all()
+            for column, frame in frames.items():
+                got = pd.Series(frame[code].to_numpy()[-n:], index=df.index, name=column)
+                pd.testing.assert_series_equal(got, expected[column], check_dtype=False, check_exact=True)
+        print(f"{'严格' if strict_mode else '标准'}模式: {len(bars)} 只股票 × {len(frames)} 列一致")
+
+    print("\n✓ 面板信号测试通过")
+
+
+def test_fast_scan():
+    """测试快速扫描：结果与逐只股票 check_buy_signal 相同，下载写入本地存储"""
+    print("=" * 80)
+    print("快速扫描测试")
+    print("=" * 80)
+
+    bars = _test_bars()
+    for strict_mode, min_quality, check_days in [(False, 0, 20), (True, 0, 60), (True, 60, 60)]:
+        found = scan_signals_panel(bars, check_days=check_days, strict_mode=strict_mode, min_quality=min_quality)
+        expected = []
+        for code, df in bars.items():
+            buy_date, buy_price, current_price, quality = check_buy_signal(
+                df, check_days=check_days, strict_mode=strict_mode, min_quality=min_quality)
+            if buy_date is not None:
+                expected.append((code, buy_date, buy_price, current_price, quality))
+        got = [(s['code'], s['buy_date'], s['buy_price'], s['current_price'], s['quality']) for s in found]
+        print(f"strict={strict_mode}, min_quality={min_quality}, check_days={check_days}: {len(got)} 个信号")
+        assert got == expected
+
+    # 并发下载：写入本地存储，第二次全部命中缓存
+    source = {code: df for code, df in bars.items()}
+    original = batch_monitor.BarStore
+    stores = []
+
+    def make_store(cache_dir):
+        store = FakeBarStore(cache_dir, source)
+        stores.append(store)
+        return store
+
+    batch_monitor.BarStore = make_store
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            fetched = fetch_bars_concurrent(list(source), days=400, workers=1, cache_dir=tmp, chunk_size=5,
+                                            end_date='2024-12-31')
+            assert set(fetched) == set(source)
+            assert sum(len(s.fetch_log) for s in stores) == len(source)
+            for code, df in fetched.items():
+                assert len(df) == len(source[code])
+
+            stores.clear()
+            fetch_bars_concurrent(list(source), days=400, workers=1, cache_dir=tmp, chunk_size=5,
+                                  end_date='2024-12-31')
+            assert sum(len(s.fetch_log) for s in stores) == 0
+    finally:
+        batch_monitor.BarStore = original
+
+    print("\n✓ 快速扫描测试通过")
+
+
+def test_strict_prescreen():
+    """测试严格模式预筛选：只排除不可能有信号的股票，扫描结果与不预筛选时相同"""
+    print("=" * 80)
+    print("严格模式预筛选测试")
+    print("=" * 80)
+
+    bars = _test_bars()
+    strategy = QQETrendStrategy()
+    panel, _ = build_bar_panel(bars)
+    for check_days, min_quality in [(2, 0), (60, 0), (60, 80)]:
+        candidates = strategy.strict_prescreen(panel, check_days, min_quality)
+        for code, df in bars.items():
+            # 单股与面板结果一致；被排除的股票最近 check_days 天没有达标的严格信号
+            assert strategy.strict_prescreen(df, check_days, min_quality) == candidates[code]
+            if not candidates[code]:
+                result = qqe_trend_strategy(df, strict_mode=True).tail(check_days)
+                assert not (result['buy_signal_strict'] & (result['signal_quality'] >= min_quality)).any()
+
+        found = scan_signals_panel(bars, check_days=check_days, min_quality=min_quality)
+        assert found == scan_signals_panel(bars, check_days=check_days, min_quality=min_quality, prescreen=False)
+        for df in bars.values():
+            assert (check_buy_signal(df, check_days, True, min_quality) ==
+                    check_buy_signal(df, check_days, True, min_quality, prescreen=False))
+        print(f"check_days={check_days}, min_quality={min_quality}: "
+              f"{int(candidates.sum())}/{len(candidates)} 只进入QQE计算, {len(found)} 个信号")
+
+    print("\n✓ 严格模式预筛选测试通过")
+
+
+if __name__ == "__main__":
+    test_panel_signals()
+    test_fast_scan()
+    test_strict_prescreen()
@@ -0,0 +1,177 @@
+"""
+测试指数趋势过滤器的预计算趋势序列
+使用模拟指数数据验证：按日查表结果与截取历史后的逐日计算一致
+"""
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from index_trend_filter import IndexTrendFilter
+from qqe_trend_strategy import qqe_trend_strategy
+from test_optimizer import create_test_stocks
+
+
+def _strength_on_slice(df):
+    """在截取到当日的数据上直接计算趋势强度（与查表结果对照）"""
+    close = df['close'].iloc[-1]
+    ma20 = df['close'].rolling(20).mean().iloc[-1]
+    ma60 = df['close'].rolling(60).mean().iloc[-1]
+    score = 10 * (close > ma20) + 10 * (close > ma60) + 5 * (ma20 > ma60)
+    high_60 = df['high'].rolling(60).max().iloc[-1]
+    low_60 = df['low'].rolling(60).min().iloc[-1]
+    score += (close - low_60) / (high_60 - low_60) * 25 if high_60 > low_60 else 12.5
+    ma20_5ago = df['close'].rolling(20).mean().iloc[-6]
+    score += max(0, min(25, (ma20 - ma20_5ago) / ma20_5ago * 500))
+    close_5ago = df['close'].iloc[-6]
+    score += max(0, min(25, (close - close_5ago) / close_5ago * 250))
+    return max(0, min(100, score))
+
+
+def _simple_on_slice(df):
+    close = df['close'].iloc[-1]
+    ma20 = df['close'].rolling(20).mean().iloc[-1]
+    ma60 = df['close'].rolling(60).mean().iloc[-1]
+    return close > ma20 and close > ma60 and ma20 > ma60
+
+
+def test_regime_series():
+    """测试趋势序列预计算与按日查表"""
+    print("=" * 80)
+    print("指数趋势序列测试")
+    print("=" * 80)
+
+    df = create_test_stocks(count=1, days=160)['sz.300000']['df']
+    index_filter = IndexTrendFilter()
+    index_filter.index_data_cache['sz.399006'] = df
+
+    regime = index_filter.get_regime_series('sz.399006', mode='simple')
+    assert regime is index_filter.get_regime_series('sz.399006', mode='simple')  # 只计算一次
+    assert not regime['is_bullish'].iloc[:59].any()
+    assert (regime['trend_strength'].iloc[:59] == 50).all()
+
+    for i in range(59, len(df)):
+        date = df.index[i]
+        window = df.iloc[:i + 1]
+        assert index_filter.is_bullish_trend('sz.399006', date, mode='simple') == _simple_on_slice(window)
+        assert abs(index_filter.get_trend_strength('sz.399006', date) - _strength_on_slice(window)) < 1e-9
+
+    # 非交易日查询取之前最近一个交易日
+    saturday = df.index[100] + pd.Timedelta(days=(5 - df.index[100].weekday()) % 7)
+    friday = df.index[df.index <= saturday][-1]
+    assert (index_filter.should_allow_entry('sz.300750', saturday, 'moderate', 0) ==
+            index_filter.should_allow_entry('sz.300750', friday, 'moderate', 0))
+
+    # 数据不足60天的日期不允许开仓
+    allow, index_code, strength = index_filter.should_allow_entry('sz.300750', df.index[30], 'simple', 0)
+    assert index_code == 'sz.399006' and not allow and strength == 50
+
+    # 指数数据被替换后重新计算
+    index_filter.index_data_cache['sz.399006'] = df * 1.0
+    assert index_filter.get_regime_series('sz.399006', mode='simple') is not regime
+
+    bullish_days = int(regime['is_bullish'].sum())
+    print(f"交易日: {len(regime)}, 简单模式多头天数: {bullish_days}, 最新强度: {regime['trend_strength'].iloc[-1]:.1f}")
+    print("\n✓ 指数趋势序列测试通过")
+
+
+def test_strict_regime_no_lookahead():
+    """测试严格模式：全历史计算一次的结果与逐日截取历史计算一致"""
+    print("=" * 80)
+    print("严格模式趋势序列测试")
+    print("=" * 80)
+
+    df = create_test_stocks(count=3, days=200)['sz.300002']['df']
+    index_filter = IndexTrendFilter()
+    index_filter.index_data_cache['sz.399006'] = df
+    regime = index_filter.get_regime_series('sz.399006', mode='strict')
+
+    for i in range(59, len(df), 7):
+        result = qqe_trend_strategy(df.iloc[:i + 1], strict_mode=True)
+        latest = result.iloc[-1]
+        expected = bool(latest['long_condition'] and latest['trend'] > 10 and
+                        latest['close'] > latest['ha_close_ma'] and 30 < latest['secondary_rsi'] < 80 and
+                        result['long_condition'].iloc[-5:].sum() >= 3)
+        assert bool(regime['is_bullish'].iloc[i]) == expected, df.index[i]
+
+    print(f"严格模式多头天数: {int(regime['is_bullish'].sum())}/{len(regime)}")
+    print("\n✓ 严格模式趋势序列测试通过")
+
+
+def test_regime_panel():
+    """测试多指数、多模式趋势面板与逐个查询一致，以及最小强度扫描"""
+    print("=" * 80)
+    print("趋势面板测试")
+    print("=" * 80)
+
+    stocks = create_test_stocks(count=3, days=180)
+    index_filter = IndexTrendFilter()
+    index_filter.index_data_cache['sz.399006'] = stocks['sz.300000']['df']
+    index_filter.index_data_cache['sh.000688'] = stocks['sz.300001']['df'].iloc[30:]
+
+    dates = pd.date_range('2024-03-01', '2024-09-30', freq='D')
+    panel = index_filter.get_regime_panel(['sz.399006', 'sh.000688'], dates=dates)
+    assert panel['is_bullish'].shape == (len(dates), 2, 3)
+    assert panel['strength'].shape == (len(dates), 2)
+
+    for d in range(0, len(dates), 5):
+        for i, index_code in enumerate(panel['indices']):
+            for m, mode in enumerate(panel['modes']):
+                assert panel['is_bullish'][d, i, m] == index_filter.is_bullish_trend(index_code, dates[d], mode)
+            assert abs(panel['strength'][d, i] - index_filter.get_trend_strength(index_code, dates[d])) < 1e-9
+
+    thresholds = [0, 50, 60, 70]
+    allow = IndexTrendFilter.sweep_min_strength(panel, thresholds, mode='moderate')
+    assert allow.shape == (len(thresholds), len(dates), 2)
+    counts = allow.sum(axis=(1, 2))
+    assert all(counts[k] >= counts[k + 1] for k in range(len(thresholds) - 1))
+    print(f"各阈值允许开仓的(日期, 指数)数: {dict(zip(thresholds, counts.tolist()))}")
+
+    print("\n✓ 趋势面板测试通过")
+
+
+def test_sector_composites():
+    """测试行业合成指数构建与个股到行业的映射"""
+    print("=" * 80)
+    print("行业板块映射测试")
+    print("=" * 80)
+
+    stocks = create_test_stocks(count=7, days=150)
+    panel = {code: item['df'] for code, item in stocks.items()}
+    codes = list(panel)
+    # 4只电子、2只医药（少于3只，不构建）、1只无行业
+    industry_map = {code: '电子' for code in codes[:4]}
+    industry_map.update({code: '医药' for code in codes[4:6]})
+
+    composites, sector_map = IndexTrendFilter.build_sector_composites(panel, industry_map, min_members=3)
+    assert list(composites) == ['sector:电子']
+    assert sector_map == {code: 'sector:电子' for code in codes[:4]}
+
+    # 合成指数日收益 = 成分股日收益等权平均
+    composite = composites['sector:电子']
+    expected = pd.concat([panel[c]['close'].pct_change() for c in codes[:4]], axis=1).mean(axis=1)
+    np.testing.assert_allclose(composite['close'].pct_change().iloc[1:], expected.iloc[1:], rtol=1e-9)
+    assert (composite['high'] >= composite[['open', 'close']].max(axis=1) - 1e-9).all()
+    assert (composite['low'] <= composite[['open', 'close']].min(axis=1) + 1e-9).all()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # 行业分类从本地缓存读取，不联网
+        pd.DataFrame({'code': list(industry_map), 'code_name': '', 'industry': list(industry_map.values())}) \
+            .to_csv(os.path.join(tmp, 'stock_industry.csv'), index=False, encoding='utf-8-sig')
+        index_filter = IndexTrendFilter(cache_dir=tmp)
+        assert index_filter.enable_sector_filter(panel) == 4
+
+        assert index_filter._get_index_code(codes[0]) == 'sector:电子'
+        assert index_filter._get_index_code(codes[5]) == 'sz.399006'  # 医药成分股不足，使用大盘指数
+        allow, index_code, strength = index_filter.should_allow_entry(codes[0], composite.index[-1], 'moderate', 0)
+        assert index_code == 'sector:电子'
+        assert strength == index_filter.get_trend_strength('sector:电子', composite.index[-1])
+        print(f"{codes[0]} -> {index_code}, 允许开仓: {allow}, 强度: {strength:.1f}")
+
+    print("\n✓ 行业板块映射测试通过")
+
+
+if __name__ == "__main__":
+    test_regime_series()
+    test_strict_regime_no_lookahead()
+    test_regime_panel()
+    test_sector_composites()
@@ -0,0 +1,153 @@
+"""
+测试盘中监控
+使用模拟数据验证：行情解析、成交量折算、盘中试算与把当天K线接上后整体计算的结果一致、稳定性计数、
+过期行情不参与试算
+"""
+import time
+import warnings
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from intraday_monitor import IntradayMonitor, parse_sina_quotes, session_fraction
+from qqe_trend_strategy import qqe_trend_strategy
+from test_optimizer import create_test_stocks
+
+warnings.simplefilter('ignore', FutureWarning)
+
+CLOSE_TIME = datetime(2026, 10, 19, 15, 0)
+
+
+def _quote_text(code, name, bar, prev_close):
+    fields = [name, bar['open'], prev_close, bar['close'], bar['high'], bar['low'], 0, 0, bar['volume'], 0]
+    fields += [0] * 20 + ['2026-10-19', '15:00:00', '00']
+    return f'var hq_str_{code.replace(".", "")}="{",".join(str(f) for f in fields)}";\n'
+
+
+def _split_today(stock_data, offset):
+    """把倒数第 offset 根K线当作"今天"：之前的为已收盘K线，这一根作为实时行情"""
+    history, text = {}, ''
+    for code, item in stock_data.items():
+        df = item['df'].iloc[:len(item['df']) - offset + 1]
+        history[code] = df
+        text += _quote_text(code, item['name'], df.iloc[-1], df['close'].iloc[-2])
+    return history, parse_sina_quotes(text)
+
+
+def test_parse_quotes():
+    """测试行情解析和已交易时间比例"""
+    text = (_quote_text('sz.300750', '宁德时代', {'open': 200.0, 'close': 203.5, 'high': 205.0, 'low': 199.0,
+                                                  'volume': 123400}, 201.0) +
+            'var hq_str_sh688001="停牌股,0.00,30.00,0.00,0.00,0.00,0,0,0,0' + ',0' * 20 + ',2026-10-19,15:00:00,03";\n' +
+            'var hq_str_sz300999="";\n')
+    quotes = parse_sina_quotes(text)
+    assert list(quotes.index) == ['sz.300750']
+    assert quotes.loc['sz.300750', 'close'] == 203.5 and quotes.loc['sz.300750', 'volume'] == 123400
+
+    assert session_fraction(datetime(2026, 10, 19, 9, 0)) == 0
+    assert session_fraction(datetime(2026, 10, 19, 10, 30)) == 0.25
+    assert session_fraction(datetime(2026, 10, 19, 12, 0)) == 0.5
+    assert session_fraction(datetime(2026, 10, 19, 14, 0)) == 0.75
+    assert session_fraction(CLOSE_TIME) == 1
+    print("✓ 行情解析测试通过")
+
+
+def test_intraday_monitor():
+    """测试盘中试算：与接上当天K线后用 qqe_trend_strategy 计算相同，已收盘K线不被修改"""
+    print("=" * 80)
+    print("盘中监控测试")
+    print("=" * 80)
+
+    stock_data = create_test_stocks(count=8, days=300)
+    codes = list(stock_data)
+
+    # 找一个至少有一只股票出现买入信号的"今天"
+    full = {code: qqe_trend_strategy(item['df']) for code, item in stock_data.items()}
+    offset = next(k for k in range(1, 100) if any(r['buy_signal'].iloc[-k] for r in full.values()))
+    history, quotes = _split_today(stock_data, offset)
+    today = next(iter(history.values())).index[-1]
+
+    for strict_mode in (True, False):
+        monitor = IntradayMonitor(codes, strict_mode=strict_mode, min_quality=0)
+        monitor.load_history(history, today=today)
+        committed = {field: values.copy() for field, values in monitor._arrays.items()}
+        signals = monitor.evaluate(quotes, now=CLOSE_TIME)
+        for code, df in history.items():
+            expected = qqe_trend_strategy(df.tail(monitor.warmup + 1), strict_mode=strict_mode).iloc[-1]
+            buy_column = 'buy_signal_strict' if strict_mode else 'buy_signal'
+            assert signals.loc[code, 'buy_signal'] == expected[buy_column]
+            assert signals.loc[code, 'sell_signal'] == expected['sell_signal']
+            if strict_mode:
+                assert signals.loc[code, 'signal_quality'] == expected['signal_quality']
+        for field, values in committed.items():
+            np.testing.assert_array_equal(monitor._arrays[field], values)
+        print(f"{'严格' if strict_mode else '标准'}模式: 买入 {int(signals['buy_signal'].sum())}, "
+              f"卖出 {int(signals['sell_signal'].sum())}")
+
+    # 稳定性：连续出现 stable_polls 轮后稳定，中断后重新计数；止损直接稳定
+    buy_code = next(code for code, r in full.items() if r['buy_signal'].iloc[-offset])
+    held = next(code for code in codes if code != buy_code)
+    positions = {held: {'name': held, 'shares': 100, 'cost_basis': quotes.loc[held, 'low'] * 100 * 1.2}}
+    monitor = IntradayMonitor(codes, strict_mode=False, min_quality=0, positions=positions, stable_polls=3)
+    monitor.load_history(history, today=today)
+    for poll in range(1, 4):
+        found = {(f['code'], f['condition']): f for f in monitor.poll(quotes, now=CLOSE_TIME)}
+        assert found[(buy_code, '买入')]['streak'] == poll
+        assert found[(buy_code, '买入')]['stable'] == (poll == 3)
+        assert found[(held, '止损')]['stable']
+    monitor.report(list(found.values()), now=CLOSE_TIME)
+    monitor.poll(quotes.drop(index=buy_code), now=CLOSE_TIME)
+    found = {(f['code'], f['condition']): f for f in monitor.poll(quotes, now=CLOSE_TIME)}
+    assert found[(buy_code, '买入')]['streak'] == 1
+
+    # 盘中成交量按已交易时间折算：10:30 时的成交量放大4倍参与计算
+    monitor = IntradayMonitor(codes, strict_mode=True, min_quality=0)
+    monitor.load_history(history, today=today)
+    morning = quotes.copy()
+    morning['volume'] = morning['volume'] / 4
+    pd.testing.assert_frame_equal(monitor.evaluate(morning, now=datetime(2026, 10, 19, 10, 30)),
+                                  monitor.evaluate(quotes, now=CLOSE_TIME))
+
+    # 几百只股票一轮
+    many = create_test_stocks(count=300, days=250)
+    history, quotes = _split_today(many, 1)
+    monitor = IntradayMonitor(list(many), strict_mode=True)
+    monitor.load_history(history, today=next(iter(history.values())).index[-1])
+    start = time.time()
+    monitor.poll(quotes, now=CLOSE_TIME)
+    elapsed = time.time() - start
+    print(f"300 只股票一轮试算: {elapsed:.2f}秒")
+    assert elapsed < 5
+
+    print("\n✓ 盘中监控测试通过")
+
+
+def test_stale_quotes():
+    """测试过期行情：日期不是今天、或等于最后一根已收盘K线的股票被跳过，不会把昨天的K线再接一次"""
+    stock_data = create_test_stocks(count=3, days=250)
+    codes = list(stock_data)
+    history, quotes = _split_today(stock_data, 1)
+    today = next(iter(history.values())).index[-1]
+    last_closed = history[codes[0]].index[-2]
+    monitor = IntradayMonitor(codes, strict_mode=False, min_quality=0)
+    monitor.load_history(history, today=today)
+    assert len(monitor.evaluate(quotes, now=CLOSE_TIME)) == 3 and monitor.stale_codes == []
+
+    # 一只股票停牌：行情还是前一天的
+    stale = quotes.copy()
+    stale.loc[codes[0], 'date'] = '2026-10-16'
+    signals = monitor.evaluate(stale, now=CLOSE_TIME)
+    assert list(signals.index) == codes[1:] and monitor.stale_codes == [codes[0]]
+
+    # 行情日期等于最后一根已收盘K线（即使是"今天"）：全部跳过
+    stale['date'] = last_closed.strftime('%Y-%m-%d')
+    now = datetime.combine(last_closed.date(), CLOSE_TIME.time())
+    assert monitor.evaluate(stale, now=now).empty and monitor.stale_codes == codes
+    assert monitor.poll(stale, now=now) == []
+    print(f"过期行情跳过: {monitor.stale_codes}")
+    print("✓ 过期行情测试通过")
+
+
+if __name__ == "__main__":
+    test_parse_quotes()
+    test_intraday_monitor()
+    test_stale_quotes()
@@ -0,0 +1,74 @@
+"""
+测试回测绩效指标
+使用手工构造的权益曲线和交易表验证回撤、风险调整收益和分组统计
+"""
+import time
+import numpy as np
+import pandas as pd
+from metrics import drawdown_stats, equity_metrics, trade_metrics, column
+
+
+def test_equity_metrics():
+    """测试最大回撤及持续期、夏普/索提诺/卡玛、持仓占比"""
+    print("=" * 80)
+    print("权益指标测试")
+    print("=" * 80)
+
+    equity = np.array([100, 110, 99, 88, 95, 110, 121, 115, 120, 118], dtype=float)
+    max_dd, duration = drawdown_stats(equity)
+    print(f"最大回撤: {max_dd:.2f}%, 持续: {duration} 根")
+    assert abs(max_dd - (88 - 110) / 110 * 100) < 1e-9
+    assert duration == 3  # 110 之后连续3根低于前高（第5根持平视为修复）
+
+    m = equity_metrics(equity, initial_capital=100, position_count=[0, 1, 1, 1, 0, 0, 2, 2, 1, 0])
+    returns = np.diff(np.concatenate(([100.0], equity))) / np.concatenate(([100.0], equity))[:-1]
+    assert abs(m['total_return'] - 18.0) < 1e-9
+    assert abs(m['sharpe'] - returns.mean() / returns.std(ddof=1) * np.sqrt(252)) < 1e-9
+    assert m['sortino'] > m['sharpe']
+    assert abs(m['calmar'] - m['cagr'] / abs(max_dd)) < 1e-9
+    assert abs(m['exposure'] - 60.0) < 1e-9
+    print(f"年化 {m['cagr']:.1f}%, 夏普 {m['sharpe']:.2f}, 索提诺 {m['sortino']:.2f}, 卡玛 {m['calmar']:.2f}")
+
+    # 从未回撤
+    assert drawdown_stats([1, 2, 3]) == (0.0, 0)
+    assert equity_metrics([], initial_capital=100)['final_equity'] == 100
+
+    # 优化器循环中的调用开销
+    curve = 100000 * np.exp(np.cumsum(np.random.default_rng(0).normal(0, 0.01, 500)))
+    start = time.time()
+    for _ in range(1000):
+        equity_metrics(curve, 100000)
+    elapsed = time.time() - start
+    print(f"1000 次 x 500 天: {elapsed:.3f}秒")
+
+    print("\n✓ 权益指标测试通过")
+
+
+def test_trade_metrics():
+    """测试胜率、盈亏比、利润因子和按退出原因分组"""
+    print("=" * 80)
+    print("交易指标测试")
+    print("=" * 80)
+
+    trades = pd.DataFrame({
+        'profit_pct': [10.0, -5.0, 4.0, -1.0, 0.0],
+        'exit_reason': ['take_profit', 'stop_loss', 'signal', 'signal', 'stop_loss'],
+    })
+    m = trade_metrics(column(trades, 'profit_pct'), column(trades, 'exit_reason'))
+    print(m)
+    assert m['win_count'] == 2 and m['loss_count'] == 3
+    assert abs(m['payoff_ratio'] - 7.0 / 2.0) < 1e-9
+    assert abs(m['profit_factor'] - 14.0 / 6.0) < 1e-9
+    assert m['exit_reasons']['stop_loss'] == {'count': 2, 'win_rate': 0.0, 'avg_profit': -2.5, 'total_profit': -5.0}
+    assert m['exit_reasons']['signal']['win_rate'] == 50.0
+
+    # 记录列表与表格结果相同
+    assert trade_metrics(column(trades.to_dict('records'), 'profit_pct'))['avg_profit'] == m['avg_profit']
+    assert trade_metrics([])['total_trades'] == 0
+
+    print("\n✓ 交易指标测试通过")
+
+
+if __name__ == "__main__":
+    test_equity_metrics()
+    test_trade_metrics()
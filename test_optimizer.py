@@ -0,0 +1,175 @@
+"""
+测试参数优化器
+使用模拟数据验证：结果入库、重复运行跳过、帕累托前沿
+"""
+import contextlib
+import io
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from optimizer import (ResultStore, grid_points, random_points, pareto_front, run_search, params_hash,
+                       run_successive_halving, halving_schedule)
+from walk_forward import make_windows, run_walk_forward
+
+
+def create_test_stocks(count=5, days=200):
+    """创建若干只随机游走的模拟股票"""
+    stock_data = {}
+    for k in range(count):
+        rng = np.random.default_rng(k)
+        dates = pd.bdate_range('2024-01-01', periods=days)
+        close = 10 * np.exp(np.cumsum(rng.normal(0.001, 0.03, days)))
+        open_ = close * (1 + rng.normal(0, 0.01, days))
+        high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.015, days)))
+        low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.015, days)))
+        volume = rng.uniform(0.5, 2.0, days) * 1e6
+        df = pd.DataFrame({'open': open_, 'high': high, 'low': low, 'close': close, 'volume': volume},
+                          index=pd.Index(dates, name='date'))
+        stock_data[f'sz.30{k:04d}'] = {'name': f'测试{k}', 'df': df}
+    return stock_data
+
+
+def test_optimizer():
+    """测试网格搜索、结果库与帕累托前沿"""
+    print("=" * 80)
+    print("参数优化器测试")
+    print("=" * 80)
+
+    stock_data = create_test_stocks()
+    space = {
+        'strict_mode': [False],
+        'min_quality': [0],
+        'stop_loss': [0.05, 0.10],
+        'take_profit': [0.10, 0.20],
+    }
+    points = list(grid_points(space))
+    print(f"网格参数点: {len(points)}")
+    assert len(points) == 4
+
+    sampled = random_points({'stop_loss': {'min': 0.05, 'max': 0.15}, 'max_stocks': [3, 5]}, 5, seed=1)
+    assert len(sampled) == 5
+    assert all(0.05 <= p['stop_loss'] <= 0.15 for p in sampled)
+
+    context = {'board': 'test'}
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ResultStore(os.path.join(tmp, 'results.db'))
+
+        evaluated = run_search(stock_data, points, store, context, workers=1)
+        print(f"首次评估: {evaluated} 组")
+        assert evaluated == 4
+
+        # 重复运行应全部跳过
+        evaluated = run_search(stock_data, points, store, context, workers=1)
+        print(f"重复运行评估: {evaluated} 组")
+        assert evaluated == 0
+        assert store.has(params_hash(points[0], context))
+
+        rows = store.load_results(context)
+        assert len(rows) == 4
+        for row in rows:
+            print(f"  {row['params']} -> 收益 {row['total_return']:.2f}%, 回撤 {row['max_drawdown']:.2f}%")
+
+        front = pareto_front(rows)
+        print(f"帕累托前沿: {len(front)} 组")
+        # 前沿上的点不能被任何结果支配
+        for f in front:
+            for r in rows:
+                dominated = (r['total_return'] >= f['total_return'] and r['max_drawdown'] >= f['max_drawdown'] and
+                             (r['total_return'] > f['total_return'] or r['max_drawdown'] > f['max_drawdown']))
+                assert not dominated
+        store.close()
+
+    print("\n✓ 参数优化器测试通过")
+
+
+def test_successive_halving():
+    """测试逐级减半：续跑的幸存者结果必须与全量回测一致"""
+    print("=" * 80)
+    print("逐级减半搜索测试")
+    print("=" * 80)
+
+    assert halving_schedule(200, min_days=20, eta=3) == [20, 60, 180, 200]
+
+    stock_data = create_test_stocks()
+    points = list(grid_points({
+        'strict_mode': [False],
+        'min_quality': [0],
+        'stop_loss': [0.05, 0.08, 0.10, 0.12],
+        'take_profit': [0.10, 0.20],
+    }))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        halving_store = ResultStore(os.path.join(tmp, 'halving.db'))
+        saved = run_successive_halving(stock_data, points, halving_store, {}, workers=1, min_days=20, eta=3)
+        print(f"跑完全程的参数点: {saved}")
+        assert 1 <= saved < len(points)
+
+        # 再次运行（含重复参数点）：已评估和重复的点不计入全量评估的成本
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            run_successive_halving(stock_data, points + points[:2], halving_store, {}, workers=1, min_days=20, eta=3)
+        assert f"全量评估需要 {(len(points) - saved) * 200}," in output.getvalue()
+
+        full_store = ResultStore(os.path.join(tmp, 'full.db'))
+        run_search(stock_data, points, full_store, {}, workers=1)
+        full = {row['params_hash']: row for row in full_store.load_results()}
+
+        for row in halving_store.load_results():
+            expected = full[row['params_hash']]
+            print(f"  {row['params']} -> 续跑 {row['total_return']:.4f}%, 全量 {expected['total_return']:.4f}%")
+            assert abs(row['total_return'] - expected['total_return']) < 1e-9
+            assert row['trade_count'] == expected['trade_count']
+        halving_store.close()
+        full_store.close()
+
+    print("\n✓ 逐级减半搜索测试通过")
+
+
+def test_walk_forward():
+    """测试滚动前推：窗口划分与样本外权益拼接"""
+    print("=" * 80)
+    print("滚动前推测试")
+    print("=" * 80)
+
+    assert make_windows(200, is_days=100, oos_days=40) == [(0, 100, 140), (40, 140, 180), (80, 180, 200)]
+    # 样本外区间首尾相接：不重叠也没有空档
+    windows = make_windows(250, is_days=60, oos_days=30)
+    assert all(a[2] == b[1] for a, b in zip(windows, windows[1:])) and windows[-1][2] == 250
+
+    stock_data = create_test_stocks()
+    points = list(grid_points({
+        'strict_mode': [False],
+        'min_quality': [0],
+        'stop_loss': [0.05, 0.10],
+    }))
+    window_results, oos_equity, oos_trades = run_walk_forward(
+        stock_data, points, is_days=100, oos_days=40, initial_capital=100000, workers=1
+    )
+
+    assert len(window_results) == 3
+    for res in window_results:
+        print(f"  窗口{res['window']}: 样本外 {res['oos_start']}~{res['oos_end']}, "
+              f"参数 {res['params']}, 样本外收益 {res['oos_return']:.2f}%")
+    # 样本外区间首尾相接、不重叠
+    dates = [row['date'] for row in oos_equity]
+    assert dates == sorted(set(dates))
+    assert len(dates) == 100
+    print(f"拼接样本外权益: {len(oos_equity)} 天, 期末 {oos_equity[-1]['equity']:,.0f}")
+
+    # 每个样本外窗口最后一天卖出全部持仓（计手续费），下一窗口从平仓后的现金开始
+    last_rows = pd.DataFrame(oos_equity).groupby('window').tail(1)
+    assert (last_rows['position_count'] == 0).all() and (last_rows['equity'] == last_rows['cash']).all()
+    closing = [t for t in oos_trades if t['reason'] == '窗口结束平仓']
+    assert all(t['fee'] > 0 for t in closing)
+    for res, row in zip(window_results, last_rows.itertuples()):
+        assert row.date == res['oos_end']
+    print(f"窗口结束平仓: {len(closing)} 笔")
+
+    print("\n✓ 滚动前推测试通过")
+
+
+if __name__ == "__main__":
+    test_optimizer()
+    test_successive_halving()
+    test_walk_forward()
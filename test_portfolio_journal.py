@@ -0,0 +1,131 @@
+"""
+测试持仓日志
+验证：保存只追加日志不重写快照、重新加载结果一致、压缩后历史不丢、崩溃后的文件可恢复、旧格式自动迁移、
+只读加载不修改文件
+"""
+import json
+import os
+import shutil
+import tempfile
+from portfolio_journal import PortfolioJournal
+from trade_assistant import PortfolioManager
+
+
+def _state(portfolio):
+    return round(portfolio.cash, 6), json.dumps(portfolio.positions, sort_keys=True)
+
+
+def _trade(portfolio, day, code, price):
+    """有持仓就卖出，没有就买入，每笔成交后保存"""
+    date = f"2026-01-{day:02d}"
+    if code in portfolio.positions:
+        portfolio.execute_sell(code, price * 1.05, date, '测试')
+    else:
+        portfolio.execute_buy(code, code, price, date, 70)
+    portfolio.save_portfolio()
+
+
+def test_portfolio_journal():
+    """测试追加保存、重放和压缩"""
+    print("=" * 80)
+    print("持仓日志测试")
+    print("=" * 80)
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'portfolio.json')
+        portfolio = PortfolioManager(portfolio_file=path, total_budget=100000, max_positions=5, snapshot_every=10)
+        _trade(portfolio, 1, 'sz.300001', 20.0)  # 新账户第一次保存时写快照
+        snapshot = open(path, encoding='utf-8').read()
+
+        # 保存只追加日志，快照不变
+        for i in range(2, 8):
+            _trade(portfolio, i, f"sz.30000{i % 3}", 10.0 + i)
+        assert open(path, encoding='utf-8').read() == snapshot
+        assert portfolio.journal.journal_count == 6
+        reloaded = PortfolioManager(portfolio_file=path, total_budget=100000, max_positions=5, snapshot_every=10)
+        assert _state(reloaded) == _state(portfolio)
+        assert reloaded.history == portfolio.history and len(portfolio.history) == 7
+
+        # 达到 snapshot_every 条后写快照并清空日志，历史保留
+        for i in range(8, 12):
+            _trade(portfolio, i, f"sz.30000{i % 3}", 10.0 + i)
+        assert portfolio.journal.journal_count == 0
+        assert 'history' not in json.load(open(path, encoding='utf-8'))
+        reloaded = PortfolioManager(portfolio_file=path, total_budget=100000, max_positions=5, snapshot_every=10)
+        assert _state(reloaded) == _state(portfolio)
+        assert len(reloaded.history) == 11
+        print(f"现金 {portfolio.cash:.2f}, 持仓 {list(portfolio.positions)}, 历史 {len(portfolio.history)} 条")
+
+        # 写了一半的行（写入时崩溃）被忽略；只读加载不截断日志
+        expected = _state(portfolio)
+        with open(portfolio.journal.journal_file, 'a', encoding='utf-8') as f:
+            f.write('{"seq": 99, "type": "buy", "cash": -5')
+        journal_bytes = open(portfolio.journal.journal_file, 'rb').read()
+        cash, positions = PortfolioJournal(path).load(default_cash=0, read_only=True)
+        assert (round(cash, 6), json.dumps(positions, sort_keys=True)) == expected
+        assert open(portfolio.journal.journal_file, 'rb').read() == journal_bytes
+        assert _state(PortfolioManager(portfolio_file=path, total_budget=100000)) == expected
+
+        # 压缩时写完快照后崩溃（日志未清空）：已包含在快照中的记录不重复应用，历史不重复
+        portfolio = PortfolioManager(portfolio_file=path, total_budget=100000, snapshot_every=10)
+        journal_backup = open(portfolio.journal.journal_file, encoding='utf-8').read()
+        _trade(portfolio, 20, 'sz.300009', 30.0)
+        portfolio.journal.compact(portfolio.cash, portfolio.positions, portfolio.total_budget)
+        with open(portfolio.journal.journal_file, 'w', encoding='utf-8') as f:
+            f.write(journal_backup)
+        reloaded = PortfolioManager(portfolio_file=path, total_budget=100000)
+        assert _state(reloaded) == _state(portfolio)
+        assert len(reloaded.history) == len(portfolio.history) == 12
+        reloaded.journal.compact(reloaded.cash, reloaded.positions, reloaded.total_budget)
+        assert len(PortfolioManager(portfolio_file=path, total_budget=100000).history) == 12
+    finally:
+        shutil.rmtree(tmp)
+
+    print("\n✓ 持仓日志测试通过")
+
+
+def test_legacy_migration():
+    """测试旧格式（整个文件包含历史）自动迁移"""
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'portfolio.json')
+        legacy = {
+            'update_time': '2026-01-05 15:00:00', 'total_budget': 100000, 'cash': 80000.0,
+            'positions': {'sz.300750': {'name': '宁德时代', 'buy_date': '2026-01-05', 'buy_price': 200.0,
+                                        'shares': 100, 'cost_basis': 20006.0, 'signal_quality': 75}},
+            'history': [{'date': '2026-01-05', 'action': 'BUY', 'details': '买入 宁德时代(sz.300750)'}],
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(legacy, f, ensure_ascii=False)
+
+        # 只读加载不迁移
+        journal = PortfolioJournal(path)
+        assert journal.load(default_cash=0, read_only=True)[0] == 80000.0
+        assert json.load(open(path, encoding='utf-8')) == legacy and not os.path.exists(journal.history_file)
+        assert journal.history() == legacy['history']
+
+        # 上次迁移写完历史后、写快照前崩溃：再次迁移不重复写入历史
+        with open(journal.history_file, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'seq': 0, 'type': 'legacy', 'history': legacy['history'][0]}, ensure_ascii=False) + '\n')
+        assert journal.history() == legacy['history']
+
+        portfolio = PortfolioManager(portfolio_file=path, total_budget=100000)
+        assert portfolio.cash == 80000.0 and list(portfolio.positions) == ['sz.300750']
+        assert portfolio.history == legacy['history']
+        assert 'history' not in json.load(open(path, encoding='utf-8'))
+
+        portfolio.execute_sell('sz.300750', 210.0, '2026-01-06', '测试')
+        portfolio.save_portfolio()
+        reloaded = PortfolioManager(portfolio_file=path, total_budget=100000)
+        assert reloaded.positions == {} and abs(reloaded.cash - portfolio.cash) < 1e-9
+        assert [h['action'] for h in reloaded.history] == ['BUY', 'SELL']
+    finally:
+        shutil.rmtree(tmp)
+
+    print("✓ 旧格式迁移测试通过")
+
+
+if __name__ == "__main__":
+    test_portfolio_journal()
+    test_legacy_migration()
@@ -0,0 +1,65 @@
+"""
+测试只计算最新K线的信号
+使用模拟数据验证：只用最后 预热 + N 根K线计算，最后 N 根的信号与用全部历史计算相同
+"""
+import warnings
+import numpy as np
+from qqe_trend_strategy import QQETrendStrategy, qqe_trend_strategy, qqe_trend_tail, history_days
+from test_optimizer import create_test_stocks
+
+warnings.simplefilter('ignore', FutureWarning)
+
+
+def test_warmup_bars():
+    """测试预热K线数：精度越高、参数越长需要的K线越多"""
+    print("=" * 80)
+    print("预热K线数测试")
+    print("=" * 80)
+
+    strategy = QQETrendStrategy()
+    standard = strategy.warmup_bars()
+    strict = strategy.warmup_bars(strict_mode=True)
+    print(f"标准模式: {standard} 根, 严格模式: {strict} 根, 需拉取 {history_days(strict + 2)} 个自然日")
+    assert strategy.bollinger_length < standard < strict
+    assert strategy.warmup_bars(strict_mode=True, tolerance=1e-6) > strict
+    assert QQETrendStrategy(bollinger_length=80).warmup_bars() == standard + 30
+    assert QQETrendStrategy().warmup_bars(enhanced_entry=True) > 60
+    assert history_days(240) >= 365
+
+    print("\n✓ 预热K线数测试通过")
+
+
+def test_qqe_trend_tail():
+    """测试尾部计算：各种参数下最后几根的信号与全部历史计算相同"""
+    print("=" * 80)
+    print("尾部信号测试")
+    print("=" * 80)
+
+    stock_data = create_test_stocks(count=6, days=320)
+    signal_columns = ['buy_signal', 'sell_signal', 'long_condition', 'short_condition']
+    for params in [{'strict_mode': True}, {}, {'enhanced_entry': True}, {'strict_mode': True, 'ma_type': 'HMA'}]:
+        columns = signal_columns + (['buy_signal_strict'] if params.get('strict_mode') else [])
+        max_diff = 0.0
+        for item in stock_data.values():
+            df = item['df']
+            full = qqe_trend_strategy(df, **params)
+            for end in range(200, len(df) + 1, 15):
+                tail = qqe_trend_tail(df.iloc[:end], last_n=3, **params)
+                expected = full.iloc[end - 3:end]
+                assert list(tail.index) == list(expected.index)
+                for column in columns:
+                    assert (tail[column].values == expected[column].values).all(), (params, column, end)
+                max_diff = max(max_diff, np.nanmax(np.abs(tail['trend'].values - expected['trend'].values)))
+        print(f"{params}: 信号一致, trend 最大差异 {max_diff:.2e}")
+        assert max_diff < 1e-3
+
+    # 数据不足预热长度时使用全部数据
+    df = next(iter(stock_data.values()))['df'].iloc[:80]
+    assert qqe_trend_tail(df, last_n=5, strict_mode=True).equals(qqe_trend_strategy(df, strict_mode=True).tail(5))
+
+    print("\n✓ 尾部信号测试通过")
+
+
+if __name__ == "__main__":
+    test_warmup_bars()
+    test_qqe_trend_tail()
@@ -171,5 +171,45 @@ def test_stop_loss():
         else:
             print("⚠ 止损未被触发，可能需要调整测试数据")
 
+def test_backtest_signals_exits():
+    """测试按信号数组模拟交易：止盈一半 → 保本止损、卖出信号、平仓当日不买入、期末持仓"""
+    print("=" * 80)
+    print("单股交易模拟测试")
+    print("=" * 80)
+
+    dates = pd.date_range(start='2024-01-01', periods=12, freq='D')
+    #         0     1     2     3     4     5     6     7     8     9     10    11
+    opens = [10.0, 10.0, 10.5, 12.5, 11.0, 10.0, 10.0, 10.0, 10.2, 10.0, 10.0, 10.0]
+    highs = [10.2, 10.6, 12.6, 12.8, 11.2, 10.2, 10.3, 10.4, 10.5, 10.3, 10.3, 10.4]
+    lows = [9.9, 9.9, 10.4, 11.0, 9.95, 9.8, 9.9, 9.9, 10.0, 9.9, 9.9, 9.9]
+    closes = [10.1, 10.4, 12.4, 11.2, 10.1, 10.0, 10.2, 10.3, 10.1, 10.1, 10.2, 10.3]
+    buy = [True, False, False, False, True, True, False, False, True, False, False, True]
+    sell = [False] * 12
+    sell[8] = True
+    result = pd.DataFrame({'open': opens, 'high': highs, 'low': lows, 'close': closes,
+                           'buy_signal': buy, 'sell_signal': sell}, index=dates)
+
+    engine = BacktestEngine(stop_loss=0.10, take_profit=0.20)
+    trades = engine.backtest_signals('sz.300001', '测试', result, strict_mode=False, min_quality=0)
+    for t in trades:
+        print(f"  {t['buy_date'].date()} -> {t['sell_date'].date()} {t['exit_reason']:<16} "
+              f"卖出 {t['sell_price']:.3f} 收益 {t['profit_pct']:.2f}%")
+
+    reasons = [(t['buy_date'], t['sell_date'], t['exit_reason']) for t in trades]
+    assert reasons == [
+        (dates[0], dates[2], 'take_profit_50%'),  # 第2天最高价触及 +20%
+        (dates[0], dates[4], 'stop_loss'),        # 之后跌破保本线
+        (dates[5], dates[8], 'signal'),           # 第4天平仓当日的买入信号被跳过
+        (dates[11], dates[11], 'open'),           # 第8天平仓当日不买入，期末持仓按收盘价计
+    ]
+    buy_cost = 10.0 * (1 + engine.slippage + engine.commission)
+    assert trades[0]['sell_price'] == max(10.5, buy_cost * 1.2)
+    assert trades[1]['sell_price'] == buy_cost * (1 + engine.commission + engine.slippage)
+    assert trades[3]['status'] == 'open' and trades[3]['holding_days'] == 0
+
+    print("\n✓ 单股交易模拟测试通过")
+
+
 if __name__ == "__main__":
     test_stop_loss()
+    test_backtest_signals_exits()
@@ -0,0 +1,331 @@
+"""
+测试实盘助手常驻模式
+使用模拟的K线存储和股票列表验证：预热后每轮只下载新的K线，K线没有变化的股票不重新计算信号；
+扫描按特征优先级进行，时间预算用完时返回已找到的候选；上次接近信号的股票先扫描，离信号远的可跳过
+"""
+import os
+import tempfile
+import time
+import warnings
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import trade_assistant
+from backtest import StockDataLoader
+from trade_assistant import PortfolioManager, TradeAssistant, TradeDaemon
+from scan_planner import ScanPlanner, compute_features
+from qqe_trend_strategy import STRICT_CONDITIONS
+from qqe_trend_strategy import qqe_trend_strategy
+from test_bar_store import FakeBarStore
+from test_optimizer import create_test_stocks
+
+warnings.simplefilter('ignore', FutureWarning)
+
+
+def test_next_run_time():
+    """测试计划时间：当天已过的时间顺延，跳过周末"""
+    daemon = TradeDaemon.__new__(TradeDaemon)
+    daemon.schedule = sorted(TradeDaemon._parse_time(t) for t in ['18:30', '09:45'])
+
+    friday_evening = datetime(2026, 10, 16, 19, 0)
+    assert daemon.next_run_time(friday_evening) == datetime(2026, 10, 19, 9, 45)
+    monday_morning = datetime(2026, 10, 19, 10, 0)
+    assert daemon.next_run_time(monday_morning) == datetime(2026, 10, 19, 18, 30)
+    print("✓ 计划时间测试通过")
+
+
+def test_trade_daemon():
+    """测试常驻模式：股票列表只查一次，K线和信号结果跨轮复用，持仓文件变化时重新加载"""
+    print("=" * 80)
+    print("实盘助手常驻模式测试")
+    print("=" * 80)
+
+    yesterday = pd.Timestamp.now().normalize() - pd.Timedelta(days=1)
+    source = {}
+    for code, item in create_test_stocks(count=4, days=300).items():
+        df = item['df'].copy()
+        df.index = pd.date_range(end=yesterday, periods=len(df), name='date')
+        source[code] = df
+    codes = list(source)
+    list_calls = []
+    tail_calls = []
+
+    def fake_stock_list(board_filter=None, max_stocks=None):
+        list_calls.append(board_filter)
+        return [{'code': code, 'name': code} for code in codes[:max_stocks]]
+
+    original_tail = trade_assistant.qqe_trend_tail
+
+    def counting_tail(df, **kwargs):
+        tail_calls.append(df.index[-1])
+        return original_tail(df, **kwargs)
+
+    original_store, original_list = StockDataLoader.store, StockDataLoader.get_stock_list
+    with tempfile.TemporaryDirectory() as tmp:
+        store = FakeBarStore(os.path.join(tmp, 'bars'), source)
+        store.DAILY_READY_HOUR = 24  # 今天的K线一直视为未确认，每轮都会检查
+        StockDataLoader.store, StockDataLoader.get_stock_list = store, fake_stock_list
+        trade_assistant.qqe_trend_tail = counting_tail
+        try:
+            portfolio_file = os.path.join(tmp, 'portfolio.json')
+            holder = PortfolioManager(portfolio_file=portfolio_file, total_budget=100000, max_positions=3)
+            holder.execute_buy(codes[0], codes[0], float(source[codes[0]]['close'].iloc[-1]), '2026-01-05', 80)
+            holder.save_portfolio()
+
+            assistant = TradeAssistant(budget=100000, max_stocks=3, strict_mode=False)
+            assistant.portfolio = PortfolioManager(portfolio_file=portfolio_file, total_budget=100000, max_positions=3)
+            daemon = TradeDaemon(assistant, board='chinext+star', max_scan=len(codes))
+            assert store.keep_in_memory
+
+            daemon.warm_up()
+            assert len(store.fetch_log) == len(codes)
+
+            # 第一轮：计算全部未持有的股票（持仓批量检查）
+            daemon.run_once()
+            scanned = len(codes) - 1
+            assert len(tail_calls) == scanned
+            assert len(list_calls) == 1
+
+            # 第二轮：没有新K线，全部复用；只检查今天的区间，不读文件
+            store.fetch_log.clear()
+            os.rename(store._path(codes[1]), store._path(codes[1]) + '.bak')
+            daemon.run_once()
+            assert len(tail_calls) == scanned
+            assert all(start == end == pd.Timestamp.now().strftime('%Y-%m-%d') for _, start, end in store.fetch_log)
+            assert len(list_calls) == 1
+            os.rename(store._path(codes[1]) + '.bak', store._path(codes[1]))
+
+            # 一只股票出现今天的K线：只重新计算这一只
+            today = yesterday + pd.Timedelta(days=1)
+            new_bar = source[codes[2]].iloc[[-1]].copy()
+            new_bar.index = pd.DatetimeIndex([today], name='date')
+            source[codes[2]] = pd.concat([source[codes[2]], new_bar])
+            daemon.run_once()
+            assert tail_calls[scanned:] == [today]
+
+            # 其他进程修改持仓文件后重新加载
+            holder.execute_sell(codes[0], float(source[codes[0]]['close'].iloc[-1]), '2026-01-06', '手动')
+            holder.save_portfolio()
+            mtime = os.path.getmtime(portfolio_file) + 1
+            os.utime(portfolio_file, (mtime, mtime))
+            assert assistant.portfolio.reload_if_changed()
+            assert assistant.portfolio.positions == {}
+            assert not assistant.portfolio.reload_if_changed()
+            print(f"QQE 计算次数: {len(tail_calls)}, 股票列表查询: {len(list_calls)} 次")
+        finally:
+            StockDataLoader.store, StockDataLoader.get_stock_list = original_store, original_list
+            trade_assistant.qqe_trend_tail = original_tail
+
+    print("\n✓ 实盘助手常驻模式测试通过")
+
+
+def test_evaluate_holdings():
+    """测试持仓批量检查：卖出信号与逐只计算一致，固定止损、ATR止损、回撤止盈按回测引擎的规则触发，
+    启用持有天数规则时止损按持有天数调整、持有不足5天忽略卖出信号"""
+    print("=" * 80)
+    print("持仓批量检查测试")
+    print("=" * 80)
+
+    stock_data = create_test_stocks(count=4, days=200)
+    bars = {code: item['df'] for code, item in stock_data.items()}
+    codes = list(bars)
+    full = {code: qqe_trend_strategy(df) for code, df in bars.items()}
+
+    def make_assistant(**options):
+        assistant = TradeAssistant(budget=100000, max_stocks=5, strict_mode=False, **options)
+        assistant.portfolio = PortfolioManager(portfolio_file=os.path.join(tempfile.mkdtemp(), 'portfolio.json'),
+                                               total_budget=100000)
+        return assistant
+
+    def hold(assistant, code, avg_cost, buy_row):
+        assistant.portfolio.positions[code] = {
+            'name': code, 'shares': 100, 'cost_basis': avg_cost * 100,
+            'buy_date': bars[code].index[buy_row].strftime('%Y-%m-%d')
+        }
+
+    # 固定止损（默认）：最低价跌破 成本 × (1 - 10%)，不论持有天数
+    assistant = make_assistant()
+    last = {code: df.iloc[-1] for code, df in bars.items()}
+    hold(assistant, codes[0], last[codes[0]]['low'] / 0.89, -30)
+    hold(assistant, codes[1], last[codes[1]]['low'] / 0.91, -30)
+    hold(assistant, codes[2], last[codes[2]]['close'], -10)
+    holdings = assistant.evaluate_holdings({c: bars[c] for c in codes[:3]})
+    print(holdings[['close', 'hold_days', 'stop_price', 'action', 'reason']])
+    assert holdings.loc[codes[0], 'action'] == 'SELL' and '止损' in holdings.loc[codes[0], 'reason']
+    assert holdings.loc[codes[1], 'action'] == '' or holdings.loc[codes[1], 'sell_signal']
+    for code in codes[:3]:
+        assert abs(holdings.loc[code, 'stop_price'] - holdings.loc[code, 'avg_cost'] * 0.9) < 1e-9
+        assert holdings.loc[code, 'sell_signal'] == full[code]['sell_signal'].iloc[-1]
+
+    # 持有天数规则：持有15天以上收紧到 成本 × (1 - 8%)，5-15天为 10%
+    assistant = make_assistant(use_hold_rules=True)
+    hold(assistant, codes[0], last[codes[0]]['low'] / 0.91, -30)
+    hold(assistant, codes[1], last[codes[1]]['low'] / 0.93, -30)
+    hold(assistant, codes[2], last[codes[2]]['close'], -10)
+    holdings = assistant.evaluate_holdings({c: bars[c] for c in codes[:3]})
+    assert holdings.loc[codes[0], 'hold_days'] >= 15 and 5 <= holdings.loc[codes[2], 'hold_days'] < 15
+    assert abs(holdings.loc[codes[0], 'stop_price'] - last[codes[0]]['low'] / 0.91 * 0.92) < 1e-9
+    assert abs(holdings.loc[codes[2], 'stop_price'] - last[codes[2]]['close'] * 0.9) < 1e-9
+    assert holdings.loc[codes[0], 'action'] == 'SELL' and '止损' in holdings.loc[codes[0], 'reason']
+    assert holdings.loc[codes[1], 'action'] == '' or holdings.loc[codes[1], 'sell_signal']
+
+    # 持有不足5天：默认卖出信号当天生效；启用持有天数规则时止损放宽到12%，忽略卖出信号
+    code = next(c for c in codes if full[c]['sell_signal'].iloc[60:].any())
+    signal_row = int(np.flatnonzero(full[code]['sell_signal'].to_numpy()[60:])[0]) + 60
+    df = bars[code].iloc[:signal_row + 1]
+    bars[code], original = df, bars[code]
+    assistant = make_assistant()
+    hold(assistant, code, df['close'].iloc[-1], -2)
+    holdings = assistant.evaluate_holdings({code: df})
+    assert holdings.loc[code, 'hold_days'] < 5
+    assert holdings.loc[code, 'action'] == 'SELL' and holdings.loc[code, 'reason'] == '策略卖出信号'
+    assistant = make_assistant(use_hold_rules=True)
+    hold(assistant, code, df['low'].iloc[-1] / 0.89, -2)
+    holdings = assistant.evaluate_holdings({code: df})
+    print(holdings[['close', 'hold_days', 'stop_price', 'sell_signal', 'action']])
+    assert holdings.loc[code, 'hold_days'] < 5 and holdings.loc[code, 'sell_signal']
+    assert abs(holdings.loc[code, 'stop_price'] - df['low'].iloc[-1] / 0.89 * 0.88) < 1e-9
+    assert holdings.loc[code, 'action'] == ''
+    # 同样的K线持有满5天：卖出信号生效
+    hold(assistant, code, df['close'].iloc[-1], -6)
+    holdings = assistant.evaluate_holdings({code: df})
+    assert holdings.loc[code, 'hold_days'] >= 5
+    assert holdings.loc[code, 'action'] == 'SELL' and holdings.loc[code, 'reason'] == '策略卖出信号'
+    bars[code] = original
+
+    # ATR止损：止损价 = 成本 - 倍数 × 买入前一天的ATR
+    assistant = make_assistant(use_atr_stop=True, atr_multiplier=1.0)
+    entry_atr = full[codes[0]]['atr'].iloc[-31]
+    avg_cost = last[codes[0]]['low'] + 1.5 * entry_atr
+    assert avg_cost * 0.9 < last[codes[0]]['low']  # 固定比例止损不会触发
+    hold(assistant, codes[0], avg_cost, -30)
+    holdings = assistant.evaluate_holdings({codes[0]: bars[codes[0]]})
+    assert abs(holdings.loc[codes[0], 'stop_price'] - (avg_cost - entry_atr)) < 1e-9
+    assert holdings.loc[codes[0], 'action'] == 'SELL' and 'ATR止损' in holdings.loc[codes[0], 'reason']
+
+    # 回撤止盈：盈利 ≥ 5% 且从持仓期最高价回撤 ≥ 8%
+    assistant = make_assistant(use_drawdown_exit=True, stop_loss=0.5)
+    found = False
+    for code in codes:
+        df = bars[code]
+        for buy_row in range(-60, -2):
+            peak = df['high'].iloc[buy_row:].max()
+            close = df['close'].iloc[-1]
+            if (peak - close) / peak >= 0.08:
+                hold(assistant, code, close / 1.06, buy_row)
+                holdings = assistant.evaluate_holdings({code: df})
+                assert holdings.loc[code, 'peak_price'] == peak
+                assert holdings.loc[code, 'action'] == 'SELL' and '回撤止盈' in holdings.loc[code, 'reason']
+                assert holdings.loc[code, 'sell_price'] == close
+                found = True
+                break
+        if found:
+            break
+    assert found
+
+    print("\n✓ 持仓批量检查测试通过")
+
+
+def test_scan_planner():
+    """测试扫描计划：按特征排序，预算用完即停止，特征跨次保存"""
+    print("=" * 80)
+    print("扫描计划测试")
+    print("=" * 80)
+
+    stock_data = create_test_stocks(count=12, days=200)
+    bars = {code: item['df'] for code, item in stock_data.items()}
+    codes = list(bars)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'scan_features.csv')
+        planner = ScanPlanner(path)
+        # 没有特征时保持原顺序
+        assert planner.plan(codes) == codes
+        assert planner.plan(codes, max_count=5) == codes[:5]
+
+        evaluated = []
+
+        def evaluate(code):
+            evaluated.append(code)
+            return ({'code': code} if code in codes[::3] else None), bars[code], None
+
+        candidates, stats = planner.scan(codes, evaluate)
+        assert evaluated == codes and stats['scanned'] == len(codes) and not stats['budget_exhausted']
+        assert [c['code'] for c in candidates] == codes[::3]
+
+        # 特征保存后重新加载，排序与特征一致：接近信号、流动性高的排在前面
+        reloaded = ScanPlanner(path)
+        assert set(reloaded.features.index) == set(codes)
+        for code in codes:
+            expected = compute_features(bars[code])
+            assert reloaded.features.loc[code, 'near_count'] == expected['near_count']
+            assert abs(reloaded.features.loc[code, 'liquidity'] - expected['liquidity']) < 1e-6 * expected['liquidity']
+        order = reloaded.plan(codes)
+        scores = reloaded.scores(order)
+        assert list(scores) == sorted(scores, reverse=True)
+        print(f"扫描顺序: {order[:5]} ...")
+
+        # 新股票（没有特征）排在中间，不会永远不被扫描
+        new_code = 'sz.399999'
+        assert 0 < reloaded.plan(codes + [new_code]).index(new_code) < len(codes)
+
+        # 时间预算用完时返回已找到的候选
+        evaluated.clear()
+
+        def slow_evaluate(code):
+            time.sleep(0.05)
+            return evaluate(code)
+
+        candidates, stats = reloaded.scan(codes, slow_evaluate, budget_seconds=0.12)
+        assert stats['budget_exhausted'] and 0 < stats['scanned'] < len(codes)
+        assert evaluated == order[:stats['scanned']]
+        assert [c['code'] for c in candidates] == [c for c in evaluated if c in codes[::3]]
+        print(f"预算内扫描: {stats['scanned']}/{stats['planned']}")
+
+    print("\n✓ 扫描计划测试通过")
+
+
+def test_near_signal_state():
+    """测试接近信号状态：位掩码与严格信号一致，接近信号的先扫描，离信号远的在重新检查期内跳过"""
+    print("=" * 80)
+    print("接近信号状态测试")
+    print("=" * 80)
+
+    stock_data = create_test_stocks(count=20, days=250)
+    results = {code: qqe_trend_strategy(item['df'], strict_mode=True) for code, item in stock_data.items()}
+    all_conditions = (1 << len(STRICT_CONDITIONS)) - 1
+    for result in results.values():
+        full = result['strict_conditions'] == all_conditions
+        assert (result['buy_signal_strict'] == (full & ~full.shift(1, fill_value=False))).all()
+
+    # 上次扫描的状态取自倒数第二根K线
+    previous = {code: result.iloc[:-1] for code, result in results.items()}
+    codes = list(stock_data)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'scan_features.csv')
+        planner = ScanPlanner(path)
+        planner.scan(codes, lambda code: (None, stock_data[code]['df'].iloc[:-1], previous[code]))
+
+        planner = ScanPlanner(path, near_conditions=7, min_conditions=5)
+        n_conditions = {code: bin(int(previous[code]['strict_conditions'].iloc[-1])).count('1') for code in codes}
+        assert all(planner.features.loc[code, 'n_conditions'] == n for code, n in n_conditions.items())
+        order = planner.plan(codes)
+        near = [code for code in codes if n_conditions[code] >= 7]
+        assert sorted(order[:len(near)]) == sorted(near)
+        assert set(planner.skipped) == {code for code in codes if n_conditions[code] < 5}
+        assert set(order) | set(planner.skipped) == set(codes)
+        print(f"接近信号 {len(near)} 只先扫描, 跳过 {len(planner.skipped)} 只, 扫描 {len(order)} 只")
+
+        # 状态过期后重新扫描
+        later = pd.Timestamp.now().normalize() + pd.Timedelta(days=planner.recheck_days)
+        assert planner.plan(codes, today=later) and not planner.skipped
+
+    print("\n✓ 接近信号状态测试通过")
+
+
+if __name__ == "__main__":
+    test_next_run_time()
+    test_trade_daemon()
+    test_evaluate_holdings()
+    test_scan_planner()
+    test_near_signal_state()
@@ -0,0 +1,97 @@
+"""
+测试交易数据库
+使用模拟数据验证：回测结果批量写入后与引擎结果一致、按参数对比、导入已有CSV、实盘成交去重
+"""
+import contextlib
+import glob
+import io
+import os
+import tempfile
+from backtest import StockDataLoader, run_backtest
+from trade_assistant import PortfolioManager
+from trade_db import TradeDB
+from test_optimizer import create_test_stocks
+
+
+def test_backtest_runs():
+    """测试回测写入数据库：交易记录、权益曲线、指标与引擎一致，按参数汇总"""
+    print("=" * 80)
+    print("交易数据库测试")
+    print("=" * 80)
+
+    stock_data = create_test_stocks(count=5, days=200)
+    stock_list = [{'code': code, 'name': item['name']} for code, item in stock_data.items()]
+
+    original = (StockDataLoader.get_stock_list, StockDataLoader.get_stock_data)
+    StockDataLoader.get_stock_list = staticmethod(lambda board_filter=None, max_stocks=None: stock_list)
+    StockDataLoader.get_stock_data = staticmethod(lambda code, days=250: stock_data[code]['df'])
+    cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            results = {}
+            with contextlib.redirect_stdout(io.StringIO()):
+                for stop_loss in (0.05, 0.10):
+                    results[stop_loss] = run_backtest(quality_thresholds=[0], strict_mode=False, checkpoint_every=0,
+                                                      stop_loss=stop_loss, db_path='ledger.db')
+
+            db = TradeDB('ledger.db')
+            runs = db.runs(kind='backtest')
+            print(runs[['run_id', 'threshold', 'total_return', 'max_drawdown', 'trade_count']])
+            assert len(runs) == 2
+            for stop_loss, res in results.items():
+                run = db.runs(kind='backtest', stop_loss=stop_loss).iloc[0]
+                assert abs(run['total_return'] - res[0]['return']) < 1e-9
+                assert run['trade_count'] == res[0]['trades']
+                assert db.params(int(run['run_id']))['stop_loss'] == stop_loss
+                equity = db.equity(int(run['run_id']))
+                assert len(equity) > 0 and equity['date'].iloc[0] == run['start_date']
+
+            compare = db.compare('stop_loss')
+            print(compare)
+            assert sorted(compare['value']) == ['0.05', '0.1'] and (compare['runs'] == 1).all()
+            stats = db.trade_stats(by='reason')
+            assert stats['trades'].sum() == db.query("SELECT COUNT(*) AS n FROM trades WHERE action = 'SELL'")['n'][0]
+
+            # 导入 backtest.py 保存的CSV，收益率与写入的回测之一一致（同一秒内的文件名相同会被覆盖）
+            equity_file = sorted(glob.glob('equity_q0_*.csv'))[-1]
+            trades_file = equity_file.replace('equity_', 'trades_')
+            run_id = db.import_csv(equity_file, trades_file if os.path.exists(trades_file) else None,
+                                   initial_capital=100000)
+            imported = db.runs(limit=1).iloc[0]
+            assert imported['run_id'] == run_id and imported['threshold'] == 0
+            assert (abs(runs['total_return'] - imported['total_return']) < 1e-6).any()
+            db.close()
+    finally:
+        os.chdir(cwd)
+        StockDataLoader.get_stock_list, StockDataLoader.get_stock_data = original
+
+    print("\n✓ 交易数据库测试通过")
+
+
+def test_live_fills():
+    """测试实盘成交：保存持仓时写入，重复导入持仓日志不会重复"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'ledger.db')
+        portfolio = PortfolioManager(portfolio_file=os.path.join(tmp, 'portfolio.json'), total_budget=100000,
+                                     ledger_db=db_path)
+        portfolio.execute_buy('sz.300750', '宁德时代', 100.0, '2026-01-05', 75)
+        portfolio.save_portfolio()
+        portfolio.execute_sell('sz.300750', 105.0, '2026-01-08', '测试')
+        portfolio.save_portfolio()
+
+        db = TradeDB(db_path)
+        fills = db.fills('sz.300750')
+        print(fills[['date', 'action', 'price', 'shares', 'cash']])
+        assert list(fills['action']) == ['BUY', 'SELL'] and list(fills['price']) == [100.0, 105.0]
+        assert fills['shares'].iloc[0] == fills['shares'].iloc[1] > 0
+        assert abs(100000 + fills['cash'].sum() - portfolio.cash) < 1e-6
+        assert db.import_portfolio(portfolio.portfolio_file) == 0
+        db.close()
+
+    print("✓ 实盘成交测试通过")
+
+
+if __name__ == "__main__":
+    test_backtest_runs()
+    test_live_fills()
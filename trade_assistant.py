@@ -5,50 +5,89 @@ import os
 import json
 import argparse
 import requests
-from datetime import datetime, timedelta
-from qqe_trend_strategy import qqe_trend_strategy
+import time
+from datetime import datetime, timedelta, time as dt_time
+from qqe_trend_strategy import QQETrendStrategy, qqe_trend_tail, history_days, build_bar_panel, qqe_trend_panel
 from backtest import StockDataLoader
+from scan_planner import ScanPlanner
+from portfolio_journal import PortfolioJournal
+from trade_db import TradeDB
+
+# 常驻模式默认运行时间（日线收盘后发布，见 BarStore.DAILY_READY_HOUR）
+DEFAULT_SCHEDULE = ['18:30']
 
 class PortfolioManager:
-    """实盘持仓管理器"""
-    def __init__(self, portfolio_file='portfolio.json', total_budget=100000, max_positions=5):
+    """实盘持仓管理器（快照 + 追加日志，见 portfolio_journal.py）"""
+    def __init__(self, portfolio_file='portfolio.json', total_budget=100000, max_positions=5, snapshot_every=100,
+                 ledger_db=None):
         self.portfolio_file = portfolio_file
         self.total_budget = total_budget
         self.max_positions = max_positions
         self.positions = {}
         self.cash = total_budget
-        self.history = []
+        self.journal = PortfolioJournal(portfolio_file, snapshot_every=snapshot_every)
+        self._pending = []  # 尚未写入日志的记录
+        self.ledger_db = ledger_db  # 🆕 成交同时写入交易数据库（见 trade_db.py）
+        self._mtime = None
         self.load_portfolio()
 
+    @property
+    def history(self):
+        """交易历史（只在需要时从历史文件和日志读取）"""
+        return self.journal.history() + [r['history'] for r in self._pending if 'history' in r]
+
     def load_portfolio(self):
-        """加载持仓信息"""
-        if os.path.exists(self.portfolio_file):
+        """加载持仓信息（读取最近的快照，重放其后的日志）"""
+        if self.journal.exists():
             try:
-                with open(self.portfolio_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.positions = data.get('positions', {})
-                    self.cash = data.get('cash', self.total_budget)
-                    self.history = data.get('history', [])
-                    # 重新计算可用资金（可选：根据配置重置预算）
-                    # self.cash = self.total_budget - self.get_market_value(...)
+                self.cash, self.positions = self.journal.load(self.total_budget)
+                self._pending = []
+                self._mtime = self.journal.file_state()
+                # 重新计算可用资金（可选：根据配置重置预算）
+                # self.cash = self.total_budget - self.get_market_value(...)
             except Exception as e:
                 print(f"加载持仓文件失败: {e}，将初始化为空仓。")
         else:
             print("未找到持仓文件，初始化新账户。")
 
+    def record(self, type, code=None, cash=0.0, history=None, **fields):
+        """
+        记录一次变动（成交、资金变动、持仓变动）并更新内存中的状态，save_portfolio 时写入日志
+        
+        Args:
+            type: 记录类型，如 'buy' / 'sell' / 'cash'
+            cash: 现金变动
+            history: 交易历史条目（可选）
+            position: 新的持仓，None 表示清仓；不传表示持仓不变
+        """
+        record = self.journal.new_record(type, code=code, cash=cash, history=history, **fields)
+        self.cash = self.journal.apply(record, self.cash, self.positions)
+        self._pending.append(record)
+        return record
+
     def save_portfolio(self):
-        """保存持仓信息"""
-        data = {
-            'update_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'total_budget': self.total_budget,
-            'cash': self.cash,
-            'positions': self.positions,
-            'history': self.history
-        }
-        with open(self.portfolio_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
+        """保存持仓信息（只追加新的记录；日志达到 snapshot_every 条时写快照并压缩）"""
+        if self.journal.append(self._pending) or not os.path.exists(self.portfolio_file):
+            self.journal.compact(self.cash, self.positions, self.total_budget)
+        if self.ledger_db and self._pending:
+            db = TradeDB(self.ledger_db)
+            try:
+                db.record_fills(os.path.abspath(self.portfolio_file), self._pending)
+            finally:
+                db.close()
+        self._pending = []
+        self._mtime = self.journal.file_state()
         print(f"持仓状态已保存至 {self.portfolio_file}")
 
+    def reload_if_changed(self):
+        """持仓文件被其他进程修改过时重新加载，返回是否重新加载"""
+        if not self.journal.exists():
+            return False
+        if self.journal.file_state() == self._mtime:
+            return False
+        self.load_portfolio()
+        return True
+
     def execute_buy(self, code, name, price, date, signal_quality):
         """执行买入逻辑（更新账本）"""
         # 1. 计算目标仓位金额
@@ -73,18 +112,15 @@ class PortfolioManager:
             return None, f"资金不足 (需 {total_cost:.2f}, 剩 {self.cash:.2f})"
             
         # 4. 更新状态
-        self.cash -= total_cost
-        self.positions[code] = {
+        record = f"买入 {name}({code}): {buy_shares}股 @ {price:.2f}, 花费 {total_cost:.2f}"
+        self.record('buy', code, cash=-total_cost, date=date, price=price, shares=buy_shares, position={
             'name': name,
             'buy_date': date,
             'buy_price': price,
             'shares': buy_shares,
             'cost_basis': total_cost, # 包含费用的总成本
             'signal_quality': signal_quality
-        }
-        
-        record = f"买入 {name}({code}): {buy_shares}股 @ {price:.2f}, 花费 {total_cost:.2f}"
-        self.history.append({'date': date, 'action': 'BUY', 'details': record})
+        }, history={'date': date, 'action': 'BUY', 'details': record})
         return buy_shares, record
 
     def execute_sell(self, code, price, date, reason):
@@ -107,21 +143,39 @@ class PortfolioManager:
         profit_pct = (profit / pos['cost_basis']) * 100
         
         # 更新状态
-        self.cash += net_income
-        del self.positions[code]
-        
         record = f"卖出 {pos['name']}({code}): {shares}股 @ {price:.2f}, 净得 {net_income:.2f}, 收益 {profit_pct:.2f}% ({reason})"
-        self.history.append({'date': date, 'action': 'SELL', 'details': record})
+        self.record('sell', code, cash=net_income, date=date, price=price, shares=shares, position=None,
+                    history={'date': date, 'action': 'SELL', 'details': record})
         return net_income, record
 
 class TradeAssistant:
     def __init__(self, budget, max_stocks, stop_loss=0.10, strict_mode=True, 
                  telegram_token=None, telegram_chat_id=None, feishu_webhook=None,
-                 feishu_app_id=None, feishu_app_secret=None, feishu_target_id=None, feishu_target_type='email'):
-        self.portfolio = PortfolioManager(total_budget=budget, max_positions=max_stocks)
+                 feishu_app_id=None, feishu_app_secret=None, feishu_target_id=None, feishu_target_type='email',
+                 use_atr_stop=False, atr_multiplier=2.0,
+                 use_drawdown_exit=False, drawdown_threshold=0.08, min_profit_for_drawdown=0.05,
+                 use_hold_rules=False, scan_budget=None, skip_far=0, ledger_db=None):
+        self.portfolio = PortfolioManager(total_budget=budget, max_positions=max_stocks, ledger_db=ledger_db)
         self.stop_loss = stop_loss
+        # 🆕 与回测引擎相同的退出选项
+        self.use_atr_stop = use_atr_stop  # ATR动态止损（替代固定止损比例）
+        self.atr_multiplier = atr_multiplier
+        self.use_drawdown_exit = use_drawdown_exit  # 回撤止盈（基于持仓期最高价）
+        self.drawdown_threshold = drawdown_threshold
+        self.min_profit_for_drawdown = min_profit_for_drawdown
+        self.use_hold_rules = use_hold_rules  # 按持有天数调整止损、持有不足5天忽略卖出信号（同回测引擎）
         self.strict_mode = strict_mode
         self.max_stocks = max_stocks
+        # 🆕 只检查最新一根K线，按指标预热需要的K线数拉取历史数据
+        self.history_days = history_days(QQETrendStrategy().warmup_bars(strict_mode) + 1)
+        # 🆕 常驻模式下跨轮保留：{(board, max_scan): (日期, 股票列表)}、{code: (最新K线, 策略结果)}
+        self._stock_lists = {}
+        self._signal_cache = {}
+        # 🆕 按特征优先级扫描，scan_budget 秒用完即停止（None 表示不限时）
+        self.scan_budget = scan_budget
+        # 🆕 严格模式下，上次扫描满足的条件少于 skip_far 个的股票本次跳过（0 表示不跳过）
+        self.skip_far = skip_far
+        self.planner = None
         self.telegram_token = telegram_token
         self.telegram_chat_id = telegram_chat_id
         self.feishu_webhook = feishu_webhook
@@ -292,6 +346,124 @@ class TradeAssistant:
         if self.feishu_app_id and self.feishu_app_secret and self.feishu_target_id:
             self.send_feishu_app_message("\n".join(msg_lines))
         
+    def get_stock_list(self, board, max_scan):
+        """股票列表（同一天内只查询一次）"""
+        today = datetime.now().strftime('%Y-%m-%d')
+        cached = self._stock_lists.get((board, max_scan))
+        if cached is not None and cached[0] == today:
+            return cached[1]
+        stock_list = StockDataLoader.get_stock_list(board_filter=board, max_stocks=max_scan)
+        self._stock_lists[(board, max_scan)] = (today, stock_list)
+        return stock_list
+
+    def get_planner(self):
+        """扫描计划（特征文件与K线存储放在同一目录）"""
+        if self.planner is None:
+            self.planner = ScanPlanner(os.path.join(StockDataLoader.store.cache_dir, 'scan_features.csv'),
+                                       min_conditions=self.skip_far if self.strict_mode else 0)
+        return self.planner
+
+    def scan_plan(self, board, max_scan):
+        """按优先级排好的待扫描股票（不含持仓），最多 max_scan 只"""
+        stock_list = self.get_stock_list(board, None)
+        codes = [s['code'] for s in stock_list if s['code'] not in self.portfolio.positions]
+        return self.get_planner().plan(codes, max_scan)
+
+    def _latest_result(self, code, min_bars, df=None):
+        """
+        最新一根K线的策略结果
+        
+        K线没有变化时直接返回上次的结果；数据不足 min_bars 根时返回 None。
+        """
+        if df is None:
+            df = StockDataLoader.get_stock_data(code, days=self.history_days)
+        if df is None or len(df) < min_bars:
+            return None
+        
+        key = (df.index[-1], df['close'].iloc[-1])
+        cached = self._signal_cache.get(code)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        
+        result = qqe_trend_tail(df, last_n=1, strict_mode=self.strict_mode)
+        self._signal_cache[code] = (key, result)
+        return result
+
+    def evaluate_holdings(self, stock_bars):
+        """
+        一次计算全部持仓的卖出条件（所有持仓拼成面板，向量化计算止损价）
+        
+        退出规则与回测引擎的选项一致，优先级：回撤止盈 > 止损（固定比例或ATR）> 策略卖出信号。
+        启用 use_hold_rules 时同回测引擎：固定比例止损按持有天数调整（不足5天放宽20%、最多12%，
+        15天及以上收紧20%），持有不足5天忽略策略卖出信号；默认为固定止损，卖出信号当天生效。
+        
+        Args:
+            stock_bars: {code: K线DataFrame}，只包含数据足够的持仓
+            
+        Returns:
+            DataFrame(index=code)，列: close, low, avg_cost, hold_days, stop_price, peak_price, sell_signal,
+                action, reason, sell_price
+        """
+        codes = list(stock_bars)
+        panel, dates = build_bar_panel(stock_bars)
+        frames = qqe_trend_panel(panel, strict_mode=self.strict_mode)
+        
+        positions = [self.portfolio.positions[code] for code in codes]
+        avg_cost = np.array([pos['cost_basis'] / pos['shares'] for pos in positions])
+        open_, high, low, close = (panel[f].iloc[-1].to_numpy() for f in ('open', 'high', 'low', 'close'))
+        sell_signal = frames['sell_signal'].iloc[-1].to_numpy(dtype=bool)
+        
+        # 买入日及之后的K线：持仓期最高价、入场ATR（买入前一天，同回测引擎）
+        buy_dates = np.array([pd.Timestamp(pos['buy_date']) for pos in positions], dtype='datetime64[ns]')
+        held = dates.to_numpy() >= buy_dates
+        hold_days = (dates.iloc[-1].to_numpy() - buy_dates) // np.timedelta64(1, 'D')  # 自然日，同回测引擎
+        high_values = panel['high'].to_numpy()
+        peak_price = np.fmax(np.nanmax(np.where(held, high_values, -np.inf), axis=0), avg_cost)
+        atr = frames['atr'].to_numpy()
+        entry_row = np.where(held.any(axis=0), held.argmax(axis=0) - 1, len(atr) - 1)
+        entry_atr = np.array([pos.get('entry_atr') or 0 for pos in positions], dtype=float)
+        from_bars = atr[np.maximum(entry_row, 0), np.arange(len(codes))]
+        entry_atr = np.where(entry_atr > 0, entry_atr, np.where(entry_row >= 0, from_bars, atr[-1]))
+        
+        # 止损价：ATR动态止损（入场价 - 倍数 × ATR）或固定比例（启用持有天数规则时渐进式调整）
+        stop_loss_pct = np.full(len(codes), self.stop_loss)
+        if self.use_hold_rules:
+            stop_loss_pct = np.where(hold_days < 5, min(self.stop_loss * 1.2, 0.12),
+                                     np.where(hold_days < 15, self.stop_loss, self.stop_loss * 0.8))
+        stop_price = avg_cost * (1 - stop_loss_pct)
+        if self.use_atr_stop:
+            stop_price = np.where(entry_atr > 0, avg_cost - self.atr_multiplier * entry_atr, stop_price)
+        stop_hit = low <= stop_price
+        
+        # 回撤止盈：盈利达到门槛后，从持仓期最高价回撤超过阈值
+        profit = (close - avg_cost) / avg_cost
+        drawdown = (peak_price - close) / peak_price
+        drawdown_hit = self.use_drawdown_exit & (profit >= self.min_profit_for_drawdown) & \
+            (drawdown >= self.drawdown_threshold)
+        
+        # 最小持仓天数过滤：持仓不足5天忽略卖出信号
+        signal_hit = sell_signal & (hold_days >= 5) if self.use_hold_rules else sell_signal
+        
+        action = np.where(drawdown_hit | stop_hit | signal_hit, 'SELL', '')
+        sell_price = np.where(drawdown_hit, close, np.where(stop_hit, np.where(open_ < stop_price, open_, stop_price), close))
+        reasons = []
+        for j in range(len(codes)):
+            if drawdown_hit[j]:
+                reasons.append(f"回撤止盈(峰值+{(peak_price[j] / avg_cost[j] - 1) * 100:.1f}%,回撤{drawdown[j] * 100:.1f}%)")
+            elif stop_hit[j]:
+                kind = "ATR止损" if self.use_atr_stop and entry_atr[j] > 0 else "触发止损"
+                reasons.append(f"{kind} (最低价 {low[j]:.2f} <= 止损线 {stop_price[j]:.2f})")
+            elif signal_hit[j]:
+                reasons.append("策略卖出信号")
+            else:
+                reasons.append("")
+        
+        return pd.DataFrame({
+            'close': close, 'low': low, 'avg_cost': avg_cost, 'hold_days': hold_days, 'stop_price': stop_price,
+            'peak_price': peak_price, 'sell_signal': sell_signal,
+            'action': action, 'reason': reasons, 'sell_price': sell_price
+        }, index=pd.Index(codes, name='code'))
+
     def _check_sell_signals(self, today):
         """检查持仓股票的卖出信号"""
         print("\n[1/2] 检查持仓卖出信号/止损...")
@@ -300,92 +472,62 @@ class TradeAssistant:
             print("  当前无持仓。")
             return []
 
-        actions = []
+        # 🆕 一次批量获取全部持仓的K线（一次登录），至少覆盖最早的买入日
+        positions = self.portfolio.positions
+        earliest = min(pd.Timestamp(pos['buy_date']) for pos in positions.values())
+        days = max(self.history_days, (pd.Timestamp(today) - earliest).days + 10)
+        fetched = StockDataLoader.store.prefetch(list(positions), days=days)
         
-        for code, pos in list(self.portfolio.positions.items()):
-            # 获取该股票最新数据
-            # 注意：实盘时需要足够的数据计算指标，所以要拉取历史数据
-            df = StockDataLoader.get_stock_data(code, days=100) # 只要最近100天够计算了
-            
+        stock_bars = {}
+        for code, pos in positions.items():
+            df = fetched.get(code)
             if df is None or len(df) < 50:
                 print(f"  警告: 无法获取 {pos['name']} 的足够数据，跳过检查。")
                 continue
-                
-            # 运行策略
-            result = qqe_trend_strategy(df, strict_mode=self.strict_mode)
-            
-            if result.empty:
-                continue
-                
-            last_row = result.iloc[-1]
-            last_date = result.index[-1].strftime('%Y-%m-%d')
-            current_price = last_row['close']
-            
-            # 计算当前收益（基于最新收盘价）
-            # 注意：pos['cost_basis'] 是总成本，pos['shares'] 是股数
-            avg_cost = pos['cost_basis'] / pos['shares']
-            unrealized_pnl_pct = (current_price - avg_cost) / avg_cost * 100
-            
-            # 检查止损
-            # 止损价逻辑：基于成本价下跌 stop_loss
-            stop_price = avg_cost * (1 - self.stop_loss)
-            
-            print(f"  {pos['name']}: 现价 {current_price:.2f} (成本 {avg_cost:.2f}), 浮动 {unrealized_pnl_pct:.2f}%")
-            
-            action = None
-            reason = None
-            
-            # 1. 检查止损 (检查最低价是否触及)
-            if last_row['low'] <= stop_price:
-                action = 'SELL'
-                reason = f"触发止损 (最低价 {last_row['low']:.2f} <= 止损线 {stop_price:.2f})"
-                # 预估卖出价
-                sell_price = min(last_row['open'], stop_price) if last_row['open'] < stop_price else stop_price
-            
-            # 2. 检查策略卖出信号
-            elif last_row['sell_signal']:
-                action = 'SELL'
-                reason = "策略卖出信号"
-                sell_price = current_price
+            stock_bars[code] = df
+        if not stock_bars:
+            return []
+        
+        holdings = self.evaluate_holdings(stock_bars)
+        
+        actions = []
+        for code, row in holdings.iterrows():
+            pos = positions[code]
+            unrealized_pnl_pct = (row['close'] - row['avg_cost']) / row['avg_cost'] * 100
+            print(f"  {pos['name']}: 现价 {row['close']:.2f} (成本 {row['avg_cost']:.2f}), 浮动 {unrealized_pnl_pct:.2f}%")
             
-            if action == 'SELL':
-                print(f"  >>> 建议卖出 {pos['name']}! 原因: {reason}")
-                print(f"      建议挂单价格: {sell_price:.2f}")
-                actions.append((code, sell_price, reason))
+            if row['action'] == 'SELL':
+                print(f"  >>> 建议卖出 {pos['name']}! 原因: {row['reason']}")
+                print(f"      建议挂单价格: {row['sell_price']:.2f}")
+                actions.append((code, row['sell_price'], row['reason']))
             else:
-                print(f"      继续持有 (止损线: {stop_price:.2f})")
+                print(f"      继续持有 (止损线: {row['stop_price']:.2f})")
                 
         return actions
 
     def _scan_buy_opportunities(self, board, today, max_scan=100):
-        """扫描市场寻找买入机会"""
-        print(f"\n[2/2] 扫描潜在买入机会 (限制 {max_scan} 只)...")
+        """
+        扫描市场寻找买入机会
         
-        # 获取股票列表
-        stock_list = StockDataLoader.get_stock_list(board_filter=board, max_stocks=max_scan)
-        # 这里为了演示速度限制了数量，实盘可以去掉限制或调大
-        # 注意：全市场扫描非常慢，建议实盘时只扫描自选股池
+        整个板块按优先级排序（流动性、波动率、距20日高点、上次扫描时接近信号的程度），
+        从高到低扫描前 max_scan 只；设置了 scan_budget 时，时间用完即返回已找到的候选。
+        """
+        budget_text = f", 时间预算 {self.scan_budget:.0f}秒" if self.scan_budget else ""
+        print(f"\n[2/2] 扫描潜在买入机会 (限制 {max_scan} 只{budget_text})...")
         
-        candidates = []
+        # 获取股票列表
+        stock_list = self.get_stock_list(board, None)
+        names = {s['code']: s['name'] for s in stock_list}
+        codes = [code for code in names if code not in self.portfolio.positions]
+        signal_col = 'buy_signal_strict' if self.strict_mode else 'buy_signal'
         
-        for i, stock in enumerate(stock_list):
-            code = stock['code']
-            if code in self.portfolio.positions:
-                continue
-                
-            print(f"\r进度: {i+1}/{len(stock_list)}", end='', flush=True)
-            
+        def evaluate(code):
             try:
-                # 获取数据
-                df = StockDataLoader.get_stock_data(code, days=100)
-                if df is None or len(df) < 60:
-                    continue
-                    
-                # 运行策略
-                result = qqe_trend_strategy(df, strict_mode=self.strict_mode)
-                
-                if result.empty:
-                    continue
+                # 获取数据并运行策略（只计算最新一根K线）
+                df = StockDataLoader.get_stock_data(code, days=self.history_days)
+                result = self._latest_result(code, min_bars=60, df=df)
+                if result is None or result.empty:
+                    return None, df, None
                     
                 # 检查最新一天是否有买入信号
                 # 实盘注意：如果是收盘后跑，看最后一行。如果是盘中跑，最后一行的信号可能还在变动。
@@ -394,19 +536,25 @@ class TradeAssistant:
                 # 所以我们要找的是：最后一天出现了 Buy Signal。
                 
                 last_row = result.iloc[-1]
-                signal_col = 'buy_signal_strict' if self.strict_mode else 'buy_signal'
-                
-                if last_row[signal_col]:
-                    quality = last_row.get('signal_quality', 0) if self.strict_mode else 0
-                    candidates.append({
-                        'code': code,
-                        'name': stock['name'],
-                        'price': last_row['close'], # 参考价格
-                        'quality': quality,
-                        'date': result.index[-1]
-                    })
+                if not last_row[signal_col]:
+                    return None, df, result
+                quality = last_row.get('signal_quality', 0) if self.strict_mode else 0
+                return {
+                    'code': code,
+                    'name': names[code],
+                    'price': last_row['close'], # 参考价格
+                    'quality': quality,
+                    'date': result.index[-1]
+                }, df, result
             except Exception:
-                continue
+                return None, None, None
+        
+        candidates, stats = self.get_planner().scan(codes, evaluate, budget_seconds=self.scan_budget,
+                                                    max_count=max_scan)
+        if stats['skipped']:
+            print(f"跳过上次离信号较远的股票: {stats['skipped']} 只")
+        if stats['budget_exhausted']:
+            print(f"时间预算用完: 已扫描 {stats['scanned']}/{stats['planned']} 只 ({stats['elapsed']:.1f}秒)")
                 
         print("\n扫描完成。")
         
@@ -464,15 +612,15 @@ class TradeAssistant:
                 # buy sh.688000 50.5 100
                 code, price, shares = parts[1], float(parts[2]), int(parts[3])
                 # 这里名字暂时随便填，因为只是更新账本
-                self.portfolio.cash -= (shares * price * 1.0003) # 简单扣费
-                self.portfolio.positions[code] = {
+                self.portfolio.record('buy', code, cash=-(shares * price * 1.0003), date=today, price=price, # 简单扣费
+                                      shares=shares, position={
                     'name': code, # 简化
                     'buy_date': today,
                     'buy_price': price,
                     'shares': shares,
                     'cost_basis': shares * price * 1.0003,
                     'signal_quality': 0
-                }
+                })
                 print(f"已手动记录买入: {code}")
                 
             elif op == 'sell' and len(parts) >= 3:
@@ -481,12 +629,85 @@ class TradeAssistant:
                 if code in self.portfolio.positions:
                     pos = self.portfolio.positions[code]
                     income = pos['shares'] * price * (1 - 0.001) # 简单扣费
-                    self.portfolio.cash += income
-                    del self.portfolio.positions[code]
+                    self.portfolio.record('sell', code, cash=income, date=today, price=price, shares=pos['shares'],
+                                          position=None)
                     print(f"已手动记录卖出: {code}")
         
         self.portfolio.save_portfolio()
 
+class TradeDaemon:
+    """
+    常驻模式：按计划时间重复扫描，不再每次冷启动
+    
+    - 股票列表每天只查询一次
+    - K线存储保留在内存中，每轮只下载新的K线，不再读文件
+    - K线没有变化的股票直接复用上一轮的策略结果
+    - 持仓文件被其他进程（--action update）修改后自动重新加载
+    """
+    def __init__(self, assistant, board='chinext+star', max_scan=100, schedule=None):
+        self.assistant = assistant
+        self.board = board
+        self.max_scan = max_scan
+        self.schedule = sorted(self._parse_time(t) for t in (schedule or DEFAULT_SCHEDULE))
+        StockDataLoader.store.keep_in_memory = True
+
+    @staticmethod
+    def _parse_time(text):
+        hour, minute = text.split(':')
+        return dt_time(int(hour), int(minute))
+
+    def next_run_time(self, now):
+        """now 之后的下一个运行时间（只在工作日运行）"""
+        for offset in range(8):
+            day = (now + timedelta(days=offset)).date()
+            if day.weekday() >= 5:
+                continue
+            for run_time in self.schedule:
+                run_at = datetime.combine(day, run_time)
+                if run_at > now:
+                    return run_at
+        return None
+
+    def warm_up(self):
+        """启动时把股票列表和K线加载到内存（一次登录批量更新）"""
+        start = time.time()
+        codes = self.assistant.scan_plan(self.board, self.max_scan) + list(self.assistant.portfolio.positions)
+        StockDataLoader.store.prefetch(codes, days=self.assistant.history_days)
+        print(f"预热完成: {len(codes)} 只股票, 耗时 {time.time() - start:.1f}秒")
+
+    def run_once(self):
+        """运行一轮扫描"""
+        start = time.time()
+        if self.assistant.portfolio.reload_if_changed():
+            print("持仓文件已更新，已重新加载。")
+        
+        # 股票列表查询会登出 baostock，先于K线下载会话完成
+        self.assistant.get_stock_list(self.board, None)
+        store = StockDataLoader.store
+        store.login()
+        try:
+            self.assistant.analyze_market(board=self.board, max_scan=self.max_scan)
+        finally:
+            store.logout()
+        print(f"本轮耗时 {time.time() - start:.1f}秒")
+
+    def run_forever(self):
+        """预热后按计划时间循环运行，Ctrl+C 退出"""
+        print(f"常驻模式启动，运行时间: {', '.join(t.strftime('%H:%M') for t in self.schedule)}（工作日）")
+        self.warm_up()
+        while True:
+            run_at = self.next_run_time(datetime.now())
+            print(f"\n下次运行: {run_at.strftime('%Y-%m-%d %H:%M')}")
+            try:
+                while datetime.now() < run_at:
+                    time.sleep(min(60, max(0.0, (run_at - datetime.now()).total_seconds())))
+                self.run_once()
+            except KeyboardInterrupt:
+                print("\n常驻模式已停止。")
+                break
+            except Exception as e:
+                print(f"本轮运行失败: {e}")
+
 def load_config(config_file):
     """加载配置文件"""
     if os.path.exists(config_file):
@@ -504,9 +725,14 @@ def main():
     parser.add_argument('--max-stocks', type=int, help='最大持仓数量')
     parser.add_argument('--no-strict', action='store_true', help='关闭严格模式')
     parser.add_argument('--board', type=str, help='扫描板块')
-    parser.add_argument('--action', type=str, choices=['scan', 'update'], default='scan', 
-                       help='操作: scan=扫描信号, update=手动更新持仓')
-    parser.add_argument('--max-scan', type=int, help='扫描最大股票数量')
+    parser.add_argument('--action', type=str, choices=['scan', 'update', 'daemon'], default='scan', 
+                       help='操作: scan=扫描信号, update=手动更新持仓, daemon=常驻按计划时间扫描')
+    parser.add_argument('--schedule', type=str, nargs='+',
+                       help=f'常驻模式的运行时间 HH:MM，可多个（默认 {" ".join(DEFAULT_SCHEDULE)}）')
+    parser.add_argument('--max-scan', type=int, help='扫描最大股票数量（按优先级取前N只）')
+    parser.add_argument('--scan-budget', type=float, help='扫描时间预算（秒），用完即返回已找到的候选')
+    parser.add_argument('--ledger-db', type=str, help='成交同时写入 SQLite 交易数据库（如 trade_ledger.db，见 trade_db.py）')
+    parser.add_argument('--skip-far', type=int, help='严格模式下跳过上次扫描满足条件少于N个（共9个）的股票（默认0不跳过）')
     
     parser.add_argument('--telegram-token', type=str, help='Telegram Bot Token')
     parser.add_argument('--telegram-chat_id', type=str, help='Telegram Chat ID')
@@ -516,6 +742,16 @@ def main():
     parser.add_argument('--feishu-target-id', type=str, help='飞书消息接收者ID (邮箱/OpenID/ChatID)')
     parser.add_argument('--feishu-target-type', type=str, choices=['email', 'open_id', 'chat_id', 'user_id'], help='接收者ID类型')
     
+    # 🆕 持仓退出选项（同 backtest.py）
+    parser.add_argument('--stop-loss', type=float, help='固定止损比例 (默认0.10)')
+    parser.add_argument('--use-atr-stop', action='store_true', help='启用ATR动态止损（替代固定止损比例）')
+    parser.add_argument('--atr-multiplier', type=float, help='ATR止损倍数（默认2.0，即入场价-2*ATR）')
+    parser.add_argument('--use-drawdown-exit', action='store_true', help='启用回撤止盈（基于持仓期最高价）')
+    parser.add_argument('--drawdown-threshold', type=float, help='回撤止盈阈值（默认0.08即8%%回撤）')
+    parser.add_argument('--min-profit-for-drawdown', type=float, help='启用回撤止盈的最低盈利（默认5%%）')
+    parser.add_argument('--use-hold-rules', action='store_true',
+                        help='启用回测引擎的持有天数规则：止损前5天放宽到最多12%%、15天后收紧20%%，持有不足5天忽略卖出信号')
+    
     # 添加用于update的参数
     parser.add_argument('--cmd', type=str, nargs='+', help='更新命令 e.g. "buy sh.688001 50 200"')
     
@@ -531,6 +767,7 @@ def main():
     max_stocks = args.max_stocks if args.max_stocks is not None else trade_cfg.get('max_stocks', 5)
     board = args.board if args.board is not None else trade_cfg.get('board', 'chinext+star')
     max_scan = args.max_scan if args.max_scan is not None else trade_cfg.get('max_scan', 100)
+    schedule = args.schedule or trade_cfg.get('schedule', DEFAULT_SCHEDULE)
     
     # strict_mode 处理比较特殊，因为是 flag
     # 如果命令行没传 --no-strict，则看配置文件；如果配置文件也没写，默认 True
@@ -544,10 +781,24 @@ def main():
     feishu_target_id = args.feishu_target_id or feishu_cfg.get('target_id')
     feishu_target_type = args.feishu_target_type or feishu_cfg.get('target_type', 'email')
     
+    def option(name, default):
+        value = getattr(args, name)
+        return value if value is not None else trade_cfg.get(name, default)
+    
     assistant = TradeAssistant(
         budget=budget,
         max_stocks=max_stocks,
+        stop_loss=option('stop_loss', 0.10),
         strict_mode=strict_mode,
+        use_atr_stop=args.use_atr_stop or trade_cfg.get('use_atr_stop', False),
+        atr_multiplier=option('atr_multiplier', 2.0),
+        use_drawdown_exit=args.use_drawdown_exit or trade_cfg.get('use_drawdown_exit', False),
+        drawdown_threshold=option('drawdown_threshold', 0.08),
+        min_profit_for_drawdown=option('min_profit_for_drawdown', 0.05),
+        use_hold_rules=args.use_hold_rules or trade_cfg.get('use_hold_rules', False),
+        scan_budget=option('scan_budget', None),
+        skip_far=option('skip_far', 0),
+        ledger_db=option('ledger_db', None),
         telegram_token=args.telegram_token, # 这里还没加配置文件的telegram部分，暂时保留
         telegram_chat_id=args.telegram_chat_id,
         feishu_webhook=args.feishu_webhook,
@@ -562,6 +813,9 @@ def main():
         print("\n提示: 如果您根据建议进行了交易，请使用 --action update 更新持仓状态。")
         print("例如: python3 trade_assistant.py --action update --cmd \"buy sh.688052 185.6 200\"")
         
+    elif args.action == 'daemon':
+        TradeDaemon(assistant, board=board, max_scan=max_scan, schedule=schedule).run_forever()
+        
     elif args.action == 'update':
         if args.cmd:
             assistant.execute_commands(args.cmd)
@@ -0,0 +1,427 @@
+"""
+交易数据库（SQLite）
+把回测结果和实盘成交存入同一个本地数据库，跨次对比和成交分析直接用查询完成，不再逐个读取CSV。
+
+表：
+- runs:   每次回测（每个质量阈值一条），含收益率、回撤、夏普等汇总指标
+- params: 每次回测的参数（run_id, name, value），按参数值对比不同回测
+- trades: 回测交易记录
+- equity: 回测权益曲线
+- fills:  实盘成交（来自持仓日志，按 持仓文件 + 序号 去重）
+
+用法:
+    python trade_db.py runs --kind backtest              # 最近的回测
+    python trade_db.py compare --param stop_loss         # 按参数值汇总收益率/回撤/夏普
+    python trade_db.py trades --run 12 --by reason       # 交易按退出原因/股票/月份统计
+    python trade_db.py equity --run 12                   # 权益曲线
+    python trade_db.py fills --code sz.300750            # 实盘成交
+    python trade_db.py import-csv equity_q60_*.csv trades_q60_*.csv   # 导入已有的CSV
+    python trade_db.py import-portfolio portfolio.json   # 导入实盘持仓日志
+    python trade_db.py sql "SELECT kind, COUNT(*) FROM runs GROUP BY kind"
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from portfolio_journal import PortfolioJournal
+
+DEFAULT_DB = 'trade_ledger.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    label TEXT,
+    threshold REAL,
+    created_at TEXT,
+    start_date TEXT,
+    end_date TEXT,
+    total_return REAL,
+    max_drawdown REAL,
+    sharpe REAL,
+    trade_count INTEGER,
+    final_equity REAL,
+    metrics TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_runs_kind ON runs(kind, created_at);
+
+CREATE TABLE IF NOT EXISTS params (
+    run_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (run_id, name)
+);
+CREATE INDEX IF NOT EXISTS idx_params_name ON params(name, value);
+
+CREATE TABLE IF NOT EXISTS trades (
+    run_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    date TEXT,
+    code TEXT,
+    name TEXT,
+    action TEXT,
+    price REAL,
+    shares INTEGER,
+    amount REAL,
+    fee REAL,
+    profit REAL,
+    profit_pct REAL,
+    quality REAL,
+    reason TEXT,
+    hold_days INTEGER,
+    PRIMARY KEY (run_id, seq)
+);
+CREATE INDEX IF NOT EXISTS idx_trades_code ON trades(code, date);
+CREATE INDEX IF NOT EXISTS idx_trades_action ON trades(run_id, action);
+
+CREATE TABLE IF NOT EXISTS equity (
+    run_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    date TEXT,
+    equity REAL,
+    cash REAL,
+    market_value REAL,
+    position_count INTEGER,
+    PRIMARY KEY (run_id, seq)
+);
+CREATE INDEX IF NOT EXISTS idx_equity_date ON equity(run_id, date);
+
+CREATE TABLE IF NOT EXISTS fills (
+    portfolio TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    time TEXT,
+    date TEXT,
+    code TEXT,
+    name TEXT,
+    action TEXT,
+    price REAL,
+    shares INTEGER,
+    cash REAL,
+    details TEXT,
+    PRIMARY KEY (portfolio, seq)
+);
+CREATE INDEX IF NOT EXISTS idx_fills_code ON fills(code, date);
+"""
+
+TRADE_COLUMNS = ['date', 'code', 'name', 'action', 'price', 'shares', 'amount', 'fee', 'profit',
+                 'profit_pct', 'quality', 'reason', 'hold_days']
+EQUITY_COLUMNS = ['date', 'equity', 'cash', 'market_value', 'position_count']
+
+
+def _to_builtin(value):
+    """numpy 标量、NaN 转为 Python 内置类型，便于写入数据库和JSON"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.strftime('%Y-%m-%d')
+    return value
+
+
+def _rows(records, columns):
+    return [tuple(_to_builtin(r.get(c)) for c in columns) for r in records]
+
+
+class TradeDB:
+    """回测结果与实盘成交数据库"""
+
+    def __init__(self, db_path=DEFAULT_DB):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    # ------------------------------------------------------------------ 写入
+
+    def record_run(self, kind, params, metrics=None, equity_curve=None, trades=None, threshold=None, label=None):
+        """
+        保存一次回测（一个事务内批量写入参数、交易记录和权益曲线）
+
+        Args:
+            kind: 回测类型，如 'backtest' / 'walk_forward'
+            params: 参数字典
+            metrics: 汇总指标（metrics.equity_metrics 或 optimizer.summarize_run 的结果）
+            equity_curve: [{'date', 'equity', 'cash', 'market_value', 'position_count'}]
+            trades: 交易记录列表（回测引擎的 trades）
+
+        Returns:
+            run_id
+        """
+        metrics = metrics or {}
+        equity_curve = equity_curve or []
+        trades = trades or []
+        with self.conn:
+            cur = self.conn.execute(
+                """INSERT INTO runs (kind, label, threshold, created_at, start_date, end_date, total_return,
+                                     max_drawdown, sharpe, trade_count, final_equity, metrics)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    kind, label, _to_builtin(threshold), datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    equity_curve[0]['date'] if equity_curve else None,
+                    equity_curve[-1]['date'] if equity_curve else None,
+                    _to_builtin(metrics.get('total_return')),
+                    _to_builtin(metrics.get('max_drawdown')),
+                    _to_builtin(metrics.get('sharpe')),
+                    len(trades),
+                    _to_builtin(metrics.get('final_equity')),
+                    json.dumps(metrics, default=_to_builtin, ensure_ascii=False),
+                )
+            )
+            run_id = cur.lastrowid
+            self.conn.executemany(
+                "INSERT INTO params (run_id, name, value) VALUES (?, ?, ?)",
+                [(run_id, name, json.dumps(value, default=_to_builtin)) for name, value in sorted(params.items())]
+            )
+            self.conn.executemany(
+                f"INSERT INTO trades (run_id, seq, {', '.join(TRADE_COLUMNS)}) "
+                f"VALUES (?, ?, {', '.join('?' * len(TRADE_COLUMNS))})",
+                [(run_id, i) + row for i, row in enumerate(_rows(trades, TRADE_COLUMNS))]
+            )
+            self.conn.executemany(
+                f"INSERT INTO equity (run_id, seq, {', '.join(EQUITY_COLUMNS)}) "
+                f"VALUES (?, ?, {', '.join('?' * len(EQUITY_COLUMNS))})",
+                [(run_id, i) + row for i, row in enumerate(_rows(equity_curve, EQUITY_COLUMNS))]
+            )
+        return run_id
+
+    def record_fills(self, portfolio, records):
+        """
+        保存实盘成交（持仓日志中的买入/卖出记录，已存在的序号跳过）
+
+        Returns:
+            新写入的条数
+        """
+        rows = []
+        for r in records:
+            if r.get('type') not in ('buy', 'sell'):
+                continue
+            position = r.get('position') or {}
+            history = r.get('history') or {}
+            rows.append((
+                portfolio, r['seq'], r.get('time'), r.get('date', history.get('date')), r.get('code'),
+                position.get('name', r.get('name')), r['type'].upper(), r.get('price', position.get('buy_price')),
+                r.get('shares', position.get('shares')), r.get('cash'), history.get('details'),
+            ))
+        with self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                """INSERT OR IGNORE INTO fills (portfolio, seq, time, date, code, name, action, price, shares,
+                                                cash, details)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows
+            )
+            return self.conn.total_changes - before
+
+    def import_portfolio(self, portfolio_file):
+        """导入持仓日志（历史文件 + 当前日志）中的全部成交"""
+        records = PortfolioJournal(portfolio_file).records()  # 只读，实盘助手可能正在写入
+        return self.record_fills(os.path.abspath(portfolio_file), records)
+
+    def import_csv(self, equity_file, trades_file=None, kind='backtest', label=None, initial_capital=None):
+        """
+        导入 backtest.py 保存的 equity_q*_*.csv / trades_q*_*.csv
+
+        质量阈值从文件名中读取；指标按权益曲线重新计算。
+        """
+        from metrics import equity_metrics
+
+        equity_df = pd.read_csv(equity_file)
+        equity_curve = equity_df.to_dict('records')
+        trades = pd.read_csv(trades_file).to_dict('records') if trades_file else []
+        if initial_capital is None:
+            first = equity_curve[0] if equity_curve else {}
+            initial_capital = first.get('equity', 0)
+        metrics = equity_metrics(equity_df['equity'].to_numpy(dtype=float), initial_capital,
+                                 position_count=equity_df['position_count'].to_numpy(dtype=float)
+                                 if 'position_count' in equity_df else None)
+        match = re.search(r'equity_q(-?[\d.]+)_', os.path.basename(equity_file))
+        threshold = float(match.group(1)) if match else None
+        return self.record_run(kind, {'source': os.path.basename(equity_file)}, metrics, equity_curve, trades,
+                               threshold=threshold, label=label or os.path.basename(equity_file))
+
+    # ------------------------------------------------------------------ 查询
+
+    def query(self, sql, params=()):
+        return pd.read_sql_query(sql, self.conn, params=params)
+
+    def runs(self, kind=None, limit=20, **param_filters):
+        """最近的回测；param_filters 按参数值筛选，如 stop_loss=0.1"""
+        sql = ("SELECT run_id, kind, label, threshold, created_at, start_date, end_date, total_return, "
+               "max_drawdown, sharpe, trade_count FROM runs WHERE 1=1")
+        args = []
+        if kind:
+            sql += " AND kind = ?"
+            args.append(kind)
+        for name, value in param_filters.items():
+            sql += " AND run_id IN (SELECT run_id FROM params WHERE name = ? AND value = ?)"
+            args += [name, json.dumps(value)]
+        sql += " ORDER BY run_id DESC LIMIT ?"
+        args.append(limit)
+        return self.query(sql, args)
+
+    def params(self, run_id):
+        """某次回测的参数"""
+        rows = self.conn.execute("SELECT name, value FROM params WHERE run_id = ? ORDER BY name", (run_id,))
+        return {name: json.loads(value) for name, value in rows}
+
+    def compare(self, param, kind=None):
+        """按某个参数的取值汇总回测表现"""
+        sql = """SELECT p.value AS value, COUNT(*) AS runs, AVG(r.total_return) AS avg_return,
+                        MAX(r.total_return) AS best_return, AVG(r.max_drawdown) AS avg_max_dd,
+                        AVG(r.sharpe) AS avg_sharpe, SUM(r.trade_count) AS trades
+                 FROM runs r JOIN params p ON p.run_id = r.run_id AND p.name = ?"""
+        args = [param]
+        if kind:
+            sql += " WHERE r.kind = ?"
+            args.append(kind)
+        sql += " GROUP BY p.value ORDER BY avg_return DESC"
+        return self.query(sql, args)
+
+    def trade_stats(self, run_id=None, by='reason'):
+        """
+        卖出交易统计：笔数、胜率、平均收益率、总盈亏
+
+        Args:
+            by: 'reason'（退出原因）/ 'code'（股票）/ 'month'（月份）
+        """
+        group = {'reason': 'reason', 'code': 'code', 'month': 'substr(date, 1, 7)'}[by]
+        sql = f"""SELECT {group} AS {by}, COUNT(*) AS trades,
+                         100.0 * SUM(profit > 0) / COUNT(*) AS win_rate,
+                         AVG(profit_pct) AS avg_profit_pct, SUM(profit) AS total_profit
+                  FROM trades WHERE action = 'SELL'"""
+        args = []
+        if run_id is not None:
+            sql += " AND run_id = ?"
+            args.append(run_id)
+        sql += f" GROUP BY {group} ORDER BY total_profit DESC"
+        return self.query(sql, args)
+
+    def equity(self, run_id):
+        return self.query("SELECT date, equity, cash, market_value, position_count FROM equity "
+                          "WHERE run_id = ? ORDER BY seq", (run_id,))
+
+    def fills(self, code=None):
+        sql = "SELECT time, date, code, name, action, price, shares, cash, details FROM fills"
+        args = []
+        if code:
+            sql += " WHERE code = ?"
+            args.append(code)
+        return self.query(sql + " ORDER BY time, seq", args)
+
+
+def record_backtest_results(db_path, kind, config, results, final_states, label=None):
+    """
+    把 backtest.run_backtest / extend_backtest 的各阈值结果写入数据库
+
+    Args:
+        config: 回测参数（不含质量阈值列表）
+        results: run_backtest 返回的结果列表
+        final_states: {阈值: 引擎终态}（含 equity_curve、trades）
+
+    Returns:
+        run_id 列表
+    """
+    db = TradeDB(db_path)
+    try:
+        run_ids = []
+        params = {k: v for k, v in config.items() if k != 'quality_thresholds'}
+        for res in results:
+            q = res['threshold']
+            state = final_states.get(q, {})
+            run_ids.append(db.record_run(kind, dict(params, min_quality=q), res['metrics'],
+                                         state.get('equity_curve'), state.get('trades'),
+                                         threshold=q, label=label))
+        print(f"已写入数据库 {db_path}: run_id {run_ids}")
+        return run_ids
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='交易数据库查询')
+    parser.add_argument('--db', type=str, default=DEFAULT_DB, help=f'数据库文件 (默认 {DEFAULT_DB})')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('runs', help='最近的回测')
+    p.add_argument('--kind', type=str, help='回测类型 (backtest / backtest_extend / walk_forward / csv)')
+    p.add_argument('--limit', type=int, default=20)
+    p.add_argument('--param', type=str, nargs='*', default=[], help='按参数筛选 name=value，如 stop_loss=0.1')
+
+    p = sub.add_parser('compare', help='按参数取值汇总回测表现')
+    p.add_argument('--param', type=str, required=True)
+    p.add_argument('--kind', type=str)
+
+    p = sub.add_parser('trades', help='卖出交易统计')
+    p.add_argument('--run', type=int, help='run_id（默认全部回测）')
+    p.add_argument('--by', type=str, default='reason', choices=['reason', 'code', 'month'])
+
+    p = sub.add_parser('equity', help='权益曲线')
+    p.add_argument('--run', type=int, required=True)
+
+    p = sub.add_parser('params', help='回测参数')
+    p.add_argument('--run', type=int, required=True)
+
+    p = sub.add_parser('fills', help='实盘成交')
+    p.add_argument('--code', type=str)
+
+    p = sub.add_parser('import-csv', help='导入 equity_q*_*.csv（可附带同名的 trades_q*_*.csv）')
+    p.add_argument('files', nargs='+')
+    p.add_argument('--capital', type=float, help='初始资金（默认取权益曲线第一天）')
+
+    p = sub.add_parser('import-portfolio', help='导入实盘持仓日志中的成交')
+    p.add_argument('portfolio', nargs='?', default='portfolio.json')
+
+    p = sub.add_parser('sql', help='执行任意查询')
+    p.add_argument('statement', type=str)
+
+    args = parser.parse_args()
+    db = TradeDB(args.db)
+    pd.set_option('display.width', 200)
+    pd.set_option('display.max_columns', 20)
+    try:
+        if args.command == 'runs':
+            filters = {}
+            for item in args.param:
+                name, value = item.split('=', 1)
+                try:
+                    filters[name] = json.loads(value)
+                except json.JSONDecodeError:
+                    filters[name] = value
+            print(db.runs(kind=args.kind, limit=args.limit, **filters).to_string(index=False))
+        elif args.command == 'compare':
+            print(db.compare(args.param, kind=args.kind).to_string(index=False))
+        elif args.command == 'trades':
+            print(db.trade_stats(args.run, by=args.by).to_string(index=False))
+        elif args.command == 'equity':
+            print(db.equity(args.run).to_string(index=False))
+        elif args.command == 'params':
+            for name, value in db.params(args.run).items():
+                print(f"{name}: {value}")
+        elif args.command == 'fills':
+            print(db.fills(args.code).to_string(index=False))
+        elif args.command == 'import-csv':
+            equity_files = [f for f in args.files if os.path.basename(f).startswith(('equity_', 'walk_forward_equity_'))]
+            for equity_file in equity_files:
+                trades_file = equity_file.replace('equity_', 'trades_')
+                trades_file = trades_file if os.path.exists(trades_file) else None
+                run_id = db.import_csv(equity_file, trades_file, kind='csv', initial_capital=args.capital)
+                print(f"已导入 {equity_file}{' + ' + trades_file if trades_file else ''} -> run_id {run_id}")
+        elif args.command == 'import-portfolio':
+            print(f"新导入 {db.import_portfolio(args.portfolio)} 笔成交")
+        elif args.command == 'sql':
+            print(db.query(args.statement).to_string(index=False))
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
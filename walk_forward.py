@@ -0,0 +1,274 @@
+"""
+滚动前推（Walk-Forward）优化
+在滚动的样本内窗口上搜索参数，用选出的参数交易紧随其后的样本外窗口，
+并把各样本外窗口的权益曲线拼接成一条连续曲线，用于评估参数的样本外表现。
+
+- 每组策略参数的信号只在全历史上计算一次，所有（相互重叠的）窗口共享
+- 窗口只是对按日行情的日期列表切片，不复制行情数据
+- 各窗口的样本内搜索并行执行
+- 样本外窗口首尾相接；每个窗口用全新引擎交易，窗口最后一天按收盘价卖出全部持仓（计手续费和滑点），
+  下一窗口以平仓后的现金开始。窗口边界的强制平仓不受止损/卖出信号等离场规则约束，
+  交易记录的 reason 为"窗口结束平仓"
+"""
+import argparse
+import contextlib
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from backtest import PortfolioBacktester
+from optimizer import (split_params, get_market_data, summarize_run, score_run, grid_points,
+                       random_points, load_search_space, load_stock_data, _init_worker, SCORE_METRICS)
+from trade_db import TradeDB
+
+
+def make_windows(n_dates, is_days=120, oos_days=40):
+    """
+    生成滚动窗口（日期下标）
+
+    窗口按样本外窗口长度滚动，样本外区间首尾相接：既不重叠（拼接的权益曲线重复计算同一天），
+    也没有空档（漏掉交易日）。
+
+    Returns:
+        [(is_start, is_end, oos_end), ...]，样本内为 [is_start, is_end)，样本外为 [is_end, oos_end)
+    """
+    windows = []
+    is_start = 0
+    while is_start + is_days < n_dates:
+        is_end = is_start + is_days
+        oos_end = min(is_end + oos_days, n_dates)
+        windows.append((is_start, is_end, oos_end))
+        is_start += oos_days
+    return windows
+
+
+def run_window(params, start_idx, end_idx, initial_capital=100000, liquidate=False):
+    """
+    用一组参数在日期区间 [start_idx, end_idx) 上跑一次全新的组合回测
+
+    Args:
+        liquidate: 区间最后一天卖出全部持仓（样本外窗口），权益曲线最后一天为平仓后的现金
+
+    Returns:
+        (equity_curve, trades)
+    """
+    strategy_kwargs, engine_kwargs, run_kwargs = split_params(params)
+    market_data, sorted_dates = get_market_data(strategy_kwargs)
+
+    engine = PortfolioBacktester(
+        initial_capital=initial_capital,
+        strict_mode=strategy_kwargs['strict_mode'],
+        **engine_kwargs
+    )
+    dates = sorted_dates[start_idx:end_idx]
+    with contextlib.redirect_stdout(io.StringIO()):
+        equity_curve, trades = engine.run_on_market_data(
+            market_data, dates, min_quality=run_kwargs.get('min_quality', 60)
+        )
+        if liquidate and dates:
+            engine.close_all_positions(dates[-1], reason="窗口结束平仓")
+    return equity_curve, trades
+
+
+def _in_sample_task(window_id, point_id, params, start_idx, end_idx, initial_capital):
+    equity_curve, trades = run_window(params, start_idx, end_idx, initial_capital)
+    metrics, _ = summarize_run(equity_curve, trades, initial_capital)
+    return window_id, point_id, metrics
+
+
+def run_walk_forward(stock_data, points, is_days=120, oos_days=40,
+                     initial_capital=100000, workers=1, metric='total_return'):
+    """
+    执行滚动前推优化
+
+    Returns:
+        (window_results, oos_equity, oos_trades)
+            window_results: 每个窗口的最优参数及样本内/样本外表现
+            oos_equity: 拼接后的样本外权益曲线
+            oos_trades: 全部样本外交易记录
+    """
+    all_dates = set()
+    for item in stock_data.values():
+        all_dates.update(item['df'].index)
+    sorted_dates = sorted(all_dates)
+    windows = make_windows(len(sorted_dates), is_days, oos_days)
+    if not windows:
+        print(f"交易日不足 ({len(sorted_dates)} 天)，无法划分样本内 {is_days} 天 + 样本外窗口")
+        return [], [], []
+
+    print(f"交易日: {len(sorted_dates)} | 窗口数: {len(windows)} | 样本内 {is_days} 天, 样本外 {oos_days} 天")
+    print(f"每个窗口评估 {len(points)} 组参数, 共 {len(windows) * len(points)} 次样本内回测")
+
+    # 1. 样本内搜索（所有窗口 × 参数点 并行）
+    tasks = [(w, p, points[p], is_start, is_end, initial_capital)
+             for w, (is_start, is_end, _) in enumerate(windows)
+             for p in range(len(points))]
+    scores = {}  # window_id -> [(score, point_id, metrics)]
+
+    _init_worker(stock_data)
+    if workers <= 1:
+        for i, task in enumerate(tasks):
+            window_id, point_id, metrics = _in_sample_task(*task)
+            scores.setdefault(window_id, []).append((score_run(metrics, metric), point_id, metrics))
+            print(f"\r样本内搜索: {i+1}/{len(tasks)}", end='', flush=True)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(stock_data,)) as executor:
+            futures = [executor.submit(_in_sample_task, *task) for task in tasks]
+            for i, future in enumerate(as_completed(futures)):
+                try:
+                    window_id, point_id, metrics = future.result()
+                except Exception as e:
+                    print(f"\n评估失败: {e}")
+                    continue
+                scores.setdefault(window_id, []).append((score_run(metrics, metric), point_id, metrics))
+                print(f"\r样本内搜索: {i+1}/{len(tasks)}", end='', flush=True)
+    print()
+
+    # 2. 样本外交易（按时间顺序，期末平仓，资金从上一窗口平仓后的现金接续）
+    window_results = []
+    oos_equity = []
+    oos_trades = []
+    capital = initial_capital
+
+    for w, (is_start, is_end, oos_end) in enumerate(windows):
+        if w not in scores:
+            continue
+        best_score, best_point, is_metrics = max(scores[w], key=lambda x: (x[0], -x[1]))
+        params = points[best_point]
+
+        equity_curve, trades = run_window(params, is_end, oos_end, capital, liquidate=True)
+        oos_metrics, _ = summarize_run(equity_curve, trades, capital)
+        for row in equity_curve:
+            oos_equity.append(dict(row, window=w))
+        for trade in trades:
+            oos_trades.append(dict(trade, window=w))
+        if equity_curve:
+            capital = equity_curve[-1]['equity']
+
+        window_results.append({
+            'window': w,
+            'is_start': sorted_dates[is_start].strftime('%Y-%m-%d'),
+            'is_end': sorted_dates[is_end - 1].strftime('%Y-%m-%d'),
+            'oos_start': sorted_dates[is_end].strftime('%Y-%m-%d'),
+            'oos_end': sorted_dates[oos_end - 1].strftime('%Y-%m-%d'),
+            'params': params,
+            'is_return': is_metrics['total_return'],
+            'is_max_dd': is_metrics['max_drawdown'],
+            'oos_return': oos_metrics['total_return'],
+            'oos_max_dd': oos_metrics['max_drawdown'],
+            'oos_trades': oos_metrics['trade_count'],
+        })
+
+    return window_results, oos_equity, oos_trades
+
+
+def print_walk_forward_report(window_results, oos_equity, initial_capital):
+    """打印各窗口结果和拼接后的样本外表现"""
+    print("\n" + "=" * 120)
+    print("滚动前推结果")
+    print("=" * 120)
+    print(f"{'窗口':<6} | {'样本内':<23} | {'样本外':<23} | {'样本内收益':<10} | {'样本外收益':<10} | {'样本外回撤':<10} | 参数")
+    print("-" * 120)
+    for res in window_results:
+        params_str = ', '.join(f"{k}={v}" for k, v in sorted(res['params'].items()))
+        print(f"{res['window']:<6} | {res['is_start']}~{res['is_end']} | {res['oos_start']}~{res['oos_end']} | "
+              f"{res['is_return']:<9.2f}% | {res['oos_return']:<9.2f}% | {res['oos_max_dd']:<9.2f}% | {params_str}")
+    print("=" * 120)
+
+    if not oos_equity:
+        print("无样本外权益数据。")
+        return
+
+    equity = np.array([x['equity'] for x in oos_equity], dtype=float)
+    running_max = np.maximum.accumulate(equity)
+    max_dd = ((equity - running_max) / running_max * 100).min()
+    total_return = (equity[-1] - initial_capital) / initial_capital * 100
+    is_avg = np.mean([r['is_return'] for r in window_results])
+    oos_avg = np.mean([r['oos_return'] for r in window_results])
+
+    print(f"拼接样本外收益率: {total_return:.2f}% | 最大回撤: {max_dd:.2f}% | 期末权益: {equity[-1]:,.0f}")
+    print(f"窗口平均收益: 样本内 {is_avg:.2f}%, 样本外 {oos_avg:.2f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='QQE策略滚动前推优化')
+    parser.add_argument('--space', type=str, help='搜索空间JSON文件（格式同 optimizer.py）')
+    parser.add_argument('--method', type=str, default='grid', choices=['grid', 'random'], help='样本内搜索方式')
+    parser.add_argument('--samples', type=int, default=30, help='随机搜索的采样数量')
+    parser.add_argument('--seed', type=int, default=42, help='随机搜索种子')
+    parser.add_argument('--is-days', type=int, default=120, help='样本内窗口（交易日）')
+    parser.add_argument('--oos-days', type=int, default=40, help='样本外窗口（交易日）')
+    parser.add_argument('--metric', type=str, default='total_return', choices=SCORE_METRICS,
+                        help='样本内选参指标')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='并行进程数')
+    parser.add_argument('--board', type=str, default='chinext+star', help='板块筛选')
+    parser.add_argument('--max-stocks', type=int, default=100, help='股票池大小')
+    parser.add_argument('--history-days', type=int, default=500, help='历史数据天数')
+    parser.add_argument('--budget', type=float, default=100000, help='初始资金')
+    parser.add_argument('--db', type=str, help='把样本外结果写入 SQLite 数据库（如 trade_ledger.db，见 trade_db.py）')
+
+    args = parser.parse_args()
+
+    space = load_search_space(args.space)
+    if args.method == 'grid':
+        points = list(grid_points(space))
+    else:
+        points = random_points(space, args.samples, seed=args.seed)
+
+    print("=" * 100)
+    print("QQE策略滚动前推优化")
+    print("=" * 100)
+    print(f"搜索空间: {space}")
+    print(f"参数点: {len(points)} | 样本内 {args.is_days} 天 | 样本外 {args.oos_days} 天 | 并行进程: {args.workers}")
+    print("=" * 100)
+
+    print("\n[1/3] 加载市场数据...")
+    stock_data = load_stock_data(args.board, args.max_stocks, args.history_days)
+    if not stock_data:
+        print("没有可用的股票数据。")
+        return
+
+    print("\n[2/3] 滚动优化...")
+    start = time.time()
+    window_results, oos_equity, oos_trades = run_walk_forward(
+        stock_data, points, is_days=args.is_days, oos_days=args.oos_days,
+        initial_capital=args.budget, workers=args.workers, metric=args.metric
+    )
+    print(f"耗时: {time.time() - start:.1f}秒")
+
+    print("\n[3/3] 汇总结果...")
+    print_walk_forward_report(window_results, oos_equity, args.budget)
+
+    if oos_equity:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        equity_file = f"walk_forward_equity_{timestamp}.csv"
+        pd.DataFrame(oos_equity).to_csv(equity_file, index=False)
+        windows_file = f"walk_forward_windows_{timestamp}.csv"
+        pd.DataFrame(window_results).to_csv(windows_file, index=False, encoding='utf-8-sig')
+        saved = f"{equity_file}, {windows_file}"
+        if oos_trades:
+            trades_file = f"walk_forward_trades_{timestamp}.csv"
+            pd.DataFrame(oos_trades).to_csv(trades_file, index=False, encoding='utf-8-sig')
+            saved += f", {trades_file}"
+        print(f"已保存: {saved}")
+
+    if args.db:
+        metrics, _ = summarize_run(oos_equity, oos_trades, args.budget)
+        db = TradeDB(args.db)
+        try:
+            params = {k: v for k, v in vars(args).items() if k not in ('db', 'workers')}
+            params['space'] = space
+            run_id = db.record_run('walk_forward', params, metrics, oos_equity, oos_trades)
+        finally:
+            db.close()
+        print(f"已写入数据库 {args.db}: run_id {run_id}")
+
+
+if __name__ == '__main__':
+    main()